@@ -1,4 +1,7 @@
-import tensorflow as tf
+# Standalone sanity check of the trained VGG16 weights (not a test suite):
+# rebuilds the architecture, loads models/best_VGG16_stage2.weights.h5 and
+# classifies one sample image. Run from the repository root:
+#     python check_vgg16_baseline.py
 import numpy as np
 from PIL import Image
 from tensorflow import keras
@@ -41,10 +44,6 @@ print("Model output shape:", model.output_shape)
 # Print the full layer-by-layer summary
 print(model.summary())
 
-
-
-
-
 RICE_CLASSES = [
     "10_Lal_Aush","11_Jirashail","12_Gutisharna","13_Red_Cargo","14_Najirshail",
     "15_Katari_Polao","16_Lal_Biroi","17_Chinigura_Polao","18_Amondhan","19_Shorna5",
@@ -59,8 +58,6 @@ RICE_CLASSES = [
     "62_BRRI102","6_BR28","7_BR29","8_Paijam","9_Bashful"
 ]
 
-
-
 # Preprocess image
 image = Image.open('SubolLota_1_019.jpg').convert('RGB').resize((224, 224))
 image_array = np.array(image, dtype=np.float32) / 255.0
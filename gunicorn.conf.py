@@ -0,0 +1,38 @@
+import os
+import sys
+
+# The config file is read before --chdir applies; make the project importable from it
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from prediction.runtime import web_workers  # noqa: E402
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# Each worker holds its own Keras models (see PREDICTION_MODEL_MEMORY_BUDGET_MB). The
+# workers size their thread pools from the same count, so both read web_workers().
+workers = web_workers()
+# ASGI workers: one event loop per worker holds many slow uploads open while
+# the micro-batcher threads run inference
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+timeout = 300
+pidfile = os.environ.get("GUNICORN_PIDFILE", "/tmp/rice-prediction-gunicorn.pid")
+
+# Import Django (and the models below) once in the master; workers are forked
+# afterwards and share those pages instead of each loading its own copy.
+preload_app = True
+
+
+def when_ready(server):
+    from prediction.inference import preload_models
+
+    preload_models()
+    server.log.info("Preloaded prediction models before forking workers")
+
+
+def post_worker_init(worker):
+    # TensorFlow cannot be preloaded across the fork, so each worker traces and
+    # warms its graphs in the background; /ready answers 503 until that is done.
+    # The watcher hot-swaps models whose RiceModel row another process changed.
+    from prediction.inference import model_watcher, warm_up
+
+    warm_up.start()
+    model_watcher.start()
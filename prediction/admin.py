@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import RiceInfo, RiceModel
+from .models import RiceInfo, RiceModel, PredictionJob
 
 @admin.register(RiceInfo)
 class RiceInfoAdmin(admin.ModelAdmin):
@@ -14,3 +14,10 @@ class RiceModelAdmin(admin.ModelAdmin):
     search_fields = ['name']
     list_filter = ['is_active', 'created_at']
     ordering = ['-created_at']
+
+@admin.register(PredictionJob)
+class PredictionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'model_type', 'status', 'processed', 'total', 'worker', 'created_at', 'finished_at']
+    list_filter = ['status', 'model_type', 'created_at']
+    readonly_fields = ['results', 'summary', 'error', 'worker', 'started_at', 'finished_at']
+    ordering = ['-created_at']
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class PredictionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'prediction'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .runtime import limit_blas_threads
+
+        limit_blas_threads()
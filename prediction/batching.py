@@ -0,0 +1,173 @@
+import threading
+import time
+import queue
+from concurrent.futures import Future, InvalidStateError
+
+import numpy as np
+
+from .metrics import BATCH_SECONDS, BATCH_SIZE
+
+
+class BatchStats:
+    """Running batch-size and queue-wait counters for one batcher."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch_size = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def record(self, batch_size, wait_ms):
+        with self._lock:
+            self.batches += 1
+            self.items += batch_size
+            self.max_batch_size = max(self.max_batch_size, batch_size)
+            self.total_wait_ms += sum(wait_ms)
+            self.max_wait_ms = max(self.max_wait_ms, max(wait_ms))
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "mean_queue_wait_ms": self.total_wait_ms / self.items if self.items else 0.0,
+                "max_queue_wait_ms": self.max_wait_ms,
+            }
+
+
+class AdmissionLimit:
+    """Counts requests admitted to the models and refuses new ones past ``limit``.
+
+    Keeps the queues short enough that an admitted request finishes in
+    reasonable time; the rest are told to come back (HTTP 503) instead of
+    piling up behind them.
+    """
+
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                return False
+            self.pending += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.pending -= 1
+
+
+class MicroBatcher:
+    """Collects single-sample requests for one model and runs them as one batch.
+
+    ``run_batch`` receives an array stacked along axis 0 and must return
+    something indexable per row (an array, or a dict of arrays). Requests
+    arriving within ``window_ms`` of the first queued one, up to
+    ``max_batch_size``, share a forward pass.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=16, window_ms=10):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.stats = BatchStats()
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name=f"batcher-{self.name}", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, sample):
+        """Queue one sample and return a Future resolving to ``(row, info)``."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((sample, future, time.perf_counter()))
+        return future
+
+    def queue_depth(self):
+        """Samples waiting for the next batch (approximate, as Queue.qsize is)."""
+        return self._queue.qsize()
+
+    def __call__(self, sample):
+        """Blocking helper: submit ``sample`` and wait for its row."""
+        return self.submit(sample).result()
+
+    def _collect(self):
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _loop(self):
+        while True:
+            # Running futures can no longer be cancelled; drop the ones already
+            # cancelled (e.g. the client of an async view disconnected)
+            items = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not items:
+                continue
+            try:
+                self._run(items)
+            except Exception as e:  # the loop must outlive any one batch
+                print(f"[ERROR] Batcher {self.name} failed a batch: {e}")
+                for _, future, _ in items:
+                    _resolve(future, exception=e)
+
+    def _run(self, items):
+        started = time.perf_counter()
+        waits = [(started - queued) * 1000.0 for _, _, queued in items]
+        try:
+            outputs = self.run_batch(np.stack([sample for sample, _, _ in items]))
+        except Exception as e:
+            for _, future, _ in items:
+                _resolve(future, exception=e)
+            return
+        forward = time.perf_counter() - started
+        self.stats.record(len(items), waits)
+        BATCH_SECONDS.observe(forward, model=self.name)
+        BATCH_SIZE.observe(len(items), model=self.name)
+        for i, (_, future, _) in enumerate(items):
+            info = {"batch_size": len(items), "queue_wait_ms": round(waits[i], 3),
+                    "forward_ms": round(forward * 1000.0, 3)}
+            _resolve(future, result=(_take_row(outputs, i), info))
+
+
+def _resolve(future, result=None, exception=None):
+    """Set a future's outcome unless it already has one."""
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def _take_row(outputs, i):
+    if isinstance(outputs, dict):
+        return {key: value[i] for key, value in outputs.items()}
+    return outputs[i]
@@ -0,0 +1,142 @@
+"""Prediction result cache keyed on image content and model version.
+
+Two tiers: a per-process LRU with TTL, and optionally a Django cache alias
+shared by every worker (``PREDICTION_CACHE_SHARED_ALIAS``). The model
+version is part of the key, so saving a RiceModel row (new weights,
+toggled ``is_active``) makes old entries unreachable; they age out by TTL
+and LRU size.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .loaders import MODEL_NAMES, MODEL_TYPE_REQUIREMENTS
+
+CACHE_MAX_ENTRIES = getattr(settings, "PREDICTION_CACHE_MAX_ENTRIES", 4096)
+CACHE_TTL = getattr(settings, "PREDICTION_CACHE_TTL", 24 * 3600)
+CACHE_SHARED_ALIAS = getattr(settings, "PREDICTION_CACHE_SHARED_ALIAS", None)
+# How long a worker trusts its model-version token before re-reading RiceModel
+VERSION_TTL = getattr(settings, "PREDICTION_MODEL_VERSION_TTL", 5)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class PredictionCache:
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL, shared_alias=CACHE_SHARED_ALIAS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._local.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > now:
+                    self._local.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._local[key]
+        value = self.shared.get(key) if self.shared is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._set_local(key, value)
+        return value
+
+    def set(self, key, value):
+        self._set_local(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._local), "hits": self.hits, "misses": self.misses,
+                    "shared_alias": self.shared_alias}
+
+
+prediction_cache = PredictionCache()
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def row_version(row):
+    """Short token identifying a RiceModel row and the files it points at."""
+    part = ""
+    if row is not None:
+        part = (f"{row.pk}:{row.updated_at.timestamp()}:{row.model_file.name}:{row.tflite_file.name or ''}"
+                f":{row.torchscript_file.name or ''}")
+    return hashlib.sha1(part.encode()).hexdigest()[:16]
+
+
+def kind_version(kind):
+    """Short token identifying the RiceModel row (and files) behind one model kind.
+
+    That is the row of the loaded model while one is loaded (so results stay
+    keyed by the weights that produced them during a hot swap), else the
+    active row.
+    """
+    from .inference import registry
+
+    loaded = registry.loaded(kind)
+    if loaded is not None:
+        return loaded.version
+    now = time.monotonic()
+    with _versions_lock:
+        cached = _versions.get(kind)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    from .models import RiceModel
+
+    token = row_version(RiceModel.objects.filter(is_active=True, name=MODEL_NAMES[kind]).first())
+    with _versions_lock:
+        _versions[kind] = (now + VERSION_TTL, token)
+    return token
+
+
+def model_version(model_type):
+    """Token for every model kind ``model_type`` runs through."""
+    kinds = MODEL_TYPE_REQUIREMENTS.get(model_type, [])
+    return hashlib.sha1("|".join(kind_version(kind) for kind in kinds).encode()).hexdigest()[:16]
+
+
+def invalidate_model_versions():
+    with _versions_lock:
+        _versions.clear()
+
+
+def cache_key(model_type, digest):
+    from .catalogue import model_type_catalogue
+
+    # The class order is part of the key: cached rows are indexed by it
+    return f"rice-pred:{model_type}:{model_version(model_type)}:{model_type_catalogue(model_type).version}:{digest}"
@@ -0,0 +1,68 @@
+"""Confidence-gated cascade: a linear head on MobileNetV2 features answers
+easy images, and only the uncertain ones go on to a heavier model.
+
+The head is a softmax regression over the 1280-d MobileNetV2 GAP features,
+stored with one confidence threshold per class in an ``.npz`` file (see
+``manage.py calibrate_cascade``). An image is answered by the head when its
+top probability reaches the threshold of the class it predicts.
+"""
+import threading
+
+import numpy as np
+
+
+class CascadeHead:
+    backend = "numpy"
+
+    def __init__(self, weights, bias, thresholds):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["weights"], data["bias"], data["thresholds"])
+
+    @classmethod
+    def random(cls, num_features, num_classes, seed=0):
+        """Random weights, for benchmarks without a calibrated head."""
+        rng = np.random.default_rng(seed)
+        weights = rng.standard_normal((num_features, num_classes)) / np.sqrt(num_features)
+        return cls(weights, np.zeros(num_classes), np.full(num_classes, 0.5))
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, thresholds=self.thresholds)
+
+    def predict_proba(self, features):
+        logits = np.asarray(features, dtype=np.float32) @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    def confident(self, probs):
+        """Per row: does the top probability reach its class's threshold?"""
+        top = np.argmax(probs, axis=1)
+        return probs[np.arange(len(probs)), top] >= self.thresholds[top]
+
+
+class CascadeStats:
+    """How many cascade images the head answered and how many were escalated."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.escalated = 0
+
+    def record(self, images, escalated):
+        with self._lock:
+            self.images += images
+            self.escalated += escalated
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "images": self.images,
+                "escalated": self.escalated,
+                "escalation_rate": self.escalated / self.images if self.images else 0.0,
+            }
@@ -0,0 +1,169 @@
+"""In-memory class-index -> variety table for turning model outputs into answers.
+
+The RiceInfo rows are read once into an immutable, versioned table; the
+``post_save``/``post_delete`` signals on RiceInfo drop it so the next
+lookup rebuilds it, and other worker processes notice a change within
+``PREDICTION_MODEL_VERSION_TTL`` seconds through one cheap aggregate query.
+Each model's class order comes from its RiceModel ``class_names`` (the
+order it was trained with), so adding a variety never shifts the meaning
+of an existing model's outputs. Looking up a prediction is then plain
+tuple indexing with no database round trip.
+"""
+import hashlib
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .loaders import MODEL_NAMES
+
+VERSION_TTL = getattr(settings, "PREDICTION_MODEL_VERSION_TTL", 5)
+NO_INFO = "No info available."
+
+# The model kind whose outputs a model_type reports; "all" fuses in the catalogue order
+OUTPUT_KIND = {"vgg16": "vgg16", "vit": "vit", "ensemble": "xgboost"}
+
+
+class VarietyCatalogue:
+    """Immutable labels and info texts in one model's output order."""
+
+    __slots__ = ("labels", "infos", "version", "_index")
+
+    def __init__(self, labels, infos, version):
+        self.labels = tuple(labels)
+        self.infos = tuple(infos)
+        self.version = version
+        self._index = {label: i for i, label in enumerate(self.labels)}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def name(self, index):
+        return self.labels[index]
+
+    def info(self, index):
+        return self.infos[index]
+
+    def index(self, label):
+        return self._index.get(label)
+
+
+class _State:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.table = None        # {variety_name: info}, alphabetical
+        self.signature = None    # (row count, latest updated_at) the table was built from
+        self.checked_until = 0.0
+        self.catalogues = {}     # labels tuple -> VarietyCatalogue for the current table
+        self.kind_labels = {}    # kind -> (expires, labels tuple or None)
+        self.fallback = ()
+
+
+_state = _State()
+
+
+def _signature():
+    from django.db.models import Count, Max
+    from .models import RiceInfo
+
+    row = RiceInfo.objects.aggregate(count=Count("id"), updated=Max("updated_at"))
+    return row["count"], row["updated"]
+
+
+def _table():
+    now = time.monotonic()
+    with _state.lock:
+        if _state.table is not None and _state.checked_until > now:
+            return _state.table
+    signature = _signature()
+    with _state.lock:
+        if _state.table is None or signature != _state.signature:
+            from .models import RiceInfo
+
+            rows = RiceInfo.objects.order_by("variety_name").values_list("variety_name", "info")
+            _state.table = dict(rows)
+            _state.signature = signature
+            _state.catalogues = {}
+        _state.checked_until = now + VERSION_TTL
+        return _state.table
+
+
+def catalogue(labels=None):
+    """The catalogue in ``labels`` order; default every variety, alphabetically."""
+    table = _table()
+    labels = tuple(labels) if labels else (tuple(table) or _state.fallback)
+    with _state.lock:
+        cached = _state.catalogues.get(labels)
+        if cached is not None:
+            return cached
+    infos = [table.get(label, NO_INFO) for label in labels]
+    version = hashlib.sha1("\n".join(f"{l}\t{i}" for l, i in zip(labels, infos)).encode()).hexdigest()[:12]
+    built = VarietyCatalogue(labels, infos, version)
+    with _state.lock:
+        _state.catalogues[labels] = built
+    return built
+
+
+def labels_for(rice_model):
+    """Output order a RiceModel row was trained with (None: the default order)."""
+    if rice_model is None or not rice_model.class_names:
+        return None
+    return tuple(rice_model.class_names)
+
+
+def kind_catalogue(kind):
+    """Catalogue pinned to the RiceModel row of ``kind``: the loaded one, else the active one."""
+    from .inference import registry
+
+    loaded = registry.loaded(kind)
+    if loaded is not None and loaded.rice_model_id is not None:
+        return catalogue(loaded.labels)
+    now = time.monotonic()
+    with _state.lock:
+        cached = _state.kind_labels.get(kind)
+    if cached is None or cached[0] <= now:
+        from .models import RiceModel
+
+        names = (RiceModel.objects.filter(is_active=True, name=MODEL_NAMES[kind])
+                 .values_list("class_names", flat=True).first())
+        cached = (now + VERSION_TTL, tuple(names) if names else None)
+        with _state.lock:
+            _state.kind_labels[kind] = cached
+    return catalogue(cached[1])
+
+
+def model_type_catalogue(model_type):
+    kind = OUTPUT_KIND.get(model_type)
+    return kind_catalogue(kind) if kind else catalogue()
+
+
+def align(probs, source, target):
+    """Reorder probability columns from ``source``'s class order into ``target``'s.
+
+    Varieties ``source`` does not know get probability 0 in the result.
+    """
+    if source.labels == target.labels:
+        return probs
+    probs = np.asarray(probs)
+    aligned = np.zeros(probs.shape[:-1] + (len(target),), dtype=probs.dtype)
+    for i, label in enumerate(source.labels):
+        j = target.index(label)
+        if j is not None:
+            aligned[..., j] = probs[..., i]
+    return aligned
+
+
+def invalidate():
+    """Drop the table and pinned label orders; the next lookup rebuilds them."""
+    with _state.lock:
+        _state.table = None
+        _state.catalogues = {}
+        _state.kind_labels = {}
+
+
+def set_fallback_labels(labels):
+    """Labels to use while there are no RiceInfo rows (benchmarks on an empty database)."""
+    with _state.lock:
+        _state.fallback = tuple(labels)
+        _state.catalogues = {}
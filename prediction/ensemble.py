@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class EnsembleMetaModel:
+    """XGBoost meta-model over stacked VGG16 + MobileNetV2 features.
+
+    Walks the trees once per batch through ``Booster.inplace_predict`` (no
+    DMatrix construction). Only probabilities are produced: the label and
+    the top-k list of a response are read off them (``top_k_varieties``),
+    so the trees are never walked a second time.
+    """
+
+    def __init__(self, booster, nthread=None):
+        self.booster = booster
+        if nthread:
+            self.booster.set_param({"nthread": int(nthread)})
+
+    @classmethod
+    def load(cls, path, nthread=None):
+        from xgboost import Booster
+
+        booster = Booster()
+        booster.load_model(path)
+        return cls(booster, nthread)
+
+    @classmethod
+    def random(cls, num_features, num_classes, nthread=None, rounds=50, seed=0):
+        """A meta-model fitted to random features, the size of a real one; for benchmarks only."""
+        import xgboost as xgb
+
+        rng = np.random.default_rng(seed)
+        features = rng.standard_normal((num_classes * 8, num_features)).astype(np.float32)
+        labels = np.arange(len(features)) % num_classes
+        params = {"objective": "multi:softprob", "num_class": num_classes, "max_depth": 4,
+                  "tree_method": "hist", "seed": seed}
+        booster = xgb.train(params, xgb.DMatrix(features, label=labels), num_boost_round=rounds)
+        return cls(booster, nthread)
+
+    def predict_proba(self, features):
+        probs = self.booster.inplace_predict(np.ascontiguousarray(features, dtype=np.float32))
+        probs = np.asarray(probs)
+        if probs.ndim == 1:  # binary:logistic gives P(class 1) only
+            probs = np.stack([1.0 - probs, probs], axis=1)
+        return probs
@@ -0,0 +1,249 @@
+"""Persistent store of backbone feature vectors for the ensemble.
+
+Each (backbone, version) pair gets a small ``.meta`` JSON header holding
+the row width and the current generation, and per generation two
+append-only files: ``.f16`` holds float16 rows and is read through
+``np.memmap``; ``.keys`` holds the 32-byte SHA-256 of each row's decoded
+224x224 image in the same order. Re-running the XGBoost meta-model on an
+image that was seen before then needs no CNN pass at all.
+
+Appends take an ``flock`` so several workers can share a directory, and
+run on a background thread so a miss never waits for the disk. When a
+generation reaches ``PREDICTION_FEATURE_STORE_MAX_ROWS`` rows the next
+append starts a new, empty one and deletes the old files; readers see the
+new generation in the header and drop their index. Rows are only valid for
+the weights that produced them, so a store is dropped, files and all, as
+soon as its backbone has a new version.
+
+The ``vgg16`` model type's forward pass does not fill the VGG16 store.
+That mode feeds the shared trunk ``unit_scale`` input, while the ensemble
+was trained on features of ``vgg_preprocess`` input. The same pixels give
+different features in the two modes, so only the ensemble (and cascade)
+paths read and write the stores.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from django.conf import settings
+
+FEATURE_STORE_DIR = getattr(settings, "PREDICTION_FEATURE_STORE_DIR", None)
+FEATURE_STORE_MAX_ROWS = getattr(settings, "PREDICTION_FEATURE_STORE_MAX_ROWS", 200000)
+DIGEST_SIZE = 32
+
+
+def pixel_digest(image_array):
+    """SHA-256 of a decoded uint8 image; identical pixels give identical keys."""
+    return hashlib.sha256(np.ascontiguousarray(image_array).tobytes()).digest()
+
+
+class FeatureStore:
+    def __init__(self, directory, name, max_rows=None):
+        os.makedirs(directory, exist_ok=True)
+        self.base = os.path.join(directory, name)
+        self.meta_path = self.base + ".meta"
+        self.lock_path = self.base + ".lock"
+        self.max_rows = max_rows or FEATURE_STORE_MAX_ROWS
+        self.generation = None
+        self.dim = None
+        self._index = {}
+        self._rows = None
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._index)
+
+    def _paths(self, generation):
+        return f"{self.base}.{generation}.f16", f"{self.base}.{generation}.keys"
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return meta["generation"], meta["dim"]
+
+    def _write_meta(self, generation, dim):
+        # Written whole and renamed over the old header, so readers never see half of it
+        tmp = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"generation": generation, "dim": dim}, f)
+        os.replace(tmp, self.meta_path)
+
+    def _reset(self, generation=None, dim=None):
+        self.generation, self.dim = generation, dim
+        self._index = {}
+        self._rows = None
+
+    def _refresh(self):
+        """Pick up rows appended since the last look, by this or another process."""
+        meta = self._read_meta()
+        if meta is None:
+            self._reset()
+            return
+        if meta != (self.generation, self.dim):
+            self._reset(*meta)
+        rows_path, keys_path = self._paths(self.generation)
+        try:
+            # Rows are written before keys, so every key counted here has its row
+            count = os.path.getsize(keys_path) // DIGEST_SIZE
+            if count == len(self._index):
+                return
+            with open(keys_path, "rb") as f:
+                f.seek(len(self._index) * DIGEST_SIZE)
+                data = f.read((count - len(self._index)) * DIGEST_SIZE)
+            rows = np.memmap(rows_path, dtype=np.float16, mode="r", shape=(count, self.dim))
+        except FileNotFoundError:
+            # Rotated away between reading the header and opening the files
+            self._reset()
+            return
+        for i in range(0, len(data) - DIGEST_SIZE + 1, DIGEST_SIZE):
+            self._index[data[i:i + DIGEST_SIZE]] = len(self._index)
+        self._rows = rows
+
+    def get_many(self, digests):
+        """Return ``(found mask, float32 rows or None)``; rows for misses are zero."""
+        with self._lock:
+            self._refresh()
+            found = np.array([d in self._index for d in digests], dtype=bool)
+            if self._rows is None:
+                return found, None
+            rows = np.zeros((len(digests), self.dim), dtype=np.float32)
+            hit = np.flatnonzero(found)
+            if len(hit):
+                rows[hit] = self._rows[[self._index[digests[i]] for i in hit]]
+            return found, rows
+
+    def put_many(self, digests, rows):
+        rows = np.ascontiguousarray(rows, dtype=np.float16)
+        with self._lock:
+            if self.closed:  # a write queued before the store was superseded
+                return
+            self._append(digests, rows)
+
+    def _append(self, digests, rows):
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            self._refresh()
+            new = [i for i, d in enumerate(digests) if d not in self._index]
+            if not new:
+                return
+            if self.generation is None or self.dim != rows.shape[1] or len(self._index) + len(new) > self.max_rows:
+                self._rotate(rows.shape[1])
+            rows_path, keys_path = self._paths(self.generation)
+            with open(rows_path, "ab") as f:
+                # Drop the tail of an append that died before writing its keys
+                f.truncate(len(self._index) * self.dim * 2)
+                f.write(rows[new].tobytes())
+            with open(keys_path, "ab") as f:
+                f.write(b"".join(digests[i] for i in new))
+            self._refresh()
+
+    def _rotate(self, dim):
+        """Start an empty generation (caller holds the flock) and delete the previous one."""
+        previous = self.generation
+        generation = 0 if previous is None else previous + 1
+        self._write_meta(generation, dim)
+        self._reset(generation, dim)
+        if previous is not None:
+            # Other processes' memmaps of the old rows stay valid until they drop them
+            for path in self._paths(previous):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def rows(self):
+        """``(digests, float16 memmap)`` of everything stored, for offline meta-model work."""
+        with self._lock:
+            self._refresh()
+            return list(self._index), self._rows
+
+    def close(self):
+        """Drop the index and the memmap; later writes are ignored."""
+        with self._lock:
+            self.closed = True
+            self._reset()
+
+
+def remove_store_files(directory, name):
+    """Delete every file of the store ``name``: header, lock and all generations."""
+    for path in glob.glob(glob.escape(os.path.join(directory, name)) + ".*"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# kind -> (version, FeatureStore): only the current version of each backbone is kept open
+_stores = {}
+_stores_lock = threading.Lock()
+# One writer thread: misses are appended in the background, in order
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feature-store")
+
+
+def feature_store(kind, version):
+    """The store for ``version`` of ``kind``.
+
+    The first time a process asks for a version, it closes its store of the
+    previous one and deletes the files of every other version of ``kind``.
+    That includes versions superseded while the process was down. A worker
+    that is still on the old version until its next model poll may write
+    that store again; it deletes it in turn once it moves on.
+    """
+    if not FEATURE_STORE_DIR:
+        return None
+    with _stores_lock:
+        current = _stores.get(kind)
+        if current is not None and current[0] == version:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        name = f"{kind}-{version}"
+        for meta_path in glob.glob(glob.escape(os.path.join(FEATURE_STORE_DIR, f"{kind}-")) + "*.meta"):
+            stale = os.path.basename(meta_path)[:-len(".meta")]
+            if stale != name:
+                remove_store_files(FEATURE_STORE_DIR, stale)
+        store = FeatureStore(FEATURE_STORE_DIR, name)
+        _stores[kind] = (version, store)
+        return store
+
+
+def _put(store, digests, rows):
+    try:
+        store.put_many(digests, rows)
+    except OSError as e:
+        print(f"[ERROR] Could not append to feature store {store.base}: {e}")
+
+
+def cached_features(kind, version, batch, compute):
+    """Backbone features for a uint8 ``batch``, computing only rows not in the store."""
+    store = feature_store(kind, version)
+    if store is None:
+        return compute(batch).reshape(len(batch), -1)
+    digests = [pixel_digest(a) for a in batch]
+    found, rows = store.get_many(digests)
+    missing = np.flatnonzero(~found)
+    if len(missing):
+        computed = np.asarray(compute(batch[missing])).reshape(len(missing), -1)
+        _writer.submit(_put, store, [digests[i] for i in missing], computed)
+        if rows is None:
+            rows = np.zeros((len(batch), computed.shape[1]), dtype=np.float32)
+        # Round like the stored rows so a hit and a miss give the same prediction
+        rows[missing] = computed.astype(np.float16)
+    return rows
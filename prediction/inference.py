@@ -0,0 +1,423 @@
+"""Model execution shared by the prediction views, bulk endpoints and workers."""
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .batching import AdmissionLimit, MicroBatcher
+from .preprocessing import unit_scale, vgg_preprocess, mobilenet_preprocess, vit_preprocess
+from .registry import ModelRegistry, ModelNotAvailable, ModelWatcher, WarmUp
+from .uploads import decode_images
+from .cache import prediction_cache, cache_key, content_hash, invalidate_model_versions, kind_version
+from .features import cached_features
+from .catalogue import align, catalogue, kind_catalogue, labels_for, model_type_catalogue
+from .catalogue import invalidate as invalidate_catalogue
+from .cascade import CascadeStats
+from .loaders import CASCADE_FALLBACK
+from . import metrics
+from .metrics import MODEL_SECONDS
+
+# -----------------------------
+# Config
+# -----------------------------
+BATCH_WINDOW_MS = getattr(settings, "PREDICTION_BATCH_WINDOW_MS", 10)
+MAX_BATCH_SIZE = getattr(settings, "PREDICTION_MAX_BATCH_SIZE", 16)
+MODEL_MEMORY_BUDGET_MB = getattr(settings, "PREDICTION_MODEL_MEMORY_BUDGET_MB", None)
+BULK_BATCH_SIZE = getattr(settings, "PREDICTION_BULK_BATCH_SIZE", 32)
+PRELOAD_MODELS = getattr(settings, "PREDICTION_PRELOAD_MODELS", [])
+MAX_PENDING = getattr(settings, "PREDICTION_MAX_PENDING", 64)
+WARM_UP_MODELS = getattr(settings, "PREDICTION_WARM_UP_MODELS", ["vgg16", "mobilenetv2", "vit"])
+MODEL_POLL_SECONDS = getattr(settings, "PREDICTION_MODEL_POLL_SECONDS", 30)
+
+def num_classes(rice_model):
+    """Output width of the model a RiceModel row (or None: random weights) holds."""
+    return len(catalogue(labels_for(rice_model)))
+
+# Models are built on the first request that needs them and evicted LRU-first
+registry = ModelRegistry(memory_budget_mb=MODEL_MEMORY_BUDGET_MB, num_classes=num_classes)
+
+# Each worker loads and warms these after it starts (gunicorn.conf.py); /ready waits for it
+warm_up = WarmUp(registry, WARM_UP_MODELS)
+
+def rice_models_changed(kinds):
+    """Re-key cached results and hot-swap the loaded models of ``kinds`` in the background."""
+    invalidate_model_versions()
+    invalidate_catalogue()
+    for kind in kinds:
+        registry.refresh(kind)
+
+# Picks up RiceModel changes saved by other processes (signals cover this one)
+model_watcher = ModelWatcher(registry, MODEL_POLL_SECONDS, rice_models_changed)
+
+def preload_models(kinds=None):
+    """Load ``kinds`` into the registry now, e.g. in the gunicorn master before it forks.
+
+    Forked workers then share the already-loaded weight pages copy-on-write.
+    Only fork-safe runtimes belong here (PyTorch weights, XGBoost); TensorFlow
+    does not survive a fork, and TFLite files are memory-mapped by each worker
+    anyway.
+    """
+    from django.db import connections
+
+    kinds = PRELOAD_MODELS if kinds is None else kinds
+    for kind in kinds:
+        try:
+            registry.get(kind)
+        except Exception as e:
+            print(f"[ERROR] Could not preload {kind}: {e}")
+    catalogue()
+    # Workers must not inherit the master's DB connection
+    connections.close_all()
+
+# -----------------------------
+# Batch runners: uint8 (or model-input) batch -> class probabilities
+# -----------------------------
+def run_vgg16_batch(batch):
+    vgg_model = registry.get("vgg16")
+    with MODEL_SECONDS.time(kind="vgg16"):
+        return vgg_model.predict(unit_scale(batch), verbose=0)["probs"]
+
+def run_vit_batch(batch):
+    import torch
+
+    vit_classifier = registry.get("vit")
+    # One vectorized normalisation for the batch; the NCHW view is channels-last
+    pixel_values = torch.from_numpy(vit_preprocess(batch)).permute(0, 3, 1, 2)
+    with torch.inference_mode(), MODEL_SECONDS.time(kind="vit"):
+        outputs = vit_classifier(pixel_values)
+        # TorchScript exports return the logits tensor directly
+        logits = getattr(outputs, "logits", outputs)
+        return torch.softmax(logits, dim=1).numpy()
+
+def vgg16_features(batch):
+    # Not shared with run_vgg16_batch: the trunk sees vgg_preprocess input here and
+    # unit_scale input there, so the same pixels give different features
+    vgg_model = registry.get("vgg16")
+    with MODEL_SECONDS.time(kind="vgg16"):
+        return vgg_model.predict(vgg_preprocess(batch), verbose=0)["features"]
+
+def mobilenetv2_features(batch):
+    mobilenet = registry.get("mobilenetv2")
+    with MODEL_SECONDS.time(kind="mobilenetv2"):
+        return mobilenet.predict(mobilenet_preprocess(batch), verbose=0)
+
+def run_ensemble_batch(batch):
+    # Backbone features come from the feature store when these pixels were seen before
+    feat_vgg = cached_features("vgg16", kind_version("vgg16"), batch, vgg16_features)
+    feat_mobile = cached_features("mobilenetv2", kind_version("mobilenetv2"), batch, mobilenetv2_features)
+    xgb_classifier = registry.get("xgboost")
+    stacked_feat = np.hstack([feat_vgg, feat_mobile])
+    with MODEL_SECONDS.time(kind="xgboost"):
+        return xgb_classifier.predict_proba(stacked_feat)
+
+# -----------------------------
+# Cascade (model_type=cascade)
+# -----------------------------
+cascade_stats = CascadeStats()
+
+def run_cascade_batch(batch):
+    """MobileNetV2 head first; only rows below their class threshold run CASCADE_FALLBACK.
+
+    MobileNetV2 features go through the feature store, so an ensemble
+    fallback reuses them instead of running MobileNetV2 again.
+    """
+    target = catalogue()
+    features = cached_features("mobilenetv2", kind_version("mobilenetv2"), batch, mobilenetv2_features)
+    head = registry.get("cascade_head")
+    with MODEL_SECONDS.time(kind="cascade_head"):
+        head_probs = head.predict_proba(features)
+        confident = head.confident(head_probs)
+    probs = np.array(align(head_probs, kind_catalogue("cascade_head"), target), dtype=np.float64)
+    unsure = np.flatnonzero(~confident)
+    if len(unsure):
+        escalated = RUNNERS[CASCADE_FALLBACK](batch[unsure])
+        probs[unsure] = align(np.asarray(escalated), model_type_catalogue(CASCADE_FALLBACK), target)
+    cascade_stats.record(len(batch), len(unsure))
+    return probs
+
+# One queue per model: concurrent requests within the window share a forward pass
+batchers = {
+    "vgg16": MicroBatcher("vgg16", run_vgg16_batch, MAX_BATCH_SIZE, BATCH_WINDOW_MS),
+    "vit": MicroBatcher("vit", run_vit_batch, MAX_BATCH_SIZE, BATCH_WINDOW_MS),
+    "ensemble": MicroBatcher("ensemble", run_ensemble_batch, MAX_BATCH_SIZE, BATCH_WINDOW_MS),
+    "cascade": MicroBatcher("cascade", run_cascade_batch, MAX_BATCH_SIZE, BATCH_WINDOW_MS),
+}
+
+# Predict requests past MAX_PENDING in flight get a 503 instead of a queue slot
+admission = AdmissionLimit(MAX_PENDING)
+
+RUNNERS = {
+    "vgg16": run_vgg16_batch,
+    "vit": run_vit_batch,
+    "ensemble": run_ensemble_batch,
+    "cascade": run_cascade_batch,
+}
+
+# -----------------------------
+# Multi-model fusion (model_type=all)
+# -----------------------------
+FUSED_MODEL_TYPES = ["vgg16", "vit", "ensemble"]
+FUSION_WEIGHTS = getattr(settings, "PREDICTION_FUSION_WEIGHTS", {})
+FUSION_TEMPERATURES = getattr(settings, "PREDICTION_FUSION_TEMPERATURES", {})
+
+# TF, PyTorch and XGBoost release the GIL, so the three models overlap on these threads
+fusion_pool = ThreadPoolExecutor(max_workers=len(FUSED_MODEL_TYPES), thread_name_prefix="fusion")
+
+def calibrate(model_type, probs):
+    """Temperature-scale one model's probabilities so models are comparable before voting."""
+    temperature = float(FUSION_TEMPERATURES.get(model_type, 1.0))
+    probs = np.asarray(probs, dtype=np.float64)
+    if temperature == 1.0:
+        return probs
+    scaled = np.power(np.clip(probs, 1e-12, 1.0), 1.0 / temperature)
+    return scaled / scaled.sum(axis=-1, keepdims=True)
+
+def align_fused(per_model):
+    """Put every model's probabilities in the catalogue's class order before voting."""
+    target = catalogue()
+    return {mt: align(probs, model_type_catalogue(mt), target) for mt, probs in per_model.items()}
+
+def fuse(per_model):
+    """Weighted average of calibrated probabilities from the models that answered."""
+    weights = {mt: float(FUSION_WEIGHTS.get(mt, 1.0)) for mt in per_model}
+    total = sum(weights.values())
+    return sum(calibrate(mt, probs) * (weights[mt] / total) for mt, probs in per_model.items())
+
+def gather_fused(futures):
+    """Collect ``{model_type: Future}``; models that cannot load are left out of the vote."""
+    per_model, errors = {}, {}
+    for model_type, future in futures.items():
+        try:
+            per_model[model_type] = future.result()
+        except ModelNotAvailable as e:
+            errors[model_type] = str(e)
+    if not per_model:
+        raise ModelNotAvailable("; ".join(errors.values()))
+    return per_model, errors
+
+def submit_all(image_array):
+    """Queue one image on every fused model's micro-batcher; ``{model_type: Future}``."""
+    return {mt: batchers[mt].submit(image_array) for mt in FUSED_MODEL_TYPES}
+
+def predict_all(image_array):
+    """Run one image through every fused model at once via their micro-batchers.
+
+    Returns ``(fused probs, {model_type: probs}, {model_type: batch info}, errors)``.
+    """
+    return combine_all(submit_all(image_array))
+
+def combine_all(futures):
+    """Fuse the results of ``submit_all``, waiting for any still running."""
+    results, errors = gather_fused(futures)
+    per_model = align_fused({mt: np.asarray(probs) for mt, (probs, _) in results.items()})
+    batch_info = {mt: info for mt, (_, info) in results.items()}
+    return fuse(per_model), per_model, batch_info, errors
+
+def run_all_batch(batch):
+    futures = {
+        mt: fusion_pool.submit(RUNNERS[mt], batch)
+        for mt in FUSED_MODEL_TYPES
+    }
+    per_model, _ = gather_fused(futures)
+    return fuse(align_fused(per_model))
+
+RUNNERS["all"] = run_all_batch
+
+# -----------------------------
+# Gauges read on each /metrics scrape
+# -----------------------------
+def _model_states():
+    models = registry.status()["models"]
+    return [({"kind": kind, "state": state}, int(entry["state"] == state))
+            for kind, entry in models.items() for state in ("unloaded", "loading", "ready", "failed")]
+
+def _model_values(field, scale=1.0):
+    def collect():
+        models = registry.status()["models"]
+        return [({"kind": kind}, (entry[field] or 0) * scale) for kind, entry in models.items()]
+    return collect
+
+metrics.register(metrics.Gauge(
+    "prediction_model_swaps_total", "New model versions hot-swapped in without a restart",
+    lambda: [({"kind": kind}, m["swaps"]) for kind, m in registry.status()["models"].items()], type="counter"))
+metrics.register(metrics.Gauge(
+    "prediction_ready", "1 once this worker has finished warming up its models",
+    lambda: [({}, int(warm_up.status()["ready"]))]))
+metrics.register(metrics.Gauge(
+    "prediction_queue_depth", "Samples waiting in each micro-batcher",
+    lambda: [({"model": name}, batcher.queue_depth()) for name, batcher in batchers.items()]))
+metrics.register(metrics.Gauge(
+    "prediction_pending", "Predict requests admitted and not yet answered", lambda: [({}, admission.pending)]))
+metrics.register(metrics.Gauge(
+    "prediction_rejected_total", "Predict requests refused with 503 because too many were pending",
+    lambda: [({}, admission.rejected)], type="counter"))
+metrics.register(metrics.Gauge(
+    "prediction_cascade_images_total", "Images classified with model_type=cascade",
+    lambda: [({}, cascade_stats.images)], type="counter"))
+metrics.register(metrics.Gauge(
+    "prediction_cascade_escalated_total", "Cascade images the MobileNetV2 head passed on to the fallback model",
+    lambda: [({"fallback": CASCADE_FALLBACK}, cascade_stats.escalated)], type="counter"))
+metrics.register(metrics.Gauge("prediction_model_state", "Registry state of each model kind", _model_states))
+metrics.register(metrics.Gauge(
+    "prediction_model_load_seconds", "How long the resident copy of each model took to load",
+    _model_values("load_seconds")))
+metrics.register(metrics.Gauge(
+    "prediction_model_resident_bytes", "Estimated resident weight size per model kind",
+    _model_values("size_mb", 2**20)))
+metrics.register(metrics.Gauge(
+    "prediction_cache_hits_total", "Prediction cache hits since the worker started",
+    lambda: [({}, prediction_cache.stats()["hits"])], type="counter"))
+metrics.register(metrics.Gauge(
+    "prediction_cache_misses_total", "Prediction cache misses since the worker started",
+    lambda: [({}, prediction_cache.stats()["misses"])], type="counter"))
+
+def top_k_varieties(probs, k, varieties, per_model=None):
+    """The ``k`` most likely varieties for one probability row, best first.
+
+    ``varieties`` is the catalogue in the row's class order.
+    """
+    probs = np.asarray(probs)
+    order = np.argsort(-probs)[:k]
+    top = [{"variety": varieties.name(i), "confidence": float(probs[i] * 100)} for i in order]
+    if per_model:
+        for row, i in zip(top, order):
+            row["scores"] = {mt: float(np.asarray(p)[i] * 100) for mt, p in per_model.items()}
+    return top
+
+def predict_arrays(model_type, image_arrays, batch_size=None):
+    """Yield probability rows for ``image_arrays`` in fixed-size batches.
+
+    Used for bulk work that is already batched, so it runs the model directly
+    instead of going through the per-request micro-batchers.
+    """
+    run_batch = RUNNERS[model_type]
+    batch_size = batch_size or BULK_BATCH_SIZE
+    for start in range(0, len(image_arrays), batch_size):
+        yield from run_batch(np.stack(image_arrays[start:start + batch_size]))
+
+class BatchPredictions:
+    """Per-image results for a lot of ``(filename, bytes)`` pairs, in steps.
+
+    Shared by ``iter_batch_predictions`` and ``aiter_batch_predictions``,
+    which differ only in how the cache misses of each chunk are run.
+    """
+
+    def __init__(self, model_type, images, batch_size=None):
+        self.model_type = model_type
+        self.images = images
+        self.batch_size = batch_size or BULK_BATCH_SIZE
+        self.varieties = model_type_catalogue(model_type)
+        self.histogram = Counter()
+        self.failed = 0
+        self._decoded = enumerate(decode_images(images))
+        self._cached = {}
+
+    def next_chunk(self):
+        """Decode the next ``batch_size`` images and look them up in the prediction cache.
+
+        Returns ``(errors, ready, misses)``, or None once every image was
+        read: result dicts for images that failed to decode, the decoded
+        ``(index, filename, array, cache key)`` tuples, and those of them
+        that still need a forward pass.
+        """
+        chunk = list(islice(self._decoded, self.batch_size))
+        if not chunk:
+            return None
+        errors, ready = [], []
+        for index, (name, array, error) in chunk:
+            if error is not None:
+                self.failed += 1
+                errors.append({"index": index, "filename": name, "error": error})
+            else:
+                ready.append((index, name, array, cache_key(self.model_type, content_hash(self.images[index][1]))))
+        self._cached = {key: prediction_cache.get(key) for _, _, _, key in ready}
+        misses = [item for item in ready if self._cached[item[3]] is None]
+        return errors, ready, misses
+
+    def store(self, misses, all_probs):
+        for (_, _, _, key), probs in zip(misses, all_probs):
+            self._cached[key] = {"probs": np.asarray(probs).tolist()}
+            prediction_cache.set(key, self._cached[key])
+
+    def results(self, ready):
+        results = []
+        for index, name, _, key in ready:
+            probs = np.asarray(self._cached[key]["probs"])
+            predicted_class = self.varieties.name(int(np.argmax(probs)))
+            self.histogram[predicted_class] += 1
+            results.append({
+                "index": index,
+                "filename": name,
+                "predicted_variety": predicted_class,
+                "confidence": float(np.max(probs) * 100),
+            })
+        return results
+
+    def summary(self):
+        return {"summary": {
+            "model_type": self.model_type,
+            "images": len(self.images),
+            "predicted": sum(self.histogram.values()),
+            "failed": self.failed,
+            "histogram": dict(self.histogram.most_common()),
+            "composition": lot_composition(self.histogram),
+        }}
+
+def iter_batch_predictions(model_type, images, batch_size=None):
+    """Classify ``(filename, bytes)`` pairs, yielding a result dict per image.
+
+    Images are decoded on the decode pool and run in ``batch_size`` tensor
+    batches; the last item yielded is ``{"summary": {...}}`` with the
+    variety histogram and lot composition.
+    """
+    lot = BatchPredictions(model_type, images, batch_size)
+    while (chunk := lot.next_chunk()) is not None:
+        errors, ready, misses = chunk
+        yield from errors
+        if misses:
+            lot.store(misses, predict_arrays(model_type, [array for _, _, array, _ in misses], batch_size=len(misses)))
+        yield from lot.results(ready)
+    yield lot.summary()
+
+async def submit_batched(model_type, arrays):
+    """Probabilities for ``arrays`` from the model's micro-batchers, awaited without blocking.
+
+    Cancelling the caller cancels the queued samples, which the batchers
+    then skip.
+    """
+    if model_type == "all":
+        submitted = [submit_all(array) for array in arrays]
+        await asyncio.gather(*(asyncio.wrap_future(f) for futures in submitted for f in futures.values()),
+                             return_exceptions=True)
+        fused = sync_to_async(combine_all, thread_sensitive=False)
+        return [(await fused(futures))[0] for futures in submitted]
+    outcomes = await asyncio.gather(*(asyncio.wrap_future(batchers[model_type].submit(a)) for a in arrays))
+    return [probs for probs, _ in outcomes]
+
+async def aiter_batch_predictions(model_type, images, batch_size=None):
+    """``iter_batch_predictions`` for async views.
+
+    Decoding and cache lookups run in worker threads and the forward passes
+    on the micro-batchers, so neither the event loop nor the thread that
+    sync views share is held while a lot runs, and its images share
+    batches with concurrent predict/ requests.
+    """
+    lot = await sync_to_async(BatchPredictions, thread_sensitive=False)(model_type, images, batch_size)
+    while (chunk := await sync_to_async(lot.next_chunk, thread_sensitive=False)()) is not None:
+        errors, ready, misses = chunk
+        for result in errors:
+            yield result
+        if misses:
+            all_probs = await submit_batched(model_type, [array for _, _, array, _ in misses])
+            await sync_to_async(lot.store, thread_sensitive=False)(misses, all_probs)
+        for result in lot.results(ready):
+            yield result
+    yield lot.summary()
+
+def lot_composition(histogram):
+    """Percentage of the lot per variety, most common first."""
+    total = sum(histogram.values())
+    return {variety: round(count / total * 100, 2) for variety, count in histogram.most_common()}
@@ -0,0 +1,107 @@
+"""Database-backed queue for bulk prediction jobs.
+
+The web app only stores the images and a PredictionJob row; the
+run_prediction_workers command claims queued rows and does the inference,
+so large lots never tie up a web worker.
+"""
+import io
+import json
+import os
+import socket
+import traceback
+import zipfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from .models import PredictionJob
+
+# Progress is written at most this often while a job runs; results only once, at the end
+PROGRESS_EVERY = 32
+# Lists the uploaded filenames in a job zip, whose members are named by index
+MANIFEST = "manifest.json"
+
+
+def enqueue_job(model_type, images):
+    """Pack ``(filename, bytes)`` pairs into a zip and queue a PredictionJob."""
+    buffer = io.BytesIO()
+    # Images are already compressed; storing avoids burning CPU on deflate
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr(MANIFEST, json.dumps([name for name, _ in images]))
+        for index, (_, data) in enumerate(images):
+            archive.writestr(f"{index:05d}", data)
+    job = PredictionJob(model_type=model_type, total=len(images))
+    job.upload.save("images.zip", ContentFile(buffer.getvalue()), save=False)
+    job.save()
+    return job
+
+
+def requeue_stale_jobs(stale_after):
+    """Put jobs whose worker stopped reporting progress back on the queue."""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return PredictionJob.objects.filter(status=PredictionJob.RUNNING, updated_at__lt=cutoff).update(
+        status=PredictionJob.QUEUED, worker="", processed=0, results=[], updated_at=timezone.now()
+    )
+
+
+def claim_next_job(worker_name):
+    """Atomically move the oldest queued job to running; None if the queue is empty."""
+    candidates = (PredictionJob.objects.filter(status=PredictionJob.QUEUED)
+                  .order_by('created_at').values_list('pk', flat=True)[:10])
+    for job_id in candidates:
+        # The conditional update is the lock: only one worker sees a row count of 1
+        claimed = PredictionJob.objects.filter(pk=job_id, status=PredictionJob.QUEUED).update(
+            status=PredictionJob.RUNNING, worker=worker_name, started_at=timezone.now(), updated_at=timezone.now()
+        )
+        if claimed:
+            return PredictionJob.objects.get(pk=job_id)
+    return None
+
+
+def read_job_images(f):
+    """The ``(filename, bytes)`` pairs packed by ``enqueue_job``, in upload order and under their uploaded names.
+
+    Every image was accepted when the job was queued, so none is filtered out again.
+    """
+    with zipfile.ZipFile(f) as archive:
+        if MANIFEST not in archive.namelist():  # queued before job zips had a manifest
+            return [(info.filename, archive.read(info)) for info in archive.infolist()]
+        names = json.loads(archive.read(MANIFEST))
+        return [(name, archive.read(f"{index:05d}")) for index, name in enumerate(names)]
+
+
+def run_job(job):
+    """Classify the job's images and store the results; the uploaded zip is deleted afterwards."""
+    from .inference import iter_batch_predictions
+
+    try:
+        with job.upload.open('rb') as f:
+            images = read_job_images(f)
+        results = []
+        for result in iter_batch_predictions(job.model_type, images):
+            if "summary" in result:
+                job.summary = result["summary"]
+                continue
+            results.append(result)
+            if len(results) % PROGRESS_EVERY == 0:
+                # A counter, not the growing results list: rewriting that would be quadratic
+                PredictionJob.objects.filter(pk=job.pk).update(processed=len(results), updated_at=timezone.now())
+        job.results = results
+        job.processed = len(results)
+        job.status = PredictionJob.DONE
+    except Exception as e:
+        traceback.print_exc()
+        job.status = PredictionJob.FAILED
+        job.error = str(e)
+    try:
+        job.upload.delete(save=False)
+    except OSError as e:
+        print(f"[ERROR] Could not delete {job.upload.name}: {e}")
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def worker_name(index):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
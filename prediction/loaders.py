@@ -0,0 +1,287 @@
+"""Builders for each RiceModel kind.
+
+TensorFlow, PyTorch, transformers and xgboost are imported inside the
+builders so that importing the app stays cheap; the registry calls these
+on the first request that needs a model.
+"""
+import os
+
+from django.conf import settings
+
+from .preprocessing import IMAGE_SIZE
+from .runtime import configure_torch, get_strategy, threads_for
+
+# RiceModel.name of the row backing each model kind
+MODEL_NAMES = {
+    "vgg16": "VGG16 Rice Classifier",
+    "mobilenetv2": "MobileNetV2 Rice Classifier",
+    "xgboost": "XGBoost Meta Model",
+    "vit": "ViT Rice Classifier",
+    "cascade_head": "MobileNetV2 Cascade Head",
+}
+
+# model_type=cascade sends images its MobileNetV2 head is unsure about to this model_type
+CASCADE_FALLBACK = getattr(settings, "PREDICTION_CASCADE_FALLBACK", "ensemble")
+
+# Model kinds each prediction model_type needs resident
+MODEL_TYPE_REQUIREMENTS = {
+    "vgg16": ["vgg16"],
+    "vit": ["vit"],
+    "ensemble": ["vgg16", "mobilenetv2", "xgboost"],
+    "all": ["vgg16", "mobilenetv2", "xgboost", "vit"],
+}
+MODEL_TYPE_REQUIREMENTS["cascade"] = list(dict.fromkeys(
+    ["mobilenetv2", "cascade_head"] + MODEL_TYPE_REQUIREMENTS[CASCADE_FALLBACK]
+))
+
+# VGG16 GAP (512) + MobileNetV2 GAP (1280) features stacked for the XGBoost meta-model
+MOBILENETV2_FEATURE_DIM = 1280
+ENSEMBLE_FEATURE_DIM = 512 + MOBILENETV2_FEATURE_DIM
+
+
+def tflite_path(rice_model):
+    """Path of the row's .tflite file if it should be served instead of Keras."""
+    if rice_model is None or not getattr(settings, "PREDICTION_USE_TFLITE", True) or not rice_model.tflite_file:
+        return None
+    path = rice_model.tflite_file.path
+    return path if os.path.exists(path) else None
+
+
+def load_tflite_model(path):
+    from .tflite_backend import TFLiteModel
+
+    model = TFLiteModel(
+        path,
+        num_threads=threads_for("tflite"),
+        pool_size=getattr(settings, "PREDICTION_TFLITE_POOL_SIZE", 2),
+    )
+    print("✅ Loaded TFLite model from:", path)
+    return model
+
+
+def compile_keras(model, label):
+    """Serve a Keras model through pre-traced, warmed-up per-bucket graphs.
+
+    Keras itself is kept when PREDICTION_GRAPH_BUCKETS is empty.
+    """
+    buckets = getattr(settings, "PREDICTION_GRAPH_BUCKETS", [1, 2, 4, 8, 16, 32])
+    if not buckets:
+        return model
+    from .graph_backend import GraphModel
+
+    graph = GraphModel(model, buckets, jit_compile=getattr(settings, "PREDICTION_XLA", False))
+    seconds = graph.warm_up()
+    print(f"✅ Warmed up {label} ({graph.backend}, batch buckets {graph.buckets}) in {seconds:.1f}s")
+    return graph
+
+
+# -----------------------------
+# Builders
+# -----------------------------
+# Builders accept rice_model=None to build the architecture with random
+# weights (benchmarks on machines without the trained checkpoints).
+def weights_source(rice_model):
+    return rice_model.model_file.path if rice_model is not None else "random initialization"
+
+
+def build_vgg16_model(rice_model, num_classes):
+    if tflite_path(rice_model):
+        return load_tflite_model(tflite_path(rice_model))
+    return compile_keras(build_vgg16_keras(rice_model, num_classes), "VGG16")
+
+
+def build_vgg16_keras(rice_model, num_classes, l2_weight=1e-4, dropout_rate=0.3):
+    from tensorflow import keras
+    from tensorflow.keras.applications import VGG16
+    from tensorflow.keras.layers import GlobalAveragePooling2D, Dropout, Dense, BatchNormalization
+    from tensorflow.keras.regularizers import l2
+
+    with get_strategy().scope():
+        # One conv trunk with two heads: GAP features (ensemble) and softmax (vgg16 mode)
+        # weights=None: every layer is overwritten by our checkpoint, so skip the ImageNet download
+        base_model = VGG16(include_top=False, input_shape=IMAGE_SIZE + (3,), weights=None)
+        x = base_model.output
+        features = GlobalAveragePooling2D(name="gap")(x)
+        x = Dropout(dropout_rate, name="dropout")(features)
+        x = Dense(256, activation="relu", kernel_regularizer=l2(l2_weight), name="dense_256")(x)
+        x = BatchNormalization(name="bn")(x)
+        outputs = Dense(num_classes, activation="softmax", dtype="float32", name="pred")(x)
+        model = keras.Model(
+            inputs=base_model.input,
+            outputs={"features": features, "probs": outputs},
+            name="VGG16_rice62",
+        )
+        if rice_model is not None:
+            model.load_weights(rice_model.model_file.path)
+    print("✅ Loaded VGG16 weights from:", weights_source(rice_model))
+    return model
+
+
+def build_mobilenetv2_feature_extractor(rice_model, num_classes):
+    if tflite_path(rice_model):
+        return load_tflite_model(tflite_path(rice_model))
+    return compile_keras(build_mobilenetv2_keras(rice_model, num_classes), "MobileNetV2")
+
+
+def build_mobilenetv2_keras(rice_model, num_classes):
+    from tensorflow import keras
+    from tensorflow.keras.applications import MobileNetV2
+    from tensorflow.keras.layers import GlobalAveragePooling2D
+
+    with get_strategy().scope():
+        base = MobileNetV2(weights=None, include_top=False, input_shape=IMAGE_SIZE + (3,))
+        x = GlobalAveragePooling2D()(base.output)
+        model = keras.Model(inputs=base.input, outputs=x)
+        if rice_model is not None:
+            model.load_weights(rice_model.model_file.path)
+    print("✅ Loaded MobileNetV2 weights from:", weights_source(rice_model))
+    return model
+
+
+def load_xgboost_meta_model(rice_model, num_classes):
+    from .ensemble import EnsembleMetaModel
+
+    if rice_model is None:
+        xgb_classifier = EnsembleMetaModel.random(ENSEMBLE_FEATURE_DIM, num_classes, nthread=threads_for("xgboost"))
+    else:
+        xgb_classifier = EnsembleMetaModel.load(rice_model.model_file.path, nthread=threads_for("xgboost"))
+    print("✅ Loaded XGBoost model from:", weights_source(rice_model))
+    return xgb_classifier
+
+
+def torchscript_path(rice_model):
+    """Path of the row's TorchScript export if it exists on disk."""
+    if rice_model is None or not getattr(settings, "PREDICTION_USE_TORCHSCRIPT", True) or not rice_model.torchscript_file:
+        return None
+    path = rice_model.torchscript_file.path
+    return path if os.path.exists(path) else None
+
+
+# Serve the ViT int8-quantized and traced (torch_backend.OptimizedViT) instead of fp32;
+# check the accuracy cost first with manage.py check_vit_parity
+VIT_OPTIMIZED = getattr(settings, "PREDICTION_VIT_OPTIMIZED", False)
+
+
+def load_vit_classifier(rice_model, num_classes):
+    torch = configure_torch()
+
+    if VIT_OPTIMIZED:
+        from .torch_backend import OptimizedViT
+
+        vit_classifier = OptimizedViT(
+            load_vit_eager(rice_model, num_classes),
+            warm_up_batch_sizes=(1, getattr(settings, "PREDICTION_MAX_BATCH_SIZE", 16)),
+        )
+        print("✅ Quantized the ViT (int8 Linear); it is traced on first use")
+        return vit_classifier
+    if torchscript_path(rice_model):
+        vit_classifier = torch.jit.load(torchscript_path(rice_model), map_location='cpu')
+        vit_classifier.eval()
+        print("✅ Loaded TorchScript ViT from:", torchscript_path(rice_model))
+        return vit_classifier
+    return load_vit_eager(rice_model, num_classes)
+
+
+VIT_CONFIG_PATH = getattr(
+    settings, "PREDICTION_VIT_CONFIG",
+    os.path.join(os.path.dirname(__file__), "model_configs", "vit-base-patch16-224.json"),
+)
+
+
+def load_state_dict(path):
+    """Read a PyTorch checkpoint without copying it more than needed.
+
+    ``.safetensors`` files are memory-mapped. Pickled ``.pt``/``.pth`` files
+    are memory-mapped only by torch >= 2.1; the pinned torch 2.0.1 reads them
+    into private memory, so every process that loads one holds its own copy
+    (a load in the gunicorn master is still shared copy-on-write). Convert
+    them with ``manage.py export_models --models vit --safetensors``.
+    """
+    import torch
+
+    if path.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        return load_file(path, device="cpu")
+    try:
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:  # torch < 2.1 has no mmap/weights_only
+        print(f"Read {os.path.basename(path)} into memory (not memory-mapped); "
+              f"convert it with export_models --safetensors to share it between workers")
+        return torch.load(path, map_location="cpu")
+
+
+def assign_state_dict(module, state_dict):
+    """Point the module's parameters and buffers at ``state_dict``'s tensors.
+
+    Unlike ``load_state_dict`` nothing is copied, so weights that were
+    memory-mapped stay backed by the file's pages and are shared by every
+    process that maps (or forked after loading) the same file.
+    """
+    import torch
+
+    expected = module.state_dict()
+    missing = sorted(set(expected) - set(state_dict))
+    unexpected = sorted(set(state_dict) - set(expected))
+    if missing or unexpected:
+        raise RuntimeError(f"State dict mismatch: missing {missing[:5]}, unexpected {unexpected[:5]}")
+    for name, tensor in state_dict.items():
+        if tensor.shape != expected[name].shape:
+            raise RuntimeError(f"Shape mismatch for {name}: {tuple(tensor.shape)} vs {tuple(expected[name].shape)}")
+        owner_name, _, attr = name.rpartition(".")
+        owner = module.get_submodule(owner_name) if owner_name else module
+        if attr in owner._parameters:
+            owner._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            owner._buffers[attr] = tensor
+
+
+def load_vit_eager(rice_model, num_classes):
+    from transformers import ViTConfig, ViTForImageClassification
+
+    try:
+        from transformers.modeling_utils import no_init_weights
+    except ImportError:
+        from contextlib import nullcontext as no_init_weights
+
+    # Architecture from the bundled config: nothing is downloaded and no ImageNet
+    # weights are read only to be overwritten by our checkpoint
+    config = ViTConfig.from_json_file(VIT_CONFIG_PATH)
+    config.num_labels = num_classes
+    if rice_model is None:
+        vit_classifier = ViTForImageClassification(config)
+    else:
+        with no_init_weights():
+            vit_classifier = ViTForImageClassification(config)
+        assign_state_dict(vit_classifier, load_state_dict(rice_model.model_file.path))
+    vit_classifier.eval()
+    print("✅ Loaded ViT model from:", weights_source(rice_model))
+    return vit_classifier
+
+
+def load_cascade_head(rice_model, num_classes):
+    from .cascade import CascadeHead
+
+    if rice_model is None:
+        head = CascadeHead.random(MOBILENETV2_FEATURE_DIM, num_classes)
+    else:
+        head = CascadeHead.load(rice_model.model_file.path)
+    print("✅ Loaded cascade head from:", weights_source(rice_model))
+    return head
+
+
+LOADERS = {
+    "vgg16": build_vgg16_model,
+    "mobilenetv2": build_mobilenetv2_feature_extractor,
+    "xgboost": load_xgboost_meta_model,
+    "vit": load_vit_classifier,
+    "cascade_head": load_cascade_head,
+}
+
+
+def model_file_size(rice_model):
+    """Bytes on disk of the weights that will be loaded; used as the resident-size estimate."""
+    try:
+        path = tflite_path(rice_model) or torchscript_path(rice_model) or rice_model.model_file.path
+        return os.path.getsize(path)
+    except (OSError, ValueError):
+        return 0
@@ -0,0 +1,77 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction import features
+from prediction.inference import RUNNERS, batchers, predict_all
+from prediction.preprocessing import IMAGE_SIZE
+from prediction.runtime import thread_budget
+
+
+def request_once(model_type, image_array):
+    """One request's worth of work, through the same micro-batchers the predict view uses."""
+    started = time.perf_counter()
+    if model_type == "all":
+        predict_all(image_array)
+    else:
+        batchers[model_type](image_array)
+    return (time.perf_counter() - started) * 1000.0
+
+
+class Command(BaseCommand):
+    help = 'Measure p50/p99 prediction latency at several levels of concurrent requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-type', default='vgg16', choices=sorted(RUNNERS))
+        parser.add_argument('--concurrency', default='1,2,4,8,16',
+                            help='Comma-separated numbers of requests in flight at once')
+        parser.add_argument('--requests', type=int, default=64, help='Requests per concurrency level')
+        parser.add_argument('--feature-store', action='store_true',
+                            help='Let the ensemble reuse stored backbone features (off: time the full forward pass)')
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        model_type = options['model_type']
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',') if level]
+        except ValueError:
+            raise CommandError('--concurrency takes comma-separated integers, e.g. 1,4,16')
+
+        if not options['feature_store']:
+            # Repeated synthetic images would otherwise skip the CNNs, and must not fill the store
+            features.FEATURE_STORE_DIR = None
+
+        budget = thread_budget()
+        self.stdout.write('Thread budget: ' + ', '.join(f'{k}={v}' for k, v in budget.items()))
+
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 256, IMAGE_SIZE + (3,), dtype=np.uint8) for _ in range(max(levels))]
+        # Loads the models and warms up graph tracing / allocations
+        request_once(model_type, images[0])
+
+        results = []
+        for level in levels:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                latencies = list(pool.map(
+                    lambda i: request_once(model_type, images[i % level]), range(options['requests'])
+                ))
+            elapsed = time.perf_counter() - started
+            row = {
+                "concurrency": level,
+                "requests": len(latencies),
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "images_per_s": len(latencies) / elapsed,
+            }
+            results.append(row)
+            self.stdout.write(f"concurrency {level:3d}: p50 {row['p50_ms']:8.1f} ms, "
+                              f"p99 {row['p99_ms']:8.1f} ms, {row['images_per_s']:7.1f} images/s")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump({"model_type": model_type, "threads": budget, "results": results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['json_path']}"))
@@ -0,0 +1,199 @@
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction import catalogue, features, inference
+from prediction.loaders import MODEL_TYPE_REQUIREMENTS
+from prediction.memory import process_memory
+from prediction.preprocessing import IMAGE_SIZE, decode_upload, mobilenet_preprocess, unit_scale, vgg_preprocess, vit_preprocess
+from prediction.runtime import thread_budget
+
+# Class count of the trained models, used when the DB has no varieties
+DEFAULT_NUM_CLASSES = 62
+
+
+def synthetic_grains(size, grains=40, seed=0):
+    """JPEG bytes of light rice-grain ellipses scattered on a dark tray, ``size`` = (width, height)."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    canvas = np.full((height, width, 3), 30, dtype=np.uint8)
+    length = max(8, min(size) // 6)
+    yy, xx = np.mgrid[-length:length + 1, -length:length + 1]
+    for _ in range(grains):
+        angle = rng.uniform(0, np.pi)
+        u = xx * np.cos(angle) + yy * np.sin(angle)
+        v = -xx * np.sin(angle) + yy * np.cos(angle)
+        mask = (u / length) ** 2 + (v / (length * rng.uniform(0.2, 0.35))) ** 2 <= 1.0
+        cy, cx = rng.integers(length, height - length), rng.integers(length, width - length)
+        patch = canvas[cy - length:cy + length + 1, cx - length:cx + length + 1]
+        patch[mask] = rng.integers(170, 240, 3)
+    buffer = io.BytesIO()
+    Image.fromarray(canvas).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def preprocess(model_type, batch):
+    """The vectorized input preparation each model type does on a uint8 batch."""
+    if model_type == "vgg16":
+        return unit_scale(batch)
+    if model_type == "ensemble":
+        return vgg_preprocess(batch), mobilenet_preprocess(batch)
+    if model_type == "vit":
+        return vit_preprocess(batch)
+    return batch
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    value = fn(*args)
+    return value, (time.perf_counter() - started) * 1000.0
+
+
+def summarize(timings):
+    return {"p50_ms": float(np.percentile(timings, 50)), "p99_ms": float(np.percentile(timings, 99)),
+            "mean_ms": float(np.mean(timings))}
+
+
+class Command(BaseCommand):
+    help = ('Benchmark cold start, per-stage latency, batch throughput and peak memory of each model type, '
+            'each in a fresh process; models without trained weights on disk are built with random weights')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-type', action='append', choices=sorted(inference.RUNNERS),
+                            help='Model type to benchmark (repeatable; default vgg16, vit and ensemble)')
+        parser.add_argument('--batch-sizes', default='1,2,4,8,16,32,64')
+        parser.add_argument('--repeats', type=int, default=10, help='Timed runs per stage and batch size')
+        parser.add_argument('--full-size', default='3000x2000', help='Full-resolution synthetic image, WxH')
+        parser.add_argument('--output', default='bench_predict.json', help='JSON file the results are written to')
+        # Set on the per-model-type child processes: benchmark here and write only this type's result
+        parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        model_types = options['model_type'] or ["vgg16", "vit", "ensemble"]
+        try:
+            batch_sizes = [int(size) for size in options['batch_sizes'].split(',') if size]
+            full_size = tuple(int(side) for side in options['full_size'].lower().split('x'))
+        except ValueError:
+            raise CommandError('--batch-sizes takes e.g. 1,8,64 and --full-size e.g. 3000x2000')
+        repeats = max(1, options['repeats'])
+
+        if options['child']:
+            result = self.bench_model_type(model_types[0], batch_sizes, full_size, repeats)
+            with open(options['output'], 'w') as f:
+                json.dump(result, f)
+            return
+
+        report = {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "threads": thread_budget(),
+            "model_types": {},
+        }
+        for model_type in model_types:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{model_type}"))
+            result = self.bench_in_child(model_type, options)
+            report["model_types"][model_type] = result
+            self.stdout.write(f"  cold start {result['cold_start_s']:.2f} s ({', '.join(result['backends'])} weights),"
+                              f" peak RSS {result['peak_rss_mb']:.0f} MB")
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def bench_in_child(self, model_type, options):
+        """Benchmark one model type in a fresh interpreter.
+
+        ru_maxrss is a process-wide high-water mark, so in one process every
+        model type after the first would report the peak of all before it.
+        """
+        with tempfile.TemporaryDirectory() as workdir:
+            output = os.path.join(workdir, f'{model_type}.json')
+            command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_predict', '--child',
+                       '--model-type', model_type, '--batch-sizes', options['batch_sizes'],
+                       '--repeats', str(options['repeats']), '--full-size', options['full_size'], '--output', output]
+            completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+            self.stdout.write(completed.stdout, ending='')
+            if completed.returncode != 0:
+                raise CommandError(f'Benchmarking {model_type} failed (exit status {completed.returncode})')
+            with open(output) as f:
+                return json.load(f)
+
+    def bench_model_type(self, model_type, batch_sizes, full_size, repeats):
+        # Time the CNNs themselves, and keep synthetic features out of the store
+        features.FEATURE_STORE_DIR = None
+        inference.registry.random_weights = True
+        catalogue.set_fallback_labels(f"class_{i}" for i in range(DEFAULT_NUM_CLASSES))
+
+        images = {
+            "224": synthetic_grains(IMAGE_SIZE, grains=6),
+            "full": synthetic_grains(full_size),
+        }
+        run_batch = inference.RUNNERS[model_type]
+        sample = decode_upload(io.BytesIO(images["224"]))
+
+        kinds = MODEL_TYPE_REQUIREMENTS[model_type]
+        # Cold start: load every model the type needs, then the first forward pass
+        for kind in kinds:
+            inference.registry.evict(kind)
+        started = time.perf_counter()
+        for kind in kinds:
+            inference.registry.get(kind)
+        run_batch(sample[None])
+        cold_start = time.perf_counter() - started
+        status = inference.registry.status()["models"]
+
+        stages = {}
+        for label, data in images.items():
+            timings = {name: [] for name in ["decode", "preprocess", "forward", "catalogue", "postprocess"]}
+            for _ in range(repeats):
+                # The serving decode: JPEG draft mode and the reducing_gap resize to 224x224
+                array, ms = timed(decode_upload, io.BytesIO(data))
+                timings["decode"].append(ms)
+                batch = array[None]
+                _, ms = timed(preprocess, model_type, batch)
+                timings["preprocess"].append(ms)
+                # Runners scale their own input, so forward includes that (cheap) step again
+                probs, ms = timed(run_batch, array[None])
+                timings["forward"].append(ms)
+                varieties, ms = timed(catalogue.model_type_catalogue, model_type)
+                timings["catalogue"].append(ms)
+                _, ms = timed(inference.top_k_varieties, probs[0], 3, varieties)
+                timings["postprocess"].append(ms)
+            stages[label] = {name: summarize(values) for name, values in timings.items()}
+            self.stdout.write(f"  {label:>4} image: " + ", ".join(
+                f"{name} {s['p50_ms']:.1f}" for name, s in stages[label].items()) + " ms (p50)")
+
+        throughput = []
+        for size in batch_sizes:
+            batch = np.stack([sample] * size)
+            run_batch(batch)  # warm-up for this shape
+            timings = [timed(run_batch, batch)[1] for _ in range(repeats)]
+            row = {"batch_size": size, **summarize(timings),
+                   "images_per_s": size / (float(np.median(timings)) / 1000.0)}
+            throughput.append(row)
+            self.stdout.write(f"  batch {size:3d}: {row['p50_ms']:8.1f} ms, {row['images_per_s']:7.1f} images/s")
+
+        memory = process_memory() or {}
+        return {
+            "cold_start_s": cold_start,
+            "load_seconds": {kind: status[kind]["load_seconds"] for kind in kinds},
+            "backends": sorted({status[kind]["backend"] or "?" for kind in kinds}),
+            "stages": stages,
+            "throughput": throughput,
+            # ru_maxrss is KiB on Linux; this process only ran this model type
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+            "rss_mb": memory.get("rss", 0) / 2**20,
+            "pss_mb": memory.get("pss", 0) / 2**20,
+        }
@@ -0,0 +1,144 @@
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction import features, inference
+from prediction.cascade import CascadeHead
+from prediction.catalogue import invalidate, model_type_catalogue
+from prediction.loaders import CASCADE_FALLBACK, MODEL_NAMES
+from prediction.models import RiceModel
+from prediction.preprocessing import decode_upload
+from prediction.uploads import IMAGE_EXTENSIONS
+
+# A threshold no softmax probability reaches: the class is always escalated
+ALWAYS_ESCALATE = 1.01
+
+
+def class_threshold(confidence, correct, target_precision):
+    """Smallest confidence at which the head's answers for one class reach ``target_precision``."""
+    if not len(confidence):
+        return ALWAYS_ESCALATE
+    order = np.argsort(-confidence)
+    precision = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    reached = np.flatnonzero(precision >= target_precision)
+    return float(confidence[order][reached[-1]]) if len(reached) else ALWAYS_ESCALATE
+
+
+class Command(BaseCommand):
+    help = ('Fit the MobileNetV2 head of model_type=cascade on a labelled image folder and pick '
+            'per-class confidence thresholds; reports head accuracy and the escalation rate')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', required=True,
+                            help='One subdirectory of images per variety, named exactly like the variety')
+        parser.add_argument('--val-fraction', type=float, default=0.3,
+                            help='Share of each variety held out to choose the thresholds')
+        parser.add_argument('--target-precision', type=float, default=0.98,
+                            help='Precision the head must reach on a class before it may answer it alone')
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--skip-fallback', action='store_true',
+                            help=f'Do not run {CASCADE_FALLBACK} on escalated images to report cascade accuracy')
+        parser.add_argument('--dry-run', action='store_true', help='Fit and report without updating RiceModel')
+
+    def handle(self, *args, **options):
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.model_selection import train_test_split
+
+        labels, paths, targets = self.collect(options['data_dir'])
+        # Calibration images must not land in the serving feature store
+        features.FEATURE_STORE_DIR = None
+
+        self.stdout.write(f'Computing MobileNetV2 features for {len(paths)} images in {len(labels)} varieties')
+        images = np.stack([decode_upload(p) for p in paths])
+        feats = np.concatenate([
+            inference.mobilenetv2_features(images[i:i + options['batch_size']])
+            for i in range(0, len(images), options['batch_size'])
+        ])
+
+        train, val = train_test_split(np.arange(len(paths)), test_size=options['val_fraction'],
+                                      stratify=targets, random_state=0)
+        classifier = LogisticRegression(max_iter=2000)
+        classifier.fit(feats[train], targets[train])
+        weights, bias = classifier.coef_.T, classifier.intercept_
+        if len(labels) == 2:
+            # Binary fits one logit; softmax([0, z]) gives the same probabilities
+            weights = np.hstack([np.zeros_like(weights), weights])
+            bias = np.concatenate([[0.0], bias])
+
+        head = CascadeHead(weights, bias, np.full(len(labels), ALWAYS_ESCALATE))
+        probs = head.predict_proba(feats[val])
+        predicted = probs.argmax(axis=1)
+        confidence = probs.max(axis=1)
+        correct = predicted == targets[val]
+        head.thresholds = np.array([
+            class_threshold(confidence[predicted == c], correct[predicted == c], options['target_precision'])
+            for c in range(len(labels))
+        ], dtype=np.float32)
+
+        confident = head.confident(probs)
+        self.stdout.write(f'Head accuracy on {len(val)} held-out images: {correct.mean():.1%}')
+        self.stdout.write(f'Answered by the head: {confident.mean():.1%} '
+                          f'(accuracy {correct[confident].mean() if confident.any() else 0.0:.1%}), '
+                          f'escalation rate {1 - confident.mean():.1%}')
+        never = [labels[c] for c in range(len(labels)) if head.thresholds[c] > 1.0]
+        if never:
+            self.stdout.write(self.style.WARNING(f'Always escalated ({len(never)}): {", ".join(never)}'))
+
+        if not options['skip_fallback'] and (~confident).any():
+            self.report_cascade_accuracy(labels, images[val], targets[val], predicted, confident)
+
+        if options['dry_run']:
+            return
+        self.save(head, labels)
+
+    def collect(self, data_dir):
+        root = Path(data_dir)
+        if not root.is_dir():
+            raise CommandError(f'{data_dir} is not a directory')
+        labels, paths, targets = [], [], []
+        for folder in sorted(p for p in root.iterdir() if p.is_dir()):
+            files = sorted(p for p in folder.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+            if len(files) < 2:
+                self.stdout.write(self.style.WARNING(f'{folder.name}: fewer than 2 images, skipping.'))
+                continue
+            targets += [len(labels)] * len(files)
+            labels.append(folder.name)
+            paths += files
+        if len(labels) < 2:
+            raise CommandError(f'Need at least two variety folders with images under {data_dir}')
+        return labels, paths, np.array(targets)
+
+    def report_cascade_accuracy(self, labels, images, targets, predicted, confident):
+        unsure = np.flatnonzero(~confident)
+        try:
+            escalated = np.concatenate([
+                inference.RUNNERS[CASCADE_FALLBACK](images[unsure[i:i + 32]])
+                for i in range(0, len(unsure), 32)
+            ])
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'Could not run {CASCADE_FALLBACK} on escalated images: {e}'))
+            return
+        fallback_labels = model_type_catalogue(CASCADE_FALLBACK).labels
+        answers = [labels[c] for c in predicted]
+        for row, probs in zip(unsure, escalated):
+            answers[row] = fallback_labels[int(np.argmax(probs))]
+        accuracy = np.mean([answer == labels[t] for answer, t in zip(answers, targets)])
+        self.stdout.write(f'Cascade accuracy with {CASCADE_FALLBACK} fallback: {accuracy:.1%}')
+
+    def save(self, head, labels):
+        name = MODEL_NAMES['cascade_head']
+        rice_model = RiceModel.objects.filter(name=name).first() or RiceModel(name=name)
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'cascade_head.npz')
+            head.save(path)
+            with open(path, 'rb') as f:
+                rice_model.model_file.save('cascade_head.npz', File(f), save=False)
+        rice_model.class_names = list(labels)
+        rice_model.is_active = True
+        rice_model.save()
+        invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Saved {name} to {rice_model.model_file.name}'))
@@ -0,0 +1,108 @@
+import io
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction.catalogue import catalogue, labels_for
+from prediction.loaders import MODEL_NAMES, load_vit_eager
+from prediction.models import RiceModel
+from prediction.preprocessing import IMAGE_SIZE, decode_upload, vit_preprocess
+from prediction.runtime import configure_torch
+from prediction.uploads import IMAGE_EXTENSIONS
+
+from .bench_predict import DEFAULT_NUM_CLASSES, synthetic_grains
+
+
+class Command(BaseCommand):
+    help = ('Compare the optimized (int8, traced) ViT with the fp32 model on the same images: '
+            'top-1 agreement, probability drift, accuracy on labelled folders and speed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir',
+                            help='Rice images; subfolders named after a variety also score accuracy '
+                                 '(default: synthetic grain images)')
+        parser.add_argument('--samples', type=int, default=256)
+        parser.add_argument('--batch-size', type=int, default=16)
+        parser.add_argument('--runs', type=int, default=10, help='Timed runs per batch size')
+        parser.add_argument('--min-agreement', type=float, default=0.99,
+                            help='Fail when fewer predictions than this agree with fp32')
+
+    def handle(self, *args, **options):
+        torch = configure_torch()
+        from prediction.torch_backend import OptimizedViT
+
+        rice_model = RiceModel.objects.filter(is_active=True, name=MODEL_NAMES['vit']).first()
+        if rice_model is None or not rice_model.model_file:
+            self.stdout.write(self.style.WARNING('No active ViT weights; comparing random weights.'))
+            rice_model = None
+            varieties = catalogue([f'class_{i}' for i in range(DEFAULT_NUM_CLASSES)])
+        else:
+            varieties = catalogue(labels_for(rice_model))
+
+        images, targets = self.load_images(options['data_dir'], options['samples'], varieties)
+        fp32 = load_vit_eager(rice_model, len(varieties))
+        optimized = OptimizedViT(fp32, warm_up_batch_sizes=(1, options['batch_size']))
+        optimized.warm_up()
+
+        def run_fp32(batch):
+            with torch.inference_mode():
+                return fp32(pixel_values=batch).logits
+
+        reference, candidate = [], []
+        for start in range(0, len(images), options['batch_size']):
+            batch = torch.from_numpy(vit_preprocess(images[start:start + options['batch_size']])).permute(0, 3, 1, 2)
+            reference.append(torch.softmax(run_fp32(batch), dim=1).numpy())
+            candidate.append(torch.softmax(optimized(batch), dim=1).numpy())
+        reference, candidate = np.concatenate(reference), np.concatenate(candidate)
+
+        agreement = float(np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1)))
+        drift = np.abs(reference - candidate)
+        self.stdout.write(f'{len(images)} images: top-1 agreement {agreement:.2%}, '
+                          f'max |dp| {drift.max():.4f}, mean |dp| of the top class '
+                          f'{np.mean(drift[np.arange(len(images)), reference.argmax(axis=1)]):.4f}')
+        labelled = targets >= 0
+        if labelled.any():
+            self.stdout.write(f'Accuracy on {labelled.sum()} labelled images: '
+                              f'fp32 {np.mean(reference[labelled].argmax(axis=1) == targets[labelled]):.2%}, '
+                              f'optimized {np.mean(candidate[labelled].argmax(axis=1) == targets[labelled]):.2%}')
+
+        for size in sorted({1, options['batch_size']}):
+            batch = torch.from_numpy(vit_preprocess(np.resize(images, (size,) + images.shape[1:]))).permute(0, 3, 1, 2)
+            fp32_ms = self.time_call(lambda: run_fp32(batch), options['runs'])
+            optimized_ms = self.time_call(lambda: optimized(batch), options['runs'])
+            self.stdout.write(f'batch {size:3d}: fp32 {fp32_ms:8.1f} ms, optimized {optimized_ms:8.1f} ms '
+                              f'({fp32_ms / optimized_ms:.1f}x)')
+
+        if rice_model is None:
+            # Near-uniform random-weight probabilities flip their argmax on tiny differences
+            self.stdout.write(self.style.WARNING('Agreement is only meaningful with trained weights.'))
+            return
+        if agreement < options['min_agreement']:
+            raise CommandError(f'Top-1 agreement {agreement:.2%} is below --min-agreement {options["min_agreement"]:.2%}')
+        self.stdout.write(self.style.SUCCESS('The optimized ViT matches fp32; PREDICTION_VIT_OPTIMIZED=True is safe'))
+
+    def load_images(self, directory, limit, varieties):
+        """uint8 images and their catalogue index (-1 when the folder is not a variety)."""
+        if not directory:
+            images = [decode_upload(io.BytesIO(synthetic_grains(IMAGE_SIZE, grains=6, seed=i))) for i in range(limit)]
+            return np.stack(images), np.full(limit, -1)
+        paths = sorted(p for p in Path(directory).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not paths:
+            raise CommandError(f'No images found under {directory}')
+        if len(paths) > limit:
+            rng = np.random.default_rng(0)
+            paths = [paths[i] for i in sorted(rng.choice(len(paths), limit, replace=False))]
+        targets = [varieties.index(p.parent.name) for p in paths]
+        return (np.stack([decode_upload(p) for p in paths]),
+                np.array([-1 if t is None else t for t in targets]))
+
+    def time_call(self, fn, runs):
+        fn()
+        timings = []
+        for _ in range(max(1, runs)):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000.0)
+        return float(np.median(timings))
@@ -0,0 +1,243 @@
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction.loaders import MODEL_NAMES, build_vgg16_keras, build_mobilenetv2_keras, load_vit_eager
+from prediction.catalogue import catalogue, labels_for
+from prediction.models import RiceModel
+from prediction.preprocessing import IMAGE_SIZE, decode_upload, unit_scale, vgg_preprocess, mobilenet_preprocess
+from prediction.uploads import IMAGE_EXTENSIONS
+
+from .bench_predict import synthetic_grains
+
+# Inputs each Keras trunk sees in production. Int8 activation ranges only fit one input
+# convention, so the VGG16 trunk (unit_scale for vgg16, vgg_preprocess for the ensemble
+# features) is exported as float16 only.
+KERAS_PREPROCESSING = {
+    # (preprocess, output it is served for; None for single-output models)
+    'vgg16': (build_vgg16_keras, [(unit_scale, 'probs'), (vgg_preprocess, 'features')]),
+    'mobilenetv2': (build_mobilenetv2_keras, [(mobilenet_preprocess, None)]),
+}
+
+
+class Command(BaseCommand):
+    help = 'Export the active rice models to TFLite (float16 / int8) and TorchScript and record them on RiceModel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', nargs='+', choices=['vgg16', 'mobilenetv2', 'vit'],
+                            default=['vgg16', 'mobilenetv2', 'vit'])
+        parser.add_argument('--calibration-dir',
+                            help='Directory of representative rice images used to calibrate the int8 export')
+        parser.add_argument('--calibration-samples', type=int, default=200)
+        parser.add_argument('--serve', choices=['float16', 'int8'], default='float16',
+                            help='Which TFLite variant to record as RiceModel.tflite_file')
+        parser.add_argument('--runs', type=int, default=20, help='Timed single-image runs per model')
+        parser.add_argument('--check-samples', type=int, default=64,
+                            help='Images compared with the Keras model before an export is recorded')
+        parser.add_argument('--min-agreement', type=float, default=0.99,
+                            help='Minimum top-1 agreement with Keras on the probability outputs')
+        parser.add_argument('--min-cosine', type=float, default=0.99,
+                            help='Minimum mean cosine similarity with Keras on the feature outputs')
+        parser.add_argument('--safetensors', action='store_true',
+                            help='Serve the ViT from a .safetensors checkpoint (memory-mapped, shared between '
+                                 'workers): record it as the row\'s model_file instead of a TorchScript export')
+        parser.add_argument('--dry-run', action='store_true', help='Export and measure without updating RiceModel')
+
+    def handle(self, *args, **options):
+        calibration = self.load_calibration_images(options['calibration_dir'], options['calibration_samples'])
+        if calibration is None:
+            self.stdout.write(self.style.WARNING('No --calibration-dir given; skipping int8 exports.'))
+
+        with tempfile.TemporaryDirectory() as workdir:
+            for kind in options['models']:
+                rice_model = RiceModel.objects.filter(is_active=True, name=MODEL_NAMES[kind]).first()
+                if rice_model is None or not os.path.exists(rice_model.model_file.path):
+                    self.stdout.write(self.style.ERROR(f'{MODEL_NAMES[kind]} model file not found, skipping.'))
+                    continue
+                num_classes = len(catalogue(labels_for(rice_model)))
+                if kind == 'vit':
+                    self.export_vit(rice_model, num_classes, workdir, options)
+                else:
+                    self.export_keras(kind, rice_model, num_classes, calibration, workdir, options)
+
+    def check_images(self, calibration, limit):
+        """Images for the agreement check: the calibration set, else synthetic grain images."""
+        if calibration is not None:
+            return calibration[:limit]
+        return np.stack([decode_upload(io.BytesIO(synthetic_grains(IMAGE_SIZE, grains=6, seed=i)))
+                         for i in range(limit)])
+
+    def load_calibration_images(self, directory, limit):
+        if not directory:
+            return None
+        paths = sorted(p for p in Path(directory).rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not paths:
+            raise CommandError(f'No images found under {directory}')
+        rng = np.random.default_rng(0)
+        if len(paths) > limit:
+            paths = [paths[i] for i in sorted(rng.choice(len(paths), limit, replace=False))]
+        self.stdout.write(f'Calibrating int8 on {len(paths)} images from {directory}')
+        return np.stack([decode_upload(p) for p in paths])
+
+    # -----------------------------
+    # TFLite (VGG16 / MobileNetV2)
+    # -----------------------------
+    def export_keras(self, kind, rice_model, num_classes, calibration, workdir, options):
+        import tensorflow as tf
+        from prediction.tflite_backend import TFLiteModel
+
+        build, preprocessors = KERAS_PREPROCESSING[kind]
+        model = build(rice_model, num_classes)
+
+        sample = preprocessors[0][0](np.random.default_rng(0).integers(0, 256, (1, *IMAGE_SIZE, 3), dtype=np.uint8))
+        baseline_ms = self.time_call(lambda: model.predict(sample, verbose=0), options['runs'])
+        baseline_size = os.path.getsize(rice_model.model_file.path)
+        self.report(MODEL_NAMES[kind], 'keras', baseline_size, baseline_ms)
+
+        check = self.check_images(calibration, options['check_samples'])
+        expected = []
+        for preprocess, output in preprocessors:
+            inputs = preprocess(check)
+            reference = model.predict(inputs, verbose=0)
+            expected.append((preprocess, inputs, output, reference[output] if output else reference))
+
+        exported = {}
+        for variant in ('float16', 'int8'):
+            if variant == 'int8' and calibration is None:
+                continue
+            if variant == 'int8' and len(preprocessors) > 1:
+                self.stdout.write(self.style.WARNING(
+                    f'{MODEL_NAMES[kind]}: skipping int8, the trunk serves {len(preprocessors)} input ranges'))
+                continue
+            # Straight from the Keras model: a hand-built SavedModel of a Keras 3 model leaves its
+            # weights as unresolved variable reads, and the .tflite file then has no weights
+            converter = tf.lite.TFLiteConverter.from_keras_model(model)
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if variant == 'float16':
+                converter.target_spec.supported_types = [tf.float16]
+            else:
+                converter.representative_dataset = self.representative_dataset(calibration, preprocessors[0][0])
+                # Integer kernels inside, float32 at the edges so callers are unchanged
+                converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+            path = os.path.join(workdir, f'{kind}_{variant}.tflite')
+            with open(path, 'wb') as f:
+                f.write(converter.convert())
+            tflite_model = TFLiteModel(path, pool_size=1)
+            latency_ms = self.time_call(lambda: tflite_model.predict(sample), options['runs'])
+            self.report(MODEL_NAMES[kind], f'tflite {variant}', os.path.getsize(path), latency_ms,
+                        baseline_size, baseline_ms)
+            if self.agrees(f'{MODEL_NAMES[kind]} [tflite {variant}]', tflite_model, expected, options):
+                exported[variant] = path
+
+        chosen = exported.get(options['serve']) or exported.get('float16')
+        if not chosen:
+            self.stdout.write(self.style.ERROR(f'No TFLite export of {MODEL_NAMES[kind]} matches Keras; '
+                                               f'tflite_file left unchanged.'))
+        if chosen and not options['dry_run']:
+            with open(chosen, 'rb') as f:
+                name = f"{Path(rice_model.model_file.name).stem}.{Path(chosen).stem.split('_')[-1]}.tflite"
+                rice_model.tflite_file.save(name, File(f), save=True)
+            self.stdout.write(self.style.SUCCESS(f'Recorded {rice_model.tflite_file.name} on {rice_model.name}'))
+
+    @staticmethod
+    def representative_dataset(calibration, preprocess):
+        def generate():
+            for image_array in calibration:
+                yield [preprocess(image_array[np.newaxis])]
+        return generate
+
+    def agrees(self, label, tflite_model, expected, options):
+        """Compare the served output of every input convention with Keras on the check images."""
+        ok = True
+        for preprocess, inputs, output, want in expected:
+            got = tflite_model.predict(inputs)
+            if output:
+                got = got[output]
+            if output == 'probs':
+                score, minimum = float(np.mean(want.argmax(axis=1) == got.argmax(axis=1))), options['min_agreement']
+                line = f'{label} {preprocess.__name__}: top-1 agreement {score:.2%}'
+            else:
+                norms = np.linalg.norm(want, axis=1) * np.linalg.norm(got, axis=1)
+                cosine = np.sum(want * got, axis=1) / np.maximum(norms, np.finfo(np.float32).tiny)
+                score, minimum = float(np.mean(cosine)), options['min_cosine']
+                line = f'{label} {preprocess.__name__}: mean feature cosine similarity {score:.4f}'
+            if not score >= minimum:  # NaN outputs fail too
+                ok = False
+                self.stdout.write(self.style.ERROR(f'{line} (below {minimum})'))
+            else:
+                self.stdout.write(line)
+        return ok
+
+    # -----------------------------
+    # TorchScript (ViT)
+    # -----------------------------
+    def export_vit(self, rice_model, num_classes, workdir, options):
+        import torch
+        from prediction.torch_backend import LogitsOnly
+
+        model = load_vit_eager(rice_model, num_classes)
+        example = torch.randn(1, 3, *IMAGE_SIZE)
+
+        with torch.no_grad():
+            baseline_ms = self.time_call(lambda: model(example), options['runs'])
+            traced = torch.jit.trace(LogitsOnly(model).eval(), example, strict=False)
+            traced_ms = self.time_call(lambda: traced(example), options['runs'])
+        baseline_size = os.path.getsize(rice_model.model_file.path)
+        self.report(MODEL_NAMES['vit'], 'eager', baseline_size, baseline_ms)
+
+        path = os.path.join(workdir, 'vit_torchscript.pt')
+        traced.save(path)
+        self.report(MODEL_NAMES['vit'], 'torchscript', os.path.getsize(path), traced_ms, baseline_size, baseline_ms)
+
+        if options['safetensors']:
+            # The loader prefers TorchScript, which torch.jit.load reads into private memory
+            self.export_safetensors(model, rice_model, workdir, options)
+        elif not options['dry_run']:
+            with open(path, 'rb') as f:
+                rice_model.torchscript_file.save(f'{Path(rice_model.model_file.name).stem}.torchscript.pt',
+                                                 File(f), save=True)
+            self.stdout.write(self.style.SUCCESS(f'Recorded {rice_model.torchscript_file.name} on {rice_model.name}'))
+
+    def export_safetensors(self, model, rice_model, workdir, options):
+        from safetensors.torch import save_file
+
+        path = os.path.join(workdir, 'vit.safetensors')
+        save_file({name: tensor.contiguous() for name, tensor in model.state_dict().items()}, path)
+        self.stdout.write(f"{MODEL_NAMES['vit']} [safetensors]: {os.path.getsize(path) / 2**20:.1f} MB")
+        if options['dry_run']:
+            return
+        if not rice_model.model_file.name.endswith('.safetensors'):
+            with open(path, 'rb') as f:
+                rice_model.model_file.save(f'{Path(rice_model.model_file.name).stem}.safetensors', File(f), save=True)
+            self.stdout.write(self.style.SUCCESS(f'Recorded {rice_model.model_file.name} on {rice_model.name}'))
+        if rice_model.torchscript_file:
+            name = rice_model.torchscript_file.name
+            rice_model.torchscript_file.delete(save=True)
+            self.stdout.write(self.style.SUCCESS(f'Removed {name} so the memory-mapped checkpoint is served'))
+
+    # -----------------------------
+    # Measurement
+    # -----------------------------
+    @staticmethod
+    def time_call(fn, runs):
+        fn()  # warm-up: graph tracing, allocation
+        timings = []
+        for _ in range(max(1, runs)):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000.0)
+        return float(np.median(timings))
+
+    def report(self, name, variant, size, latency_ms, baseline_size=None, baseline_ms=None):
+        line = f'{name} [{variant}]: {size / 2**20:.1f} MB, {latency_ms:.1f} ms/image'
+        if baseline_size:
+            line += (f' ({(size - baseline_size) / baseline_size * 100:+.0f}% size,'
+                     f' {(latency_ms - baseline_ms) / baseline_ms * 100:+.0f}% latency)')
+        self.stdout.write(line)
+
@@ -0,0 +1,47 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction.memory import child_pids, process_memory
+
+
+def mb(value):
+    return f"{value / 2**20:9.1f}"
+
+
+class Command(BaseCommand):
+    help = 'Report RSS/PSS of the gunicorn master and workers and the memory saved by sharing model weights'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pid', type=int, help='Gunicorn master pid (default: read GUNICORN_PIDFILE)')
+
+    def handle(self, *args, **options):
+        pid = options['pid']
+        if pid is None:
+            pidfile = getattr(settings, 'GUNICORN_PIDFILE', None)
+            if not pidfile or not os.path.exists(pidfile):
+                raise CommandError('Pass --pid or run gunicorn with gunicorn.conf.py so GUNICORN_PIDFILE exists.')
+            with open(pidfile) as f:
+                pid = int(f.read().strip())
+
+        processes = [('master', pid)] + [('worker', child) for child in child_pids(pid)]
+        self.stdout.write(f"{'role':8} {'pid':>7} {'RSS MB':>9} {'PSS MB':>9} {'shared MB':>9} {'private MB':>10}")
+        total_rss = total_pss = 0
+        workers = 0
+        for role, process in processes:
+            usage = process_memory(process)
+            if usage is None:
+                raise CommandError(f'Cannot read /proc/{process}/smaps_rollup (Linux 4.14+ required).')
+            total_rss += usage['rss']
+            total_pss += usage['pss']
+            workers += role == 'worker'
+            self.stdout.write(f"{role:8} {process:>7} {mb(usage['rss'])} {mb(usage['pss'])} "
+                              f"{mb(usage['shared'])} {mb(usage['private']):>10}")
+
+        saved = total_rss - total_pss
+        self.stdout.write(f"Total RSS {mb(total_rss).strip()} MB, total PSS {mb(total_pss).strip()} MB")
+        self.stdout.write(self.style.SUCCESS(
+            f"Sharing saves {mb(saved).strip()} MB overall"
+            + (f", {mb(saved / workers).strip()} MB per worker" if workers else "")
+        ))
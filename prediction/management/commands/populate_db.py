@@ -44,7 +44,8 @@ class Command(BaseCommand):
                     file_obj = File(f, name=file_name)
                     model, created = RiceModel.objects.get_or_create(
                         name=model_name,
-                        defaults={'model_file': file_obj, 'is_active': True}
+                        # RICE_CLASSES is the output order the models were trained with
+                        defaults={'model_file': file_obj, 'is_active': True, 'class_names': RICE_CLASSES}
                     )
                     if created:
                         self.stdout.write(self.style.SUCCESS(f'Created RiceModel: {model_name}'))
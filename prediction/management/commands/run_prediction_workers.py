@@ -0,0 +1,66 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from prediction.inference import model_watcher
+from prediction.jobs import claim_next_job, requeue_stale_jobs, run_job, worker_name
+
+
+def work(index, poll_interval, once):
+    # Each process opens its own DB connection and loads its own models
+    connections.close_all()
+    model_watcher.start()
+    name = worker_name(index)
+    while True:
+        job = claim_next_job(name)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        print(f"[{name}] Running job {job.pk} ({job.total} images, {job.model_type})")
+        job = run_job(job)
+        print(f"[{name}] Job {job.pk} {job.status} ({job.processed}/{job.total})")
+
+
+class Command(BaseCommand):
+    help = 'Process queued PredictionJobs with a local pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1,
+                            help='Worker processes; each holds its own copy of the models it uses')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue polls when idle')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue running jobs with no progress for this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s).'))
+
+        if options['processes'] <= 1:
+            work(0, options['poll_interval'], options['once'])
+            return
+
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=work, args=(i, options['poll_interval'], options['once']), daemon=True)
+            for i in range(options['processes'])
+        ]
+        for process in workers:
+            process.start()
+        self.stdout.write(self.style.SUCCESS(f'Started {len(workers)} prediction worker(s).'))
+
+        def stop(signum, frame):
+            for process in workers:
+                process.terminate()
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            stop(None, None)
@@ -0,0 +1,49 @@
+"""Per-process memory figures from /proc (Linux only).
+
+RSS counts every resident page a process maps, including pages shared with
+other processes; PSS splits each shared page evenly between its users. The
+gap between the two is what sharing saves: with weights memory-mapped or
+loaded before gunicorn forks, N workers show a large RSS but a small PSS.
+"""
+import os
+
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def process_memory(pid="self"):
+    """Memory of one process in bytes, or None if /proc is not available."""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in SMAPS_FIELDS:
+                    usage[SMAPS_FIELDS[key]] = int(rest.split()[0]) * 1024
+    except OSError:
+        return None
+    usage["shared"] = usage.get("shared_clean", 0) + usage.get("shared_dirty", 0)
+    usage["private"] = usage.get("private_clean", 0) + usage.get("private_dirty", 0)
+    return usage
+
+
+def child_pids(parent):
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 is the parent pid; the command name in field 2 may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == int(parent):
+            children.append(int(entry))
+    return sorted(children)
@@ -0,0 +1,200 @@
+"""Hot-path timing and in-process metrics in the Prometheus text format.
+
+``span(stage)`` times one stage of the current request (started with
+``start_request``) and feeds a per-model_type histogram; the per-request
+spans can also go back to the client as a ``Server-Timing`` header.
+Everything is a lock and a few additions per observation, cheap enough to
+leave on. Counters live in each worker process, so with several gunicorn
+workers every scrape sees the worker that answered it; the ``pid`` label
+on ``prediction_process_info`` tells them apart.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Seconds; spans from sub-millisecond cache hits to multi-second cold loads
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts, then count and sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        for key, counts in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": repr(float(bound))}, cumulative
+            yield f"{self.name}_bucket", {**labels, "le": "+Inf"}, counts[-2]
+            yield f"{self.name}_count", labels, counts[-2]
+            yield f"{self.name}_sum", labels, counts[-1]
+
+
+class Gauge:
+    """A value read when scraped: ``collect()`` returns ``[(labels, value), ...]``.
+
+    ``type="counter"`` exposes a running total kept elsewhere (e.g. cache hits).
+    """
+
+    def __init__(self, name, documentation, collect, type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.type = type
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, labels, value
+
+
+_metrics = OrderedDict()
+
+
+def register(metric):
+    _metrics[metric.name] = metric
+    return metric
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for metric in _metrics.values():
+        try:
+            samples = list(metric.samples())
+        except Exception as e:  # one broken gauge must not take the endpoint down
+            print(f"[ERROR] Could not collect {metric.name}: {e}")
+            continue
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in samples:
+            lines.append(f"{name}{format_labels(labels)} {float(value)!r}")
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_SECONDS = register(Histogram(
+    "prediction_request_seconds", "Time to answer one predict request", ["model_type", "cached"]))
+STAGE_SECONDS = register(Histogram(
+    "prediction_stage_seconds", "Time spent in each stage of a predict request", ["model_type", "stage"]))
+REQUESTS = register(Counter(
+    "prediction_requests_total", "Predict requests by outcome", ["model_type", "status"]))
+BATCH_SECONDS = register(Histogram(
+    "prediction_batch_seconds", "Forward-pass time of one micro-batch", ["model"]))
+BATCH_SIZE = register(Histogram(
+    "prediction_batch_size", "Samples per micro-batch", ["model"], buckets=(1, 2, 4, 8, 16, 32, 64)))
+MODEL_SECONDS = register(Histogram(
+    "prediction_model_seconds", "Time spent in one model kind per batch", ["kind"]))
+register(Gauge(
+    "prediction_process_info", "Worker process answering this scrape", lambda: [({"pid": os.getpid()}, 1)]))
+
+
+# -----------------------------
+# Per-request spans
+# -----------------------------
+class RequestTimings:
+    def __init__(self, model_type):
+        self.model_type = model_type
+        self.started = time.perf_counter()
+        self.spans = OrderedDict()
+
+    def add(self, stage, ms):
+        """Record a stage measured elsewhere (e.g. on a batcher thread), in milliseconds."""
+        self.spans[stage] = self.spans.get(stage, 0.0) + ms
+        STAGE_SECONDS.observe(ms / 1000.0, model_type=self.model_type, stage=stage)
+
+    def finish(self, status, cached=False):
+        elapsed = time.perf_counter() - self.started
+        self.spans["total"] = elapsed * 1000.0
+        REQUEST_SECONDS.observe(elapsed, model_type=self.model_type, cached="true" if cached else "false")
+        REQUESTS.inc(model_type=self.model_type, status=status)
+
+    def server_timing(self):
+        return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in self.spans.items())
+
+
+_current = contextvars.ContextVar("prediction_request_timings", default=None)
+
+
+def start_request(model_type):
+    timings = RequestTimings(model_type)
+    _current.set(timings)
+    return timings
+
+
+@contextmanager
+def span(stage):
+    """Time ``stage`` of the current request; a no-op outside a request."""
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.add(stage, (time.perf_counter() - started) * 1000.0)
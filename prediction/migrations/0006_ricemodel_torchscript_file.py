@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prediction', '0005_delete_ensemblemodel_delete_vgg16model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ricemodel',
+            name='torchscript_file',
+            field=models.FileField(blank=True, help_text='Path to the TorchScript (.pt) export of a PyTorch model', null=True, upload_to='models/'),
+        ),
+    ]
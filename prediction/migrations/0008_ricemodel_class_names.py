@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+def pin_current_label_order(apps, schema_editor):
+    """Existing models were trained on the varieties as they are now, alphabetically."""
+    RiceInfo = apps.get_model('prediction', 'RiceInfo')
+    RiceModel = apps.get_model('prediction', 'RiceModel')
+    labels = list(RiceInfo.objects.order_by('variety_name').values_list('variety_name', flat=True))
+    if labels:
+        RiceModel.objects.filter(class_names=[]).update(class_names=labels)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prediction', '0007_predictionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ricemodel',
+            name='class_names',
+            field=models.JSONField(blank=True, default=list, help_text="Variety names in the order of the model's outputs, as it was trained. Empty: every RiceInfo variety, alphabetically"),
+        ),
+        migrations.RunPython(pin_current_label_order, migrations.RunPython.noop),
+    ]
@@ -46,6 +46,20 @@ class RiceModel(models.Model):
         help_text="Path to the .tflite model file"
     )
 
+    torchscript_file = models.FileField(
+        upload_to='models/',
+        null=True,
+        blank=True,
+        help_text="Path to the TorchScript (.pt) export of a PyTorch model"
+    )
+
+    class_names = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Variety names in the order of the model's outputs, as it was trained. "
+                  "Empty: every RiceInfo variety, alphabetically"
+    )
+
     is_active = models.BooleanField(
         default=False,
         help_text="Whether this model is currently active"
@@ -61,3 +75,55 @@ class RiceModel(models.Model):
 
     def __str__(self):
         return f"{self.name} ({'Active' if self.is_active else 'Inactive'})"
+
+class PredictionJob(models.Model):
+    """Bulk prediction queued by the web app and processed by run_prediction_workers."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    model_type = models.CharField(
+        max_length=20,
+        default='vgg16',
+        help_text="Prediction model_type used for every image in the job"
+    )
+
+    upload = models.FileField(
+        upload_to='jobs/',
+        help_text="Zip archive of the images to classify"
+    )
+
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+        db_index=True
+    )
+
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    results = models.JSONField(default=list, blank=True)
+    summary = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Prediction Job"
+        verbose_name_plural = "Prediction Jobs"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status}, {self.processed}/{self.total})"
@@ -0,0 +1,68 @@
+import numpy as np
+from PIL import Image
+
+IMAGE_SIZE = (224, 224)
+
+# Channel means used by the caffe-style VGG16 preprocess_input (BGR order)
+VGG_BGR_MEAN = np.array([103.939, 116.779, 123.68], dtype=np.float32)
+
+# ImageNet normalisation of the ViT folded into one multiply-add on [0, 255] pixels:
+# (x / 255 - mean) / std = x * (1 / (255 * std)) - mean / std
+VIT_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+VIT_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+VIT_SCALE = (1.0 / (255.0 * VIT_STD)).astype(np.float32)
+VIT_OFFSET = (VIT_MEAN / VIT_STD).astype(np.float32)
+
+
+# resize() first shrinks by an integer factor with a box filter while the image
+# is at least this many times the target, then resamples the rest
+REDUCING_GAP = 3.0
+
+
+def check_dimensions(img, max_pixels=None):
+    """Reject images whose header declares more than ``max_pixels`` pixels."""
+    width, height = img.size
+    if max_pixels and width * height > max_pixels:
+        raise ValueError(f"Image is {width}x{height}; at most {max_pixels / 1e6:.0f} megapixels are accepted")
+
+
+def decode_upload(image_file, size=IMAGE_SIZE, max_pixels=None):
+    """Decode an uploaded image once into a (H, W, 3) uint8 array at ``size``.
+
+    JPEGs are decoded in draft mode: libjpeg scales the DCT by 1/2, 1/4 or
+    1/8 while decoding, to the smallest size still at least ``size``, so a
+    phone photo never exists in memory at full resolution. Other formats are
+    shrunk with ``reduce`` before the final resample.
+    """
+    with Image.open(image_file) as img:
+        check_dimensions(img, max_pixels)
+        if img.format == "JPEG":
+            img.draft("RGB", size)
+        img = img.convert("RGB")
+        if img.size != size:
+            img = img.resize(size, reducing_gap=REDUCING_GAP)
+        return np.asarray(img, dtype=np.uint8)
+
+
+def unit_scale(batch):
+    """[0, 255] uint8 -> [0, 1] float32, as the VGG16 classifier was trained."""
+    return batch.astype(np.float32) * np.float32(1.0 / 255.0)
+
+
+def vgg_preprocess(batch):
+    """Vectorized equivalent of keras' vgg16.preprocess_input (RGB -> BGR, mean-centred)."""
+    return batch[..., ::-1].astype(np.float32) - VGG_BGR_MEAN
+
+
+def vit_preprocess(batch):
+    """Vectorized equivalent of the ViT's ToTensor + ImageNet Normalize, kept in NHWC order.
+
+    ``torch.from_numpy(out).permute(0, 3, 1, 2)`` is then the (N, 3, H, W)
+    input as a channels-last view, without another copy.
+    """
+    return batch.astype(np.float32) * VIT_SCALE - VIT_OFFSET
+
+
+def mobilenet_preprocess(batch):
+    """Vectorized equivalent of keras' mobilenet_v2.preprocess_input ([-1, 1])."""
+    return batch.astype(np.float32) * np.float32(1.0 / 127.5) - np.float32(1.0)
@@ -0,0 +1,352 @@
+import gc
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import row_version
+from .catalogue import labels_for
+from .loaders import LOADERS, MODEL_NAMES, model_file_size
+
+UNLOADED = "unloaded"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelNotAvailable(Exception):
+    """Raised when a model kind has no active RiceModel row or weights file."""
+
+
+class ModelEntry:
+    def __init__(self, kind):
+        self.kind = kind
+        self.state = UNLOADED
+        self.value = None
+        self.backend = None
+        self.size = 0
+        self.rice_model_id = None
+        self.rice_model_updated_at = None
+        # Cache-key token and class order of the loaded row; they follow the
+        # weights actually served, not the database, across a hot swap
+        self.version = None
+        self.labels = None
+        self.swaps = 0
+        self.error = None
+        self.loaded_at = None
+        self.last_used = None
+        self.load_seconds = None
+        self.lock = threading.Lock()
+
+    def as_dict(self):
+        return {
+            "state": self.state,
+            "backend": self.backend,
+            "rice_model_id": self.rice_model_id,
+            "rice_model_updated_at": self.rice_model_updated_at.isoformat() if self.rice_model_updated_at else None,
+            "size_mb": round(self.size / 2**20, 1),
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "swaps": self.swaps,
+            "last_used": self.last_used,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    """Loads RiceModel-backed models on first use and keeps the recently used ones.
+
+    Entries are kept in least-recently-used order. When loading a model would
+    push the estimated resident size past ``memory_budget_mb``, the least
+    recently used ready models are dropped first. The budget is soft: a model
+    still referenced by a running batch stays alive until that batch finishes.
+
+    When a loaded model's RiceModel row changes, ``refresh`` builds and warms
+    the new version on a background thread while requests keep using the old
+    one, then swaps it in under the entry lock.
+    """
+
+    def __init__(self, loaders=None, memory_budget_mb=None, num_classes=None, random_weights=False):
+        self.loaders = loaders or LOADERS
+        # Build missing models with random weights instead of failing (benchmarks only)
+        self.random_weights = random_weights
+        self.memory_budget = int(memory_budget_mb * 2**20) if memory_budget_mb else None
+        self.num_classes = num_classes
+        self._entries = OrderedDict((kind, ModelEntry(kind)) for kind in self.loaders)
+        self._lock = threading.Lock()
+        # One swap at a time: two new versions are never resident alongside the old ones
+        self._swapper = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-swap")
+
+    def get(self, kind):
+        """Return the loaded model for ``kind``, loading it if needed."""
+        entry = self._entries[kind]
+        with entry.lock:
+            if entry.state != READY:
+                self._load(entry)
+            entry.last_used = time.time()
+            value = entry.value
+        with self._lock:
+            self._entries.move_to_end(kind)
+        return value
+
+    def loaded(self, kind):
+        """The ready entry for ``kind``, or None when it is not loaded."""
+        entry = self._entries.get(kind)
+        return entry if entry is not None and entry.state == READY else None
+
+    def _active_row(self, kind):
+        from .models import RiceModel
+
+        rice_model = RiceModel.objects.filter(is_active=True, name=MODEL_NAMES[kind]).first()
+        if rice_model is None or not rice_model.model_file or not os.path.exists(rice_model.model_file.path):
+            return None
+        return rice_model
+
+    def _install(self, entry, value, rice_model, size, load_seconds):
+        entry.value = value
+        entry.load_seconds = load_seconds
+        entry.backend = getattr(value, "backend", "native")
+        entry.size = size
+        entry.rice_model_id = rice_model.pk
+        entry.rice_model_updated_at = rice_model.updated_at
+        entry.version = row_version(rice_model)
+        entry.labels = labels_for(rice_model)
+        entry.loaded_at = time.time()
+        entry.error = None
+        entry.state = READY
+
+    def _load(self, entry):
+        rice_model = self._active_row(entry.kind)
+        if rice_model is None:
+            if self.random_weights:
+                return self._load_random(entry)
+            entry.state = FAILED
+            entry.error = f"{MODEL_NAMES[entry.kind]} model file not found"
+            print("[ERROR]", entry.error)
+            raise ModelNotAvailable(entry.error)
+
+        size = model_file_size(rice_model)
+        self._make_room(size, keep=entry.kind)
+        entry.state = LOADING
+        entry.error = None
+        started = time.perf_counter()
+        try:
+            value = self.loaders[entry.kind](rice_model, self.num_classes(rice_model))
+        except Exception as e:
+            traceback.print_exc()
+            entry.state = FAILED
+            entry.error = str(e)
+            raise
+        self._install(entry, value, rice_model, size, time.perf_counter() - started)
+
+    def _load_random(self, entry):
+        entry.state = LOADING
+        started = time.perf_counter()
+        entry.value = self.loaders[entry.kind](None, self.num_classes(None))
+        entry.load_seconds = time.perf_counter() - started
+        entry.backend = "random"
+        entry.rice_model_id = None
+        entry.rice_model_updated_at = None
+        entry.version = "random"
+        entry.labels = None
+        entry.loaded_at = time.time()
+        entry.state = READY
+
+    # -----------------------------
+    # Hot swapping
+    # -----------------------------
+    def refresh(self, kind):
+        """Swap in the active RiceModel row of ``kind`` in the background if it changed.
+
+        Returns the future of the swap, which resolves to True if a new
+        version was swapped in.
+        """
+        return self._swapper.submit(self._swap, kind)
+
+    def _swap(self, kind):
+        from django.db import connection
+
+        entry = self._entries[kind]
+        try:
+            if entry.state != READY:
+                return False  # the next get() loads whatever is active then
+            rice_model = self._active_row(kind)
+            if rice_model is None:
+                if entry.rice_model_id is not None:
+                    # Deactivated or deleted: stop serving the old weights
+                    self.evict(kind)
+                return False
+            if (rice_model.pk, rice_model.updated_at) == (entry.rice_model_id, entry.rice_model_updated_at):
+                return False
+
+            size = model_file_size(rice_model)
+            # The old version stays resident until the new one is installed
+            self._make_room(entry.size + size, keep=kind)
+            started = time.perf_counter()
+            value = self.loaders[kind](rice_model, self.num_classes(rice_model))
+            if getattr(value, "warm_up_seconds", 0) is None:
+                value.warm_up()
+            with entry.lock:
+                # Batches already running keep their reference to the old model
+                self._install(entry, value, rice_model, size, time.perf_counter() - started)
+                entry.swaps += 1
+            gc.collect()
+            print(f"✅ Swapped in {MODEL_NAMES[kind]} (row {rice_model.pk}, {entry.backend}) "
+                  f"in {entry.load_seconds:.1f}s")
+            return True
+        except Exception as e:
+            traceback.print_exc()
+            entry.error = f"Swap failed, still serving the previous version: {e}"
+            print("[ERROR]", entry.error)
+            return False
+        finally:
+            connection.close()
+
+    def _make_room(self, size, keep):
+        if self.memory_budget is None:
+            return
+        with self._lock:
+            lru_order = [e for e in self._entries.values() if e.kind != keep and e.state == READY]
+        resident = sum(e.size for e in lru_order)
+        for victim in lru_order:
+            if resident + size <= self.memory_budget:
+                break
+            resident -= victim.size
+            self.evict(victim.kind)
+
+    def evict(self, kind):
+        """Drop the registry's reference to ``kind`` so its weights can be freed."""
+        entry = self._entries[kind]
+        with entry.lock:
+            if entry.state != READY:
+                return
+            entry.value = None
+            entry.backend = None
+            entry.size = 0
+            entry.version = None
+            entry.labels = None
+            entry.state = UNLOADED
+        gc.collect()
+        print(f"Evicted {MODEL_NAMES[kind]} from memory")
+
+    def resident_bytes(self):
+        return sum(e.size for e in self._entries.values() if e.state == READY)
+
+    def status(self):
+        with self._lock:
+            entries = {kind: entry.as_dict() for kind, entry in self._entries.items()}
+        return {
+            "memory_budget_mb": round(self.memory_budget / 2**20, 1) if self.memory_budget else None,
+            "resident_mb": round(self.resident_bytes() / 2**20, 1),
+            "models": entries,
+        }
+
+
+class WarmUp:
+    """Loads ``kinds`` into a registry once, on a background thread.
+
+    Loading a Keras model also traces and runs its graphs (see
+    ``loaders.compile_keras``); models with a pending ``warm_up()`` (the
+    optimized ViT) are run here. Once this is done no request pays for that. ``status()["ready"]`` backs the readiness endpoint; a kind that
+    fails to load is reported but does not hold readiness back.
+    """
+
+    def __init__(self, registry, kinds):
+        self.registry = registry
+        self.kinds = list(kinds)
+        self.errors = {}
+        self.seconds = None
+        self._thread = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+                self._thread.start()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def _run(self):
+        from django.db import connection
+
+        started = time.perf_counter()
+        try:
+            for kind in self.kinds:
+                try:
+                    model = self.registry.get(kind)
+                    # Models that cannot warm up where they are loaded (see torch_backend) do it here
+                    if getattr(model, "warm_up_seconds", 0) is None:
+                        model.warm_up()
+                except Exception as e:
+                    self.errors[kind] = str(e)
+                    print(f"[ERROR] Could not warm up {kind}: {e}")
+        finally:
+            connection.close()
+            self.seconds = time.perf_counter() - started
+            self._done.set()
+
+    def status(self):
+        return {
+            "ready": self._done.is_set(),
+            "started": self._thread is not None,
+            "models": self.kinds,
+            "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "errors": self.errors,
+        }
+
+
+class ModelWatcher:
+    """Polls RiceModel for changes made by other processes.
+
+    Signals only reach the process that saved the row (the one serving the
+    admin); every other worker notices within ``interval`` seconds through
+    one query for the active rows, and ``on_change(kinds)`` swaps them.
+    """
+
+    def __init__(self, registry, interval, on_change):
+        self.registry = registry
+        self.interval = interval
+        self.on_change = on_change
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self.interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from django.db import connection
+
+        while True:
+            time.sleep(self.interval)
+            try:
+                changed = self.changed_kinds()
+                if changed:
+                    self.on_change(changed)
+            except Exception as e:
+                print(f"[ERROR] Could not check RiceModel for changes: {e}")
+            finally:
+                connection.close()
+
+    def changed_kinds(self):
+        """Loaded kinds whose active row is no longer the one they were loaded from."""
+        from .models import RiceModel
+
+        rows = {name: (pk, updated_at) for name, pk, updated_at in
+                RiceModel.objects.filter(is_active=True).values_list("name", "pk", "updated_at")}
+        changed = []
+        for kind in MODEL_NAMES:
+            entry = self.registry.loaded(kind)
+            if entry is None or (entry.rice_model_id is None and entry.backend == "random"):
+                continue
+            if rows.get(MODEL_NAMES[kind]) != (entry.rice_model_id, entry.rice_model_updated_at):
+                changed.append(kind)
+        return changed
@@ -0,0 +1,126 @@
+"""One thread budget for every numeric runtime in the process.
+
+TensorFlow, PyTorch, XGBoost, TFLite and NumPy's BLAS each default to a
+thread pool as wide as the machine. In one web worker that runs several of
+them at once (and next to other workers) they oversubscribe the CPU, so
+each is sized from ``PREDICTION_THREADS`` per worker instead, with a
+per-runtime override where one needs a different width.
+
+The micro-batchers run their models at the same time (model_type=all runs
+VGG16, the ViT and the ensemble together), so the worker's threads are
+split between the pools that can be busy at once: TensorFlow's (shared by
+every Keras graph, or TFLite's when it serves them) and PyTorch's. XGBoost
+and BLAS only see micro-batch-sized inputs and get one thread each.
+"""
+import os
+from functools import lru_cache
+
+from django.conf import settings
+
+
+def available_cpus():
+    """CPUs this process may run on (respects cgroup/taskset affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS, Windows
+        return os.cpu_count() or 1
+
+
+# gunicorn.conf.py starts this many workers when WEB_CONCURRENCY is not set
+DEFAULT_WEB_WORKERS = 2
+
+
+def web_workers():
+    """Web workers per host: WEB_CONCURRENCY, else DEFAULT_WEB_WORKERS."""
+    return max(1, int(os.environ.get("WEB_CONCURRENCY", DEFAULT_WEB_WORKERS)))
+
+
+def worker_threads():
+    """Threads one worker may use: PREDICTION_THREADS, else CPUs split across workers."""
+    threads = getattr(settings, "PREDICTION_THREADS", None)
+    if threads:
+        return int(threads)
+    return max(1, available_cpus() // web_workers())
+
+
+def concurrent_runtimes():
+    """Thread pools that can be busy at once in a worker (PREDICTION_CONCURRENT_RUNTIMES)."""
+    return max(1, int(getattr(settings, "PREDICTION_CONCURRENT_RUNTIMES", 2)))
+
+
+def threads_for(runtime):
+    """Threads for ``runtime`` (tf_intra, tf_inter, torch, xgboost, tflite, blas)."""
+    override = getattr(settings, "PREDICTION_RUNTIME_THREADS", {}).get(runtime)
+    if override:
+        return int(override)
+    if runtime in ("tf_inter", "xgboost", "blas"):
+        # Each micro-batcher runs one graph at a time, so parallel ops add nothing, and
+        # trees or matrix products over a micro-batch are too small to split
+        return 1
+    return max(1, worker_threads() // concurrent_runtimes())
+
+
+def thread_budget():
+    runtimes = ["tf_intra", "tf_inter", "torch", "xgboost", "tflite", "blas"]
+    return {"cpus": available_cpus(), "web_workers": web_workers(), "worker_threads": worker_threads(),
+            "concurrent_runtimes": concurrent_runtimes(),
+            **{runtime: threads_for(runtime) for runtime in runtimes}}
+
+
+BLAS_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS"]
+
+
+def limit_blas_threads():
+    """Size the BLAS/OpenMP pools; env vars cover libraries that are not loaded yet."""
+    threads = threads_for("blas")
+    for var in BLAS_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    # NumPy is usually imported by now and has already read the env vars
+    threadpool_limits(limits=threads)
+
+
+@lru_cache(maxsize=None)
+def configure_tensorflow():
+    """Apply the thread budget to TensorFlow; must run before its first op."""
+    import tensorflow as tf
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads_for("tf_intra"))
+        tf.config.threading.set_inter_op_parallelism_threads(threads_for("tf_inter"))
+    except RuntimeError as e:  # the runtime was already initialised elsewhere
+        print(f"[ERROR] Could not set TensorFlow threads: {e}")
+    return tf
+
+
+@lru_cache(maxsize=None)
+def configure_torch():
+    import torch
+
+    torch.set_num_threads(threads_for("torch"))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:  # only settable before the first parallel op
+        pass
+    return torch
+
+
+@lru_cache(maxsize=None)
+def get_strategy():
+    """Distribution strategy for building Keras models.
+
+    Listing GPUs initialises the whole TensorFlow device runtime, which is
+    slow on CPU-only hosts, so it is only probed when PREDICTION_TF_GPU is
+    set; otherwise the default (single device) strategy is used.
+    """
+    tf = configure_tensorflow()
+    if getattr(settings, "PREDICTION_TF_GPU", False):
+        gpus = tf.config.list_physical_devices("GPU")
+        if len(gpus) > 1:
+            print(f"✅ Using MirroredStrategy on {len(gpus)} GPU(s).")
+            return tf.distribute.MirroredStrategy()
+    print("✅ Using default strategy.")
+    return tf.distribute.get_strategy()
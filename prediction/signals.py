@@ -0,0 +1,26 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import RiceInfo, RiceModel
+
+
+@receiver(post_save, sender=RiceModel)
+@receiver(post_delete, sender=RiceModel)
+def rice_model_changed(sender, instance, **kwargs):
+    """New weights or a toggled is_active: re-key cached results and hot-swap the model."""
+    from django.db import transaction
+    from .inference import rice_models_changed
+    from .loaders import MODEL_NAMES
+
+    kinds = [kind for kind, name in MODEL_NAMES.items() if name == instance.name]
+    # After commit, so the swap thread reads the saved row (and its uploaded file)
+    transaction.on_commit(lambda: rice_models_changed(kinds))
+
+
+@receiver(post_save, sender=RiceInfo)
+@receiver(post_delete, sender=RiceInfo)
+def rice_info_changed(sender, instance, **kwargs):
+    """Rebuild the variety catalogue on its next use."""
+    from . import catalogue
+
+    catalogue.invalidate()
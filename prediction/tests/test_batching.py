@@ -0,0 +1,132 @@
+import threading
+import time
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from prediction.batching import AdmissionLimit, MicroBatcher
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_concurrent_samples_share_one_batch(self):
+        sizes = []
+
+        def run_batch(batch):
+            sizes.append(len(batch))
+            return batch.sum(axis=1)
+
+        batcher = MicroBatcher("test", run_batch, max_batch_size=8, window_ms=200)
+        futures = [batcher.submit(np.full(3, i, dtype=np.float32)) for i in range(4)]
+        results = [f.result(timeout=5) for f in futures]
+
+        self.assertEqual(sizes, [4])
+        self.assertEqual([float(row) for row, _ in results], [0.0, 3.0, 6.0, 9.0])
+        self.assertTrue(all(info["batch_size"] == 4 for _, info in results))
+
+    def test_max_batch_size_splits_batches(self):
+        sizes = []
+
+        def run_batch(batch):
+            sizes.append(len(batch))
+            return batch
+
+        batcher = MicroBatcher("test", run_batch, max_batch_size=2, window_ms=200)
+        futures = [batcher.submit(np.zeros(1)) for _ in range(5)]
+        for f in futures:
+            f.result(timeout=5)
+        self.assertEqual(sum(sizes), 5)
+        self.assertLessEqual(max(sizes), 2)
+
+    def test_dict_outputs_are_split_per_row(self):
+        batcher = MicroBatcher("test", lambda b: {"probs": b * 2, "features": b}, window_ms=0)
+        row, _ = batcher(np.ones(2))
+        self.assertEqual(set(row), {"probs", "features"})
+        np.testing.assert_array_equal(row["probs"], [2.0, 2.0])
+
+    def test_batch_error_is_raised_by_every_future(self):
+        def run_batch(batch):
+            raise RuntimeError("model failed")
+
+        batcher = MicroBatcher("test", run_batch, window_ms=0)
+        with self.assertRaisesMessage(RuntimeError, "model failed"):
+            batcher(np.zeros(1))
+
+    def test_batcher_survives_a_bad_batch(self):
+        calls = []
+
+        def run_batch(batch):
+            calls.append(len(batch))
+            # Too few rows on the first call: taking row 1 fails outside run_batch
+            return batch[:1] if len(calls) == 1 else batch
+
+        batcher = MicroBatcher("test", run_batch, max_batch_size=2, window_ms=200)
+        first = [batcher.submit(np.zeros(1)) for _ in range(2)]
+        self.assertIsInstance(first[1].exception(timeout=5), IndexError)
+        row, _ = batcher.submit(np.ones(1)).result(timeout=5)
+        np.testing.assert_array_equal(row, [1.0])
+
+    def test_cancelled_request_is_skipped(self):
+        started, release = threading.Event(), threading.Event()
+        seen = []
+
+        def run_batch(batch):
+            seen.append(batch[:, 0].tolist())
+            started.set()
+            release.wait(5)
+            return batch
+
+        batcher = MicroBatcher("test", run_batch, max_batch_size=4, window_ms=0)
+        running = batcher.submit(np.array([1.0]))
+        self.assertTrue(started.wait(5))
+        # Queued behind the running batch, then abandoned by its client
+        cancelled = batcher.submit(np.array([2.0]))
+        self.assertTrue(cancelled.cancel())
+        kept = batcher.submit(np.array([3.0]))
+        release.set()
+
+        running.result(timeout=5)
+        row, _ = kept.result(timeout=5)
+        np.testing.assert_array_equal(row, [3.0])
+        self.assertTrue(cancelled.cancelled())
+        self.assertNotIn(2.0, [value for batch in seen for value in batch])
+
+    def test_running_request_cannot_be_cancelled(self):
+        started, release = threading.Event(), threading.Event()
+
+        def run_batch(batch):
+            started.set()
+            release.wait(5)
+            return batch
+
+        batcher = MicroBatcher("test", run_batch, window_ms=0)
+        future = batcher.submit(np.zeros(1))
+        self.assertTrue(started.wait(5))
+        self.assertFalse(future.cancel())
+        release.set()
+        future.result(timeout=5)
+
+    def test_stats_record_batches(self):
+        batcher = MicroBatcher("test", lambda b: b, window_ms=0)
+        batcher(np.zeros(1))
+        deadline = time.monotonic() + 5
+        while batcher.stats.as_dict()["batches"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(batcher.stats.as_dict()["batches"], 1)
+
+
+class AdmissionLimitTests(SimpleTestCase):
+    def test_refuses_past_the_limit_until_released(self):
+        admission = AdmissionLimit(2)
+        self.assertTrue(admission.try_acquire())
+        self.assertTrue(admission.try_acquire())
+        self.assertFalse(admission.try_acquire())
+        self.assertEqual((admission.pending, admission.rejected), (2, 1))
+
+        admission.release()
+        self.assertTrue(admission.try_acquire())
+        self.assertEqual(admission.pending, 2)
+
+    def test_limit_is_at_least_one(self):
+        admission = AdmissionLimit(0)
+        self.assertTrue(admission.try_acquire())
+        self.assertFalse(admission.try_acquire())
@@ -0,0 +1,71 @@
+"""Micro-benchmarks of the per-request hot paths.
+
+Skipped unless PREDICTION_BENCHMARKS=1, since timings are only meaningful
+on a quiet machine:
+
+    PREDICTION_BENCHMARKS=1 python manage.py test prediction.tests.test_benchmarks
+
+``benchmark`` mirrors pytest-benchmark's fixture: it calls the function
+for a number of rounds, reports min/median/mean and throughput, and returns
+the function's result so the test can still check it.
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import unittest
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from prediction.cache import PredictionCache
+from prediction.features import FeatureStore, pixel_digest
+from prediction.preprocessing import IMAGE_SIZE, unit_scale, vit_preprocess
+from prediction.tray import segment_grains
+
+from .test_tray import tray
+
+BENCHMARKS = os.environ.get("PREDICTION_BENCHMARKS") == "1"
+
+
+def benchmark(name, fn, rounds=50, warmup=3):
+    for _ in range(warmup):
+        result = fn()
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    print(f"\n{name:<32} min {min(timings) * 1000:8.3f} ms  median {statistics.median(timings) * 1000:8.3f} ms  "
+          f"mean {statistics.fmean(timings) * 1000:8.3f} ms  {1 / statistics.fmean(timings):10.1f} ops/s")
+    return result
+
+
+@unittest.skipUnless(BENCHMARKS, "set PREDICTION_BENCHMARKS=1 to run the benchmarks")
+class BenchmarkTests(SimpleTestCase):
+    def test_preprocess_batch(self):
+        batch = np.random.default_rng(0).integers(0, 256, (16,) + IMAGE_SIZE + (3,), dtype=np.uint8)
+        self.assertEqual(benchmark("unit_scale x16", lambda: unit_scale(batch)).shape, batch.shape)
+        self.assertEqual(benchmark("vit_preprocess x16", lambda: vit_preprocess(batch)).shape, batch.shape)
+
+    def test_segment_tray(self):
+        image = tray([(60 + 120 * r, 80 + 160 * c) for r in range(8) for c in range(12)], shape=(1000, 2000))
+        labels, grains = benchmark("segment_grains 2000x1000", lambda: segment_grains(image), rounds=10)
+        self.assertEqual(len(grains), 96)
+
+    def test_feature_store_lookup(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        store = FeatureStore(directory, "bench")
+        keys = [pixel_digest(np.full((2, 2, 3), i, dtype=np.int32)) for i in range(4096)]
+        values = np.random.default_rng(0).standard_normal((len(keys), 1280)).astype(np.float32)
+        store.put_many(keys, values)
+        found, rows = benchmark("FeatureStore.get_many x16", lambda: store.get_many(keys[:16]))
+        self.assertTrue(found.all())
+        np.testing.assert_array_equal(rows, values[:16].astype(np.float16).astype(np.float32))
+
+    def test_prediction_cache_hit(self):
+        cache = PredictionCache(max_entries=1024, ttl=60, shared_alias=None)
+        cache.set("key", {"probs": [0.1, 0.9]})
+        self.assertIsNotNone(benchmark("PredictionCache.get", lambda: cache.get("key"), rounds=1000))
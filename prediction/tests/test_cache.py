@@ -0,0 +1,50 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from prediction.cache import PredictionCache
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def test_entries_expire_after_ttl(self):
+        cache = PredictionCache(max_entries=8, ttl=10, shared_alias=None)
+        with mock.patch("prediction.cache.time.monotonic", return_value=100.0):
+            cache.set("a", {"probs": [1.0]})
+        with mock.patch("prediction.cache.time.monotonic", return_value=109.0):
+            self.assertEqual(cache.get("a"), {"probs": [1.0]})
+        with mock.patch("prediction.cache.time.monotonic", return_value=110.5):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = PredictionCache(max_entries=2, ttl=60, shared_alias=None)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # "b" is now the least recently used
+        cache.set("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_setting_an_existing_key_refreshes_it(self):
+        cache = PredictionCache(max_entries=2, ttl=60, shared_alias=None)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.set("a", 10)
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 10)
+        self.assertIsNone(cache.get("b"))
+
+    def test_shared_tier_fills_the_local_one(self):
+        caches["default"].clear()
+        writer = PredictionCache(max_entries=8, ttl=60, shared_alias="default")
+        reader = PredictionCache(max_entries=8, ttl=60, shared_alias="default")
+        writer.set("k", {"probs": [0.5, 0.5]})
+
+        self.assertEqual(reader.get("k"), {"probs": [0.5, 0.5]})
+        caches["default"].clear()
+        self.assertEqual(reader.get("k"), {"probs": [0.5, 0.5]})
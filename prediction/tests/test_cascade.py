@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from prediction.cascade import CascadeHead, CascadeStats
+
+
+class CascadeHeadTests(SimpleTestCase):
+    def test_confident_compares_the_top_probability_with_its_class_threshold(self):
+        head = CascadeHead(np.zeros((4, 3)), np.zeros(3), thresholds=[0.9, 0.5, 1.01])
+        probs = np.array([
+            [0.95, 0.03, 0.02],  # class 0 above 0.9
+            [0.85, 0.10, 0.05],  # class 0 below 0.9
+            [0.20, 0.50, 0.30],  # class 1 exactly at 0.5
+            [0.00, 0.00, 1.00],  # class 2 is always escalated
+        ])
+        np.testing.assert_array_equal(head.confident(probs), [True, False, True, False])
+
+    def test_predict_proba_is_a_softmax(self):
+        head = CascadeHead.random(num_features=8, num_classes=4, seed=1)
+        probs = head.predict_proba(np.random.default_rng(0).standard_normal((5, 8)) * 100)
+        self.assertEqual(probs.shape, (5, 4))
+        self.assertTrue(np.all(np.isfinite(probs)))
+        np.testing.assert_allclose(probs.sum(axis=1), 1.0, rtol=1e-5)
+
+    def test_save_and_load_round_trip(self):
+        head = CascadeHead.random(num_features=8, num_classes=3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "head.npz")
+            head.save(path)
+            loaded = CascadeHead.load(path)
+        np.testing.assert_array_equal(loaded.weights, head.weights)
+        np.testing.assert_array_equal(loaded.thresholds, head.thresholds)
+
+
+class CascadeStatsTests(SimpleTestCase):
+    def test_escalation_rate(self):
+        stats = CascadeStats()
+        self.assertEqual(stats.as_dict()["escalation_rate"], 0.0)
+        stats.record(images=8, escalated=2)
+        stats.record(images=2, escalated=0)
+        self.assertEqual(stats.as_dict(), {"images": 10, "escalated": 2, "escalation_rate": 0.2})
@@ -0,0 +1,31 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from prediction.catalogue import VarietyCatalogue, align
+
+
+def varieties(*labels):
+    return VarietyCatalogue(labels, [f"{label} info" for label in labels], version="test")
+
+
+class AlignTests(SimpleTestCase):
+    def test_same_order_is_returned_unchanged(self):
+        probs = np.array([[0.2, 0.8]])
+        self.assertIs(align(probs, varieties("a", "b"), varieties("a", "b")), probs)
+
+    def test_columns_follow_the_target_order(self):
+        probs = np.array([[0.1, 0.2, 0.7], [0.6, 0.3, 0.1]])
+        aligned = align(probs, varieties("c", "a", "b"), varieties("a", "b", "c"))
+        np.testing.assert_array_equal(aligned, [[0.2, 0.7, 0.1], [0.3, 0.1, 0.6]])
+
+    def test_unknown_varieties_get_zero_and_extra_ones_are_dropped(self):
+        probs = np.array([0.5, 0.4, 0.1])
+        aligned = align(probs, varieties("a", "b", "retired"), varieties("new", "b", "a"))
+        np.testing.assert_array_equal(aligned, [0.0, 0.4, 0.5])
+        self.assertEqual(aligned.dtype, probs.dtype)
+
+    def test_catalogue_lookups(self):
+        catalogue = varieties("a", "b")
+        self.assertEqual((len(catalogue), catalogue.name(1), catalogue.info(0)), (2, "b", "a info"))
+        self.assertEqual(catalogue.index("b"), 1)
+        self.assertIsNone(catalogue.index("missing"))
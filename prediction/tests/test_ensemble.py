@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from django.test import SimpleTestCase
+
+try:
+    import xgboost
+except ImportError:
+    xgboost = None
+
+from prediction.ensemble import EnsembleMetaModel
+
+
+@unittest.skipIf(xgboost is None, "xgboost is not installed")
+class EnsembleMetaModelTests(SimpleTestCase):
+    def test_probabilities_per_class(self):
+        model = EnsembleMetaModel.random(num_features=6, num_classes=4, rounds=5)
+        probs = model.predict_proba(np.random.default_rng(0).standard_normal((3, 6)))
+        self.assertEqual(probs.shape, (3, 4))
+        np.testing.assert_allclose(probs.sum(axis=1), 1.0, rtol=1e-5)
+
+    def test_accepts_float64_and_non_contiguous_features(self):
+        model = EnsembleMetaModel.random(num_features=6, num_classes=3, rounds=5)
+        features = np.random.default_rng(1).standard_normal((4, 12))[:, ::2]
+        np.testing.assert_allclose(model.predict_proba(features),
+                                   model.predict_proba(np.ascontiguousarray(features, dtype=np.float32)))
+
+    def test_binary_model_gives_two_columns(self):
+        rng = np.random.default_rng(0)
+        features = rng.standard_normal((20, 3)).astype(np.float32)
+        booster = xgboost.train({"objective": "binary:logistic", "max_depth": 2},
+                                xgboost.DMatrix(features, label=np.arange(20) % 2), num_boost_round=3)
+        probs = EnsembleMetaModel(booster).predict_proba(features[:5])
+        self.assertEqual(probs.shape, (5, 2))
+        np.testing.assert_allclose(probs.sum(axis=1), 1.0, rtol=1e-6)
+
+    def test_load_round_trip(self):
+        model = EnsembleMetaModel.random(num_features=6, num_classes=3, rounds=5)
+        features = np.random.default_rng(2).standard_normal((2, 6))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "meta.json")
+            model.booster.save_model(path)
+            loaded = EnsembleMetaModel.load(path, nthread=1)
+        np.testing.assert_allclose(loaded.predict_proba(features), model.predict_proba(features))
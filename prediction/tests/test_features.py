@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from prediction import features
+from prediction.features import FeatureStore, cached_features, pixel_digest
+
+
+def digests(count, salt=0):
+    return [pixel_digest(np.full((2, 2, 3), i + salt * 1000, dtype=np.int32)) for i in range(count)]
+
+
+def append_rows(directory, salt, rounds):
+    """Child process: append rows whose every value is ``salt`` so misaligned reads are visible."""
+    store = FeatureStore(directory, "shared", max_rows=50)
+    for r in range(rounds):
+        store.put_many(digests(3, salt * 100 + r), np.full((3, 4), salt, dtype=np.float32))
+
+
+class FeatureStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_empty_store_has_no_rows(self):
+        store = FeatureStore(self.directory, "m")
+        found, rows = store.get_many(digests(2))
+        self.assertFalse(found.any())
+        self.assertIsNone(rows)
+        self.assertEqual(len(store), 0)
+
+    def test_round_trip_as_float16(self):
+        store = FeatureStore(self.directory, "m")
+        keys = digests(3)
+        values = np.random.default_rng(0).standard_normal((3, 5)).astype(np.float32)
+        store.put_many(keys, values)
+
+        found, rows = store.get_many([keys[2], digests(1, salt=9)[0], keys[0]])
+        np.testing.assert_array_equal(found, [True, False, True])
+        np.testing.assert_array_equal(rows[0], values[2].astype(np.float16))
+        np.testing.assert_array_equal(rows[1], 0.0)
+        self.assertEqual(store.dim, 5)
+
+    def test_a_second_instance_sees_rows_appended_by_the_first(self):
+        writer = FeatureStore(self.directory, "m")
+        reader = FeatureStore(self.directory, "m")
+        writer.put_many(digests(2), np.ones((2, 4)))
+        self.assertEqual(len(reader), 2)
+        writer.put_many(digests(2, salt=1), np.full((2, 4), 2.0))
+        found, rows = reader.get_many(digests(2, salt=1))
+        self.assertTrue(found.all())
+        np.testing.assert_array_equal(rows, 2.0)
+
+    def test_duplicate_keys_are_stored_once(self):
+        store = FeatureStore(self.directory, "m")
+        store.put_many(digests(2), np.ones((2, 4)))
+        store.put_many(digests(3), np.ones((3, 4)))
+        self.assertEqual(len(store), 3)
+
+    def test_row_width_comes_from_the_header_not_the_file_sizes(self):
+        store = FeatureStore(self.directory, "m")
+        store.put_many(digests(2), np.ones((2, 4)))
+        # A writer that has appended its rows but not yet its keys
+        rows_path, _ = store._paths(store.generation)
+        with open(rows_path, "ab") as f:
+            f.write(np.zeros((7, 4), dtype=np.float16).tobytes())
+
+        reader = FeatureStore(self.directory, "m")
+        found, rows = reader.get_many(digests(2))
+        self.assertEqual(reader.dim, 4)
+        self.assertTrue(found.all())
+        np.testing.assert_array_equal(rows, 1.0)
+
+    def test_interrupted_append_is_truncated_by_the_next_one(self):
+        store = FeatureStore(self.directory, "m")
+        store.put_many(digests(1), np.ones((1, 4)))
+        rows_path, _ = store._paths(store.generation)
+        with open(rows_path, "ab") as f:
+            f.write(b"\x00" * 5)  # a torn write with no keys
+        store.put_many(digests(1, salt=1), np.full((1, 4), 3.0))
+        found, rows = FeatureStore(self.directory, "m").get_many(digests(1, salt=1))
+        self.assertTrue(found.all())
+        np.testing.assert_array_equal(rows, 3.0)
+
+    def test_full_store_rotates_to_a_new_generation(self):
+        store = FeatureStore(self.directory, "m", max_rows=4)
+        reader = FeatureStore(self.directory, "m", max_rows=4)
+        store.put_many(digests(3), np.ones((3, 4)))
+        self.assertEqual(len(reader), 3)
+        old_paths = store._paths(store.generation)
+
+        store.put_many(digests(2, salt=1), np.full((2, 4), 2.0))
+        self.assertEqual(store.generation, 1)
+        self.assertFalse(any(os.path.exists(p) for p in old_paths))
+        # The reader drops its index for the new generation
+        self.assertEqual(len(reader), 2)
+        self.assertFalse(reader.get_many(digests(3))[0].any())
+
+    def test_rotated_store_survives_a_reader_holding_old_rows(self):
+        store = FeatureStore(self.directory, "m", max_rows=2)
+        store.put_many(digests(2), np.ones((2, 4)))
+        _, old_rows = store.rows()
+        store.put_many(digests(2, salt=1), np.full((2, 4), 2.0))
+        # The old files are unlinked, but a memmap taken before keeps its pages
+        np.testing.assert_array_equal(old_rows, 1.0)
+
+    @unittest.skipIf(features.fcntl is None, "flock is needed to share a store between processes")
+    def test_concurrent_writers_in_separate_processes(self):
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=append_rows, args=(self.directory, salt, 20)) for salt in (1, 2, 3)]
+        for process in processes:
+            process.start()
+        reader = FeatureStore(self.directory, "shared", max_rows=50)
+        while any(p.is_alive() for p in processes):
+            keys, rows = reader.rows()
+            if rows is not None:
+                self.assertEqual(rows.shape, (len(keys), 4))
+                # Every row is uniform; a row spanning two writes would not be
+                self.assertTrue(np.all(rows == rows[:, :1]))
+        for process in processes:
+            process.join(10)
+            self.assertEqual(process.exitcode, 0)
+
+        keys, rows = reader.rows()
+        self.assertLessEqual(len(keys), 50)
+        self.assertTrue(np.all(rows == rows[:, :1]))
+
+
+class CachedFeaturesTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        patcher = mock.patch.object(features, "FEATURE_STORE_DIR", directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(features._stores.clear)
+
+    def flush(self):
+        features._writer.submit(lambda: None).result(timeout=5)
+
+    def test_only_unseen_images_are_computed(self):
+        computed = []
+
+        def compute(batch):
+            computed.append(len(batch))
+            return batch.reshape(len(batch), -1)[:, :4].astype(np.float32)
+
+        batch = np.random.default_rng(0).integers(0, 255, (3, 2, 2, 3), dtype=np.uint8)
+        first = cached_features("mobilenetv2", "v1", batch, compute)
+        self.flush()
+        again = cached_features("mobilenetv2", "v1", batch[[2, 0]], compute)
+
+        self.assertEqual(computed, [3])
+        np.testing.assert_array_equal(again, first[[2, 0]])
+
+    def test_versions_do_not_share_rows(self):
+        compute = mock.Mock(side_effect=lambda batch: np.ones((len(batch), 4)))
+        batch = np.zeros((1, 2, 2, 3), dtype=np.uint8)
+        cached_features("mobilenetv2", "v1", batch, compute)
+        self.flush()
+        cached_features("mobilenetv2", "v2", batch, compute)
+        self.assertEqual(compute.call_count, 2)
+
+    def test_superseded_version_is_closed_and_deleted(self):
+        compute = mock.Mock(side_effect=lambda batch: np.ones((len(batch), 4)))
+        batch = np.zeros((1, 2, 2, 3), dtype=np.uint8)
+        cached_features("mobilenetv2", "v1", batch, compute)
+        cached_features("vgg16", "v1", batch, compute)
+        self.flush()
+        # Left over from a version superseded while the process was down
+        FeatureStore(self.directory, "mobilenetv2-v0").put_many(digests(1), np.ones((1, 4)))
+        old = features.feature_store("mobilenetv2", "v1")
+
+        cached_features("mobilenetv2", "v2", batch, compute)
+        old.put_many(digests(1, salt=1), np.ones((1, 4)))  # queued before the swap
+        self.flush()
+
+        names = {name.split(".")[0] for name in os.listdir(self.directory)}
+        self.assertEqual(names, {"mobilenetv2-v2", "vgg16-v1"})
+        self.assertTrue(old.closed)
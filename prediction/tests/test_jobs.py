@@ -0,0 +1,40 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from prediction import inference
+from prediction.jobs import enqueue_job, run_job
+from prediction.models import PredictionJob
+
+
+def fake_predictions(model_type, images):
+    for index, (name, data) in enumerate(images):
+        yield {"index": index, "filename": name, "predicted_variety": data.decode()}
+    yield {"summary": {"images": len(images)}}
+
+
+class PredictionJobTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        patch = override_settings(MEDIA_ROOT=media)
+        patch.enable()
+        self.addCleanup(patch.disable)
+
+    def test_results_keep_every_upload_and_its_name(self):
+        images = [("photo", b"a"), ("dir/b.jfif", b"b"), ("c.heic", b"c"), ("c.heic", b"d")]
+        job = enqueue_job("vgg16", images)
+        self.assertEqual(job.total, 4)
+        upload = job.upload.name
+
+        with mock.patch.object(inference, "iter_batch_predictions", fake_predictions):
+            run_job(PredictionJob.objects.get(pk=job.pk))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, PredictionJob.DONE)
+        self.assertEqual([(r["filename"], r["predicted_variety"]) for r in job.results],
+                         [("photo", "a"), ("dir/b.jfif", "b"), ("c.heic", "c"), ("c.heic", "d")])
+        self.assertEqual((job.processed, job.summary), (4, {"images": 4}))
+        self.assertFalse(job.upload.storage.exists(upload))
@@ -0,0 +1,32 @@
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from prediction import runtime
+
+
+@override_settings(PREDICTION_THREADS=None, PREDICTION_RUNTIME_THREADS={}, PREDICTION_CONCURRENT_RUNTIMES=2)
+class ThreadBudgetTests(SimpleTestCase):
+    def setUp(self):
+        patch = mock.patch.object(runtime, "available_cpus", lambda: 16)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_default_workers_match_gunicorn(self):
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertEqual(runtime.web_workers(), runtime.DEFAULT_WEB_WORKERS)
+            self.assertEqual(runtime.worker_threads(), 16 // runtime.DEFAULT_WEB_WORKERS)
+
+    def test_budget_is_split_between_concurrent_pools(self):
+        with mock.patch.dict(os.environ, {"WEB_CONCURRENCY": "4"}):
+            budget = runtime.thread_budget()
+        self.assertEqual(budget["worker_threads"], 4)
+        self.assertEqual((budget["tf_intra"], budget["torch"], budget["tflite"]), (2, 2, 2))
+        self.assertEqual((budget["tf_inter"], budget["xgboost"], budget["blas"]), (1, 1, 1))
+
+    @override_settings(PREDICTION_THREADS=3, PREDICTION_RUNTIME_THREADS={"torch": 8, "xgboost": 0})
+    def test_overrides(self):
+        self.assertEqual(runtime.threads_for("torch"), 8)
+        self.assertEqual(runtime.threads_for("tf_intra"), 1)
+        self.assertEqual(runtime.threads_for("xgboost"), 1)
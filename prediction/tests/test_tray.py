@@ -0,0 +1,66 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from prediction.preprocessing import IMAGE_SIZE
+from prediction.tray import crop_grains, grain_boxes, otsu_threshold, segment_grains
+
+
+def tray(grains, shape=(200, 300), background=30, speck=None):
+    """A dark tray with light filled ellipses at ``grains`` = [(row, col), ...]."""
+    image = np.full(shape + (3,), background, dtype=np.uint8)
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    for row, col in grains:
+        inside = ((yy - row) / 8.0) ** 2 + ((xx - col) / 20.0) ** 2 <= 1.0
+        image[inside] = 210
+    if speck is not None:
+        image[speck[0], speck[1]] = 210
+    return image
+
+
+class SegmentGrainsTests(SimpleTestCase):
+    def test_finds_each_grain_in_reading_order(self):
+        centres = [(150, 60), (40, 200), (40, 50)]
+        labels, grains = segment_grains(tray(centres, speck=(100, 150)))
+
+        self.assertEqual(len(grains), 3)  # the speck is dropped
+        tops = [(box[0].start, box[1].start) for _, box, _ in grains]
+        self.assertEqual(tops, sorted(tops))
+        for label, box, area in grains:
+            self.assertEqual(int((labels[box] == label).sum()), area)
+
+    def test_light_tray_with_dark_grains(self):
+        image = 255 - tray([(50, 80), (120, 200)])
+        self.assertEqual(len(segment_grains(image)[1]), 2)
+
+    def test_grain_cut_by_the_edge_keeps_the_others(self):
+        labels, grains = segment_grains(tray([(100, 5), (50, 150), (150, 220)]))
+        inside = {labels[50, 150], labels[150, 220]}
+        self.assertNotIn(0, inside)
+        self.assertTrue(inside <= {label for label, _, _ in grains})
+
+    def test_holes_in_a_grain_are_filled(self):
+        image = tray([(100, 150)])
+        image[99:102, 145:155] = 30  # glare-like dark spot inside the grain
+        labels, grains = segment_grains(image)
+        self.assertEqual(len(grains), 1)
+        self.assertEqual(labels[100, 150], grains[0][0])
+
+    def test_blank_tray_has_no_grains(self):
+        self.assertIsNone(otsu_threshold(np.full((10, 10), 7, dtype=np.uint8)))
+        self.assertEqual(segment_grains(np.full((50, 50, 3), 30, dtype=np.uint8))[1], [])
+
+    def test_too_many_grains_is_an_error(self):
+        centres = [(30 + 50 * r, 30 + 60 * c) for r in range(3) for c in range(4)]
+        with self.assertRaises(ValueError):
+            segment_grains(tray(centres), max_grains=5)
+
+    def test_crops_and_boxes(self):
+        image = tray([(50, 80), (120, 200)])
+        labels, grains = segment_grains(image)
+        crops = crop_grains(image, labels, grains)
+        self.assertEqual(crops.shape, (2,) + IMAGE_SIZE + (3,))
+        self.assertEqual(crops.dtype, np.uint8)
+
+        boxes = grain_boxes(grains, scale=2.0)
+        self.assertEqual(len(boxes), 2)
+        self.assertEqual(boxes[0]["x"], 2 * grains[0][1][1].start)
@@ -0,0 +1,95 @@
+import io
+import zipfile
+from unittest import mock
+
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase
+
+from prediction import uploads
+from prediction.uploads import ImageUploadHandler, collect_images
+
+
+def image_bytes(size=(32, 24), image_format="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 80, 40)).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+class ImageUploadHandlerTests(SimpleTestCase):
+    def upload(self, data, name="grain.png"):
+        request = RequestFactory().post("/predict/", {"rice_image": SimpleUploadedFile(name, data)})
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return request, request.FILES.get("rice_image")
+
+    def test_image_is_kept_in_memory(self):
+        data = image_bytes()
+        request, image = self.upload(data)
+        self.assertIsNone(getattr(request, "upload_rejected", None))
+        self.assertEqual(image.read(), data)
+        self.assertFalse(hasattr(image, "temporary_file_path"))
+
+    def test_non_image_is_rejected_with_415(self):
+        request, image = self.upload(b"not an image at all" * 10, name="notes.txt")
+        self.assertIsNone(image)
+        self.assertEqual(request.upload_rejected.status, 415)
+
+    def test_unsupported_format_is_rejected_with_415(self):
+        request, image = self.upload(image_bytes(image_format="GIF"), name="grain.gif")
+        self.assertIsNone(image)
+        self.assertEqual(request.upload_rejected.status, 415)
+
+    def test_oversized_upload_is_rejected_with_413(self):
+        with mock.patch.object(uploads, "MAX_UPLOAD_BYTES", 100):
+            request, image = self.upload(image_bytes(size=(200, 200)))
+        self.assertIsNone(image)
+        self.assertEqual(request.upload_rejected.status, 413)
+
+    def test_too_many_pixels_is_rejected_with_413(self):
+        with mock.patch.object(uploads, "MAX_IMAGE_PIXELS", 100):
+            request, image = self.upload(image_bytes(size=(20, 20)))
+        self.assertIsNone(image)
+        self.assertEqual(request.upload_rejected.status, 413)
+
+
+class CollectImagesTests(SimpleTestCase):
+    def test_zip_members_are_expanded(self):
+        archive = zip_bytes([("a.png", image_bytes()), ("dir/b.jpg", b"jpeg"), ("readme.txt", b"x"),
+                             ("__MACOSX/.c.png", b"x")])
+        images = collect_images([SimpleUploadedFile("lot.zip", archive), SimpleUploadedFile("c.png", b"png")])
+        self.assertEqual([name for name, _ in images], ["a.png", "dir/b.jpg", "c.png"])
+
+    def test_uploads_and_zip_members_follow_the_same_names(self):
+        archive = zip_bytes([("photo", b"a"), ("b.jfif", b"b"), ("notes.txt", b"c")])
+        images = collect_images([SimpleUploadedFile("lot.zip", archive), SimpleUploadedFile("photo", b"d"),
+                                 SimpleUploadedFile("e.JFIF", b"e")])
+        self.assertEqual([name for name, _ in images], ["photo", "b.jfif", "photo", "e.JFIF"])
+
+    def test_upload_that_is_not_an_image_is_refused(self):
+        with self.assertRaisesMessage(ValueError, "notes.txt is not an image"):
+            collect_images([SimpleUploadedFile("a.png", b"a"), SimpleUploadedFile("notes.txt", b"b")])
+
+    def test_image_limit(self):
+        archive = zip_bytes([(f"{i}.png", b"x") for i in range(4)])
+        with self.assertRaisesMessage(ValueError, "At most 3 images"):
+            collect_images([SimpleUploadedFile("lot.zip", archive)], limit=3)
+
+    def test_member_larger_than_an_upload_is_refused(self):
+        archive = zip_bytes([("bomb.png", b"\0" * 5000)])
+        with mock.patch.object(uploads, "MAX_UPLOAD_BYTES", 1000):
+            with self.assertRaisesMessage(ValueError, "bomb.png is larger than"):
+                collect_images([SimpleUploadedFile("lot.zip", archive)])
+
+    def test_total_uncompressed_size_is_capped(self):
+        archive = zip_bytes([(f"{i}.png", b"\0" * 600) for i in range(3)])
+        with self.assertRaisesMessage(ValueError, "uncompressed"):
+            collect_images([SimpleUploadedFile("lot.zip", archive)], max_bytes=1000)
+        self.assertEqual(len(collect_images([SimpleUploadedFile("lot.zip", archive)], max_bytes=2000)), 3)
@@ -0,0 +1,82 @@
+import asyncio
+import io
+import json
+import threading
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from prediction import inference
+from prediction.batching import MicroBatcher
+from prediction.cache import prediction_cache
+from prediction.catalogue import VarietyCatalogue
+
+
+class PredictBatchTests(TestCase):
+    def setUp(self):
+        prediction_cache.clear()
+        self.addCleanup(prediction_cache.clear)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+        def run_batch(batch):
+            # Image i is filled with value i: the first chunk (0 and 1) is answered at once,
+            # the rest of the lot waits for the test
+            if batch[:, 0, 0, 0].max() >= 2:
+                self.release.wait(10)
+            return np.tile([0.2, 0.8], (len(batch), 1))
+
+        varieties = VarietyCatalogue(["a", "b"], ["", ""], version="test")
+        for patch in [
+            mock.patch.dict(inference.batchers, {"vgg16": MicroBatcher("test", run_batch, window_ms=0)}),
+            mock.patch.object(inference, "BULK_BATCH_SIZE", 2),
+            mock.patch.object(inference, "model_type_catalogue", lambda model_type: varieties),
+            mock.patch.object(inference, "cache_key", lambda model_type, digest: f"test:{digest}"),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def images(self, count):
+        files = []
+        for i in range(count):
+            buffer = io.BytesIO()
+            Image.new("RGB", (20, 20), (i, i, i)).save(buffer, "PNG")
+            files.append(SimpleUploadedFile(f"{i}.png", buffer.getvalue()))
+        return files
+
+    async def test_lines_stream_before_the_lot_finishes(self):
+        response = await self.async_client.post("/predict/batch/", {"rice_images": self.images(5)})
+        self.assertEqual(response.status_code, 200)
+        lines = aiter(response.streaming_content)
+
+        first = json.loads(await asyncio.wait_for(anext(lines), 10))
+        self.assertEqual((first["index"], first["predicted_variety"]), (0, "b"))
+        self.assertFalse(self.release.is_set())
+
+        self.release.set()
+        rest = [json.loads(line) async for line in lines]
+        self.assertEqual([r["filename"] for r in rest[:-1]], ["1.png", "2.png", "3.png", "4.png"])
+        self.assertEqual(rest[-1]["summary"]["histogram"], {"b": 5})
+        self.assertEqual(inference.admission.pending, 0)
+
+    async def test_admission_is_released_when_the_client_goes_away(self):
+        response = await self.async_client.post("/predict/batch/", {"rice_images": self.images(5)})
+        lines = aiter(response.streaming_content)
+        for _ in range(2):
+            await asyncio.wait_for(anext(lines), 10)
+        self.assertEqual(inference.admission.pending, 1)
+
+        # The ASGI handler cancels the response task on http.disconnect
+        waiting = asyncio.ensure_future(anext(lines))
+        await asyncio.sleep(0.1)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(inference.admission.pending, 0)
+
+    async def test_unknown_model_type(self):
+        response = await self.async_client.post("/predict/batch/", {"rice_images": self.images(1), "model_type": "x"})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,70 @@
+"""TFLite inference backend for the Keras rice models.
+
+A ``TFLiteModel`` exposes the same ``predict(batch, verbose=0)`` call the
+Keras models do, so the prediction code does not care which backend a
+RiceModel row was loaded with. Interpreters are not thread-safe, so each
+model keeps a small pool and every call checks one out.
+"""
+import os
+import queue
+
+import numpy as np
+
+
+def _interpreter_class():
+    # The standalone runtime is much smaller than full TensorFlow; use it when present
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    backend = "tflite"
+
+    def __init__(self, model_path, num_threads=None, pool_size=2):
+        Interpreter = _interpreter_class()
+        self.model_path = model_path
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self._pool = queue.Queue()
+        for _ in range(max(1, int(pool_size))):
+            # XNNPACK is the default CPU delegate for float and int8 models
+            interpreter = Interpreter(model_path=model_path, num_threads=self.num_threads)
+            runner = interpreter.get_signature_runner()
+            self._pool.put((interpreter, runner))
+        _, runner = self._pool.queue[0]
+        self._input_name, self._input_detail = next(iter(runner.get_input_details().items()))
+        self._output_details = runner.get_output_details()
+
+    def predict(self, batch, verbose=0):
+        """Run ``batch`` through one pooled interpreter.
+
+        Returns a single array for one-output models, or a dict keyed by the
+        signature's output names (e.g. ``features``/``probs`` for VGG16).
+        """
+        interpreter, runner = self._pool.get()
+        try:
+            outputs = runner(**{self._input_name: _quantize(batch, self._input_detail)})
+        finally:
+            self._pool.put((interpreter, runner))
+        outputs = {name: _dequantize(value, self._output_details[name]) for name, value in outputs.items()}
+        if len(outputs) == 1:
+            return next(iter(outputs.values()))
+        return outputs
+
+
+def _quantize(batch, detail):
+    dtype = detail["dtype"]
+    if np.issubdtype(dtype, np.floating):
+        return batch.astype(dtype, copy=False)
+    scales, zero_points = detail["quantization_parameters"]["scales"], detail["quantization_parameters"]["zero_points"]
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scales[0] + zero_points[0]), info.min, info.max).astype(dtype)
+
+
+def _dequantize(value, detail):
+    if np.issubdtype(value.dtype, np.floating):
+        return value
+    scales, zero_points = detail["quantization_parameters"]["scales"], detail["quantization_parameters"]["zero_points"]
+    return (value.astype(np.float32) - zero_points[0]) * scales[0]
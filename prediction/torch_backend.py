@@ -0,0 +1,74 @@
+"""Int8, traced ViT for CPU serving.
+
+``OptimizedViT`` quantizes the ViT's Linear layers (almost all of its
+FLOPs and weights) to int8 with dynamic activation scales, traces the
+result into a frozen TorchScript graph and runs it under
+``torch.inference_mode``. It is called like the eager model, with a
+(N, 3, H, W) ``pixel_values`` tensor, and returns the logits.
+
+Quantizing only rewrites weights, so it is done on load, and a ViT
+preloaded in the gunicorn master is shared with the workers in its int8
+form. Tracing runs the model once and the warm-up, which lets the
+profiling executor specialise the graph, several times more. Neither may
+happen in a process that forks afterwards (OpenMP thread pools do not
+survive a fork), so both wait for the worker's first call or its
+``warm_up`` (``registry.WarmUp``).
+"""
+import threading
+import time
+
+import torch
+
+from .preprocessing import IMAGE_SIZE
+
+
+class LogitsOnly(torch.nn.Module):
+    """Traceable wrapper returning the logits tensor instead of a ModelOutput."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model(pixel_values=pixel_values).logits
+
+
+def example_pixels(batch_size=1):
+    # Channels-last, like the batches run_vit_batch builds from NHWC arrays
+    return torch.zeros(batch_size, *IMAGE_SIZE, 3).permute(0, 3, 1, 2)
+
+
+class OptimizedViT:
+    backend = "torch-int8"
+
+    def __init__(self, model, warm_up_batch_sizes=(1,)):
+        self.quantized = torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+        self.module = None
+        self._trace_lock = threading.Lock()
+        self.warm_up_batch_sizes = tuple(warm_up_batch_sizes)
+        self.warm_up_seconds = None
+
+    def traced(self):
+        """The frozen TorchScript graph, traced on first use in this process."""
+        if self.module is None:
+            with self._trace_lock:
+                if self.module is None:
+                    with torch.no_grad():
+                        traced = torch.jit.trace(LogitsOnly(self.quantized).eval(), example_pixels(),
+                                                 strict=False, check_trace=False)
+                    self.module = torch.jit.freeze(traced)
+        return self.module
+
+    def __call__(self, pixel_values):
+        module = self.traced()
+        with torch.inference_mode():
+            return module(pixel_values)
+
+    def warm_up(self):
+        started = time.perf_counter()
+        for batch_size in self.warm_up_batch_sizes:
+            example = example_pixels(batch_size)
+            for _ in range(3):
+                self(example)
+        self.warm_up_seconds = time.perf_counter() - started
+        return self.warm_up_seconds
@@ -0,0 +1,146 @@
+"""Find the individual grains on a tray photo and cut them out for classification.
+
+Grains are separated from the tray by a global Otsu threshold on the
+luminance, their holes (glare, chalky spots) are filled, and they are split
+into connected components with ``scipy.ndimage.label``; dust and specks
+are dropped by area. Everything is whole-array NumPy/SciPy, with no
+per-pixel Python. Each grain becomes a square crop centred on it, with the
+other grains painted over in the tray colour, resized to the model input
+size. Grains that touch end up in one component and are classified as one
+crop.
+"""
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+from .preprocessing import IMAGE_SIZE, REDUCING_GAP, check_dimensions
+
+# Tray photos are segmented and cropped at this longest side (JPEGs decode straight to it)
+MAX_SIDE = getattr(settings, "PREDICTION_TRAY_MAX_SIDE", 2048)
+MAX_GRAINS = getattr(settings, "PREDICTION_TRAY_MAX_GRAINS", 200)
+# Components smaller than this share of the median grain are dust or glare
+MIN_GRAIN_RATIO = 0.25
+# Empty border around a grain, as a share of its longer side
+CROP_MARGIN = 0.1
+
+LUMINANCE = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def decode_tray(image_file, max_side=MAX_SIDE, max_pixels=None):
+    """Decode a tray photo at most ``max_side`` pixels across.
+
+    Returns the (H, W, 3) uint8 array and the factor from its pixels back
+    to the uploaded image's.
+    """
+    with Image.open(image_file) as img:
+        check_dimensions(img, max_pixels)
+        original_width = img.size[0]
+        if img.format == "JPEG":
+            img.draft("RGB", (max_side, max_side))
+        img = img.convert("RGB")
+        img.thumbnail((max_side, max_side), reducing_gap=REDUCING_GAP)
+        return np.asarray(img, dtype=np.uint8), original_width / img.size[0]
+
+
+def otsu_threshold(gray):
+    """Grey level that best splits a uint8 image into two classes (Otsu's method).
+
+    None for an image of a single grey level.
+    """
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    if np.count_nonzero(hist) < 2:
+        return None
+    levels = np.arange(256)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * levels)
+    total, total_mean = weight[-1], mean[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (total_mean * weight - mean * total) ** 2 / (weight * (total - weight))
+    return int(np.nanargmax(between))
+
+
+def border(array):
+    return np.concatenate([array[0], array[-1], array[1:-1, 0], array[1:-1, -1]])
+
+
+def grain_mask(image):
+    """Boolean foreground mask; the tray is whichever side of the threshold fills the border."""
+    from scipy import ndimage
+
+    gray = (image @ LUMINANCE).astype(np.uint8)
+    threshold = otsu_threshold(gray)
+    if threshold is None:
+        return np.zeros(gray.shape, dtype=bool)
+    mask = gray > threshold
+    if border(mask).mean() > 0.5:
+        mask = ~mask
+    # Fill holes: tray regions not connected to the border belong to a grain.
+    # One labelling pass; much faster than binary_fill_holes' iterated dilation.
+    tray, count = ndimage.label(~mask)
+    outside = np.zeros(count + 1, dtype=bool)
+    outside[border(tray)] = True
+    # Label 0 is the grains themselves, on the border when one is cut by the edge
+    outside[0] = False
+    return ~outside[tray]
+
+
+def segment_grains(image, max_grains=MAX_GRAINS):
+    """Label the grains in ``image``.
+
+    Returns the label array and ``[(label, (row slice, column slice), area), ...]``
+    in reading order. Raises ValueError when there are more than ``max_grains``.
+    """
+    from scipy import ndimage
+
+    mask = grain_mask(image)
+    labels, count = ndimage.label(mask)
+    if not count:
+        return labels, []
+    areas = np.bincount(labels.ravel())[1:]
+    # An absolute floor first, so a sea of specks cannot drag the median down
+    candidates = areas[areas >= max(16, mask.size // 100_000)]
+    min_area = MIN_GRAIN_RATIO * np.median(candidates) if len(candidates) else np.inf
+    grains = [
+        (label, box, int(areas[label - 1]))
+        for label, box in enumerate(ndimage.find_objects(labels), start=1)
+        if box is not None and areas[label - 1] >= min_area
+    ]
+    if len(grains) > max_grains:
+        raise ValueError(f"Found {len(grains)} grains; at most {max_grains} can be classified from one photo")
+    grains.sort(key=lambda grain: (grain[1][0].start, grain[1][1].start))
+    return labels, grains
+
+
+def crop_grains(image, labels, grains, size=IMAGE_SIZE, margin=CROP_MARGIN):
+    """(N, H, W, 3) uint8 crops, one per grain, each centred on a tray-coloured square."""
+    # The tray colour, from the photo's edge (which the tray fills)
+    background = np.median(border(image), axis=0).astype(np.uint8)
+    height, width = labels.shape
+    crops = np.empty((len(grains), size[1], size[0], 3), dtype=np.uint8)
+    for i, (label, (rows, cols), _) in enumerate(grains):
+        side = int(max(rows.stop - rows.start, cols.stop - cols.start) * (1 + 2 * margin)) + 1
+        top = (rows.start + rows.stop - side) // 2
+        left = (cols.start + cols.stop - side) // 2
+        y0, y1 = max(top, 0), min(top + side, height)
+        x0, x1 = max(left, 0), min(left + side, width)
+        square = np.empty((side, side, 3), dtype=np.uint8)
+        square[:] = background
+        window = square[y0 - top:y1 - top, x0 - left:x1 - left]
+        own = labels[y0:y1, x0:x1] == label
+        window[own] = image[y0:y1, x0:x1][own]
+        crops[i] = np.asarray(Image.fromarray(square).resize(size, reducing_gap=REDUCING_GAP))
+    return crops
+
+
+def grain_boxes(grains, scale):
+    """Grain bounding boxes and areas in the uploaded image's pixel coordinates."""
+    return [
+        {
+            "x": round(cols.start * scale),
+            "y": round(rows.start * scale),
+            "width": round((cols.stop - cols.start) * scale),
+            "height": round((rows.stop - rows.start) * scale),
+            "area": round(area * scale * scale),
+        }
+        for _, (rows, cols), area in grains
+    ]
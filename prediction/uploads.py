@@ -0,0 +1,177 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, UnidentifiedImageError
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+from .preprocessing import decode_upload
+
+MAX_BULK_IMAGES = getattr(settings, "PREDICTION_MAX_BULK_IMAGES", 1000)
+MAX_UPLOAD_BYTES = getattr(settings, "PREDICTION_MAX_UPLOAD_BYTES", 20 * 2**20)
+MAX_ARCHIVE_BYTES = getattr(settings, "PREDICTION_MAX_ARCHIVE_BYTES", 2**30)
+MAX_IMAGE_PIXELS = getattr(settings, "PREDICTION_MAX_IMAGE_PIXELS", 50_000_000)
+IMAGE_FORMATS = set(getattr(settings, "PREDICTION_IMAGE_FORMATS", ["JPEG", "PNG", "WEBP", "BMP", "TIFF"]))
+# File extensions PIL reads as one of those formats (.jpg, .jfif, .png, .tif, ...)
+IMAGE_EXTENSIONS = {ext for ext, fmt in Image.registered_extensions().items() if fmt in IMAGE_FORMATS}
+# Give up on identifying an image whose header is not within this many bytes
+PROBE_BYTES = 512 * 1024
+
+# PIL releases the GIL while decoding, so a few threads decode in parallel
+decode_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, "PREDICTION_DECODE_WORKERS", 4), thread_name_prefix="decode"
+)
+
+
+def is_image_name(name):
+    """Is ``name`` an image by its extension? Names without one are left to the decoder."""
+    extension = os.path.splitext(name)[1].lower()
+    return not extension or extension in IMAGE_EXTENSIONS
+
+
+def collect_images(files, limit=MAX_BULK_IMAGES, max_bytes=MAX_ARCHIVE_BYTES):
+    """Expand uploaded files and zip archives into ``(filename, bytes)`` pairs.
+
+    Uploads and zip members are kept by the same rule, ``is_image_name``.
+    Zip members that fail it (read-mes, notes) are skipped, as are hidden
+    files such as ``__MACOSX/._*``; an upload that fails it was sent on
+    purpose, so it is refused with ValueError rather than silently dropped.
+
+    Zip members are checked against their declared uncompressed size before
+    they are extracted (``zipfile`` stops at that size, so it cannot be
+    understated): none may exceed PREDICTION_MAX_UPLOAD_BYTES, and all
+    images together may not exceed ``max_bytes``.
+    """
+    images = []
+    total = 0
+    for upload in files:
+        data = upload.read()
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if info.is_dir() or os.path.basename(name).startswith('.'):
+                        continue
+                    if not is_image_name(name):
+                        continue
+                    if info.file_size > MAX_UPLOAD_BYTES:
+                        raise ValueError(f"{name} is larger than {MAX_UPLOAD_BYTES / 2**20:.1f} MB uncompressed")
+                    total += info.file_size
+                    if max_bytes and total > max_bytes:
+                        raise ValueError(f"The images are larger than {max_bytes / 2**20:.0f} MB uncompressed")
+                    images.append((name, archive.read(info)))
+                    if limit and len(images) > limit:
+                        raise ValueError(f"At most {limit} images can be sent in one request")
+        else:
+            if not is_image_name(upload.name):
+                raise ValueError(f"{upload.name} is not an image; send {', '.join(sorted(IMAGE_EXTENSIONS))} "
+                                 f"files or a .zip of them")
+            total += len(data)
+            if max_bytes and total > max_bytes:
+                raise ValueError(f"The images are larger than {max_bytes / 2**20:.0f} MB uncompressed")
+            images.append((upload.name, data))
+        if limit and len(images) > limit:
+            raise ValueError(f"At most {limit} images can be sent in one request")
+    return images
+
+
+def _decode(item):
+    name, data = item
+    try:
+        return name, decode_upload(io.BytesIO(data), max_pixels=MAX_IMAGE_PIXELS), None
+    except Exception as e:
+        return name, None, str(e)
+
+
+def decode_images(images):
+    """Decode ``(filename, bytes)`` pairs on the decode pool, preserving order.
+
+    Yields ``(filename, uint8 array or None, error or None)``.
+    """
+    return decode_pool.map(_decode, images)
+
+
+# -----------------------------
+# Single-image uploads
+# -----------------------------
+class UploadRejected(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def probe_image(data):
+    """``(format, (width, height))`` from the leading bytes of an image, or None if more are needed."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return img.format, img.size
+    except (UnidentifiedImageError, OSError, SyntaxError, EOFError):
+        return None
+
+
+def check_image_header(image_format, size):
+    if image_format not in IMAGE_FORMATS:
+        raise UploadRejected(f"Unsupported image format {image_format}; send one of {', '.join(sorted(IMAGE_FORMATS))}",
+                             status=415)
+    width, height = size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected(
+            f"Image is {width}x{height}; at most {MAX_IMAGE_PIXELS / 1e6:.0f} megapixels are accepted", status=413
+        )
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Keeps image uploads in memory and rejects bad ones from their first chunks.
+
+    The format and dimensions are read from the image header as soon as it
+    has arrived, and the byte limit is checked per chunk, so an oversized or
+    non-image upload is dropped without buffering (or spooling to disk) the
+    rest of it. The reason is left on ``request.upload_rejected``.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.buffer = io.BytesIO()
+        self.header = None
+
+    def reject(self, error):
+        self.request.upload_rejected = error
+        raise SkipFile(str(error))
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > MAX_UPLOAD_BYTES:
+            self.reject(UploadRejected(f"Image is larger than {MAX_UPLOAD_BYTES / 2**20:.1f} MB", status=413))
+        self.buffer.write(raw_data)
+        if self.header is None:
+            self.header = probe_image(self.buffer.getbuffer())
+            if self.header is not None:
+                self.check_header()
+            elif self.buffer.tell() > PROBE_BYTES:
+                self.reject(UploadRejected("Not a recognised image", status=415))
+        return None
+
+    def check_header(self):
+        try:
+            check_image_header(*self.header)
+        except UploadRejected as e:
+            self.reject(e)
+
+    def file_complete(self, file_size):
+        # SkipFile is not honoured here; returning None drops the file instead
+        if self.header is None:
+            self.header = probe_image(self.buffer.getbuffer())
+            try:
+                if self.header is None:
+                    raise UploadRejected("Not a recognised image", status=415)
+                check_image_header(*self.header)
+            except UploadRejected as e:
+                self.request.upload_rejected = e
+                return None
+        self.buffer.seek(0)
+        return InMemoryUploadedFile(
+            self.buffer, self.field_name, self.file_name, self.content_type, file_size, self.charset,
+            self.content_type_extra,
+        )
@@ -4,4 +4,12 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('predict/', views.predict, name='predict'),
+    path('predict/batch/', views.predict_batch, name='predict_batch'),
+    path('predict/tray/', views.predict_tray, name='predict_tray'),
+    path('predict/jobs/', views.create_prediction_job, name='create_prediction_job'),
+    path('predict/jobs/<int:job_id>/', views.prediction_job, name='prediction_job'),
+    path('predict/stats/', views.batch_stats, name='batch_stats'),
+    path('predict/models/', views.model_status, name='model_status'),
+    path('metrics', views.metrics, name='metrics'),
+    path('ready', views.ready, name='ready'),
 ]
@@ -1,223 +1,436 @@
-import os, warnings, traceback
+import asyncio, contextvars, io, warnings, traceback, json, zipfile
+from collections import Counter
 import numpy as np
-from PIL import Image
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.applications import VGG16, MobileNetV2
-from tensorflow.keras.layers import GlobalAveragePooling2D, Dropout, Dense, BatchNormalization
-from tensorflow.keras.regularizers import l2
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.vgg16 import preprocess_input as vgg_preprocess
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input as mobilenet_preprocess
-from xgboost import XGBClassifier
-import torch
-from torchvision import transforms
-from transformers import ViTForImageClassification
+from asgiref.sync import sync_to_async
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
+from django.urls import reverse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.cache import never_cache
 from django.conf import settings
-from .models import RiceInfo, RiceModel
+from .models import PredictionJob
+from .inference import (
+    admission, aiter_batch_predictions, batchers, cascade_stats, registry, top_k_varieties, submit_all, combine_all,
+    lot_composition, predict_arrays, warm_up, RUNNERS,
+)
+from .preprocessing import decode_upload
+from .registry import ModelNotAvailable
+from .uploads import collect_images, decode_pool, ImageUploadHandler, MAX_IMAGE_PIXELS
+from .tray import crop_grains, decode_tray, grain_boxes, segment_grains
+from .jobs import enqueue_job
+from .cache import prediction_cache, cache_key, content_hash
+from .memory import process_memory
+from .catalogue import catalogue, model_type_catalogue
+from .metrics import render as render_metrics, span, start_request
 
 # -----------------------------
-# Strategy (GPU/CPU)
+# Prediction View
 # -----------------------------
-def get_strategy():
-    gpus = tf.config.list_physical_devices("GPU")
-    if gpus:
-        strat = tf.distribute.MirroredStrategy()
-        print(f"✅ Using MirroredStrategy on {len(gpus)} GPU(s).")
-        return strat
-    print("✅ Using default strategy (CPU).")
-    return tf.distribute.get_strategy()
-
-strategy = get_strategy()
-print("Replicas:", strategy.num_replicas_in_sync)
+SERVER_TIMING = getattr(settings, "PREDICTION_SERVER_TIMING", False)
 
-# -----------------------------
-# Config
-# -----------------------------
-IMAGE_SIZE = (224, 224)
+def timed_response(request, timings, response, cached=False):
+    """Close the request's timing spans; add Server-Timing if enabled or asked for."""
+    timings.finish("ok" if response.status_code < 400 else "error", cached)
+    if SERVER_TIMING or request.headers.get("X-Server-Timing"):
+        response["Server-Timing"] = timings.server_timing()
+    return response
 
-# Load classes and models from DB
-def load_classes_and_models():
-    rice_classes = list(RiceInfo.objects.values_list('variety_name', flat=True))
-    models = RiceModel.objects.filter(is_active=True)
-    vgg_model = models.filter(name='VGG16 Rice Classifier').first()
-    mobile_model = models.filter(name='MobileNetV2 Rice Classifier').first()
-    xgb_model = models.filter(name='XGBoost Meta Model').first()
-    vit_model = models.filter(name='ViT Rice Classifier').first()
-    return rice_classes, vgg_model, mobile_model, xgb_model, vit_model
+def add_batch_spans(timings, batch_info, suffix=""):
+    timings.add("queue" + suffix, batch_info["queue_wait_ms"])
+    timings.add("forward" + suffix, batch_info["forward_ms"])
 
-RICE_CLASSES, VGG_MODEL, MOBILE_MODEL, XGB_MODEL, VIT_MODEL = load_classes_and_models()
+RETRY_AFTER = getattr(settings, "PREDICTION_RETRY_AFTER", 1)
 
-# -----------------------------
-# Build + Load models
-# -----------------------------
-with strategy.scope():
-    def build_vgg16_feature_extractor():
-        base = VGG16(weights=None, include_top=False, input_shape=(224,224,3))
-        x = GlobalAveragePooling2D()(base.output)
-        model = keras.Model(inputs=base.input, outputs=x)
-        if VGG_MODEL and os.path.exists(VGG_MODEL.model_file.path):
-            model.load_weights(VGG_MODEL.model_file.path)
-            print("✅ Loaded VGG16 weights from:", VGG_MODEL.model_file.path)
-        else:
-            print("[ERROR] VGG16 model file not found")
-        return model
-
-    def build_mobilenetv2_feature_extractor():
-        base = MobileNetV2(weights=None, include_top=False, input_shape=(224,224,3))
-        x = GlobalAveragePooling2D()(base.output)
-        model = keras.Model(inputs=base.input, outputs=x)
-        if MOBILE_MODEL and os.path.exists(MOBILE_MODEL.model_file.path):
-            model.load_weights(MOBILE_MODEL.model_file.path)
-            print("✅ Loaded MobileNetV2 weights from:", MOBILE_MODEL.model_file.path)
-        else:
-            print("[ERROR] MobileNetV2 model file not found")
-        return model
-
-    def build_vgg16_classifier(num_classes, l2_weight=1e-4, dropout_rate=0.3):
-        base_model = VGG16(include_top=False, input_shape=IMAGE_SIZE + (3,), weights="imagenet")
-        x = base_model.output
-        x = GlobalAveragePooling2D(name="gap")(x)
-        x = Dropout(dropout_rate, name="dropout")(x)
-        x = Dense(256, activation="relu", kernel_regularizer=l2(l2_weight), name="dense_256")(x)
-        x = BatchNormalization(name="bn")(x)
-        outputs = Dense(num_classes, activation="softmax", dtype="float32", name="pred")(x)
-        model = keras.Model(inputs=base_model.input, outputs=outputs, name="VGG16_rice62")
-        loss = keras.losses.CategoricalCrossentropy(label_smoothing=0.05)
-        model.compile(optimizer="adam", loss=loss, metrics=["accuracy"])
-        if VGG_MODEL and os.path.exists(VGG_MODEL.model_file.path):
-            model.load_weights(VGG_MODEL.model_file.path)
-            print("✅ Loaded VGG16 classifier weights from:", VGG_MODEL.model_file.path)
-        else:
-            print("[ERROR] VGG16 classifier model file not found")
-        return model
-
-    vgg_feature_extractor = build_vgg16_feature_extractor()
-    mobile_feature_extractor = build_mobilenetv2_feature_extractor()
-    vgg_classifier = build_vgg16_classifier(len(RICE_CLASSES))
-
-    # Load XGBoost model
-    xgb_classifier = None
-    if XGB_MODEL and os.path.exists(XGB_MODEL.model_file.path):
-        xgb_classifier = XGBClassifier()
-        xgb_classifier.load_model(XGB_MODEL.model_file.path)
-        print("✅ Loaded XGBoost model from:", XGB_MODEL.model_file.path)
-    else:
-        print("[ERROR] XGBoost model file not found")
-
-# Load ViT model outside strategy scope since it's PyTorch
-vit_classifier = None
-if VIT_MODEL and os.path.exists(VIT_MODEL.model_file.path):
-    vit_classifier = ViTForImageClassification.from_pretrained(
-        'google/vit-base-patch16-224',
-        num_labels=len(RICE_CLASSES),
-        ignore_mismatched_sizes=True
-    )
-    vit_classifier.load_state_dict(torch.load(VIT_MODEL.model_file.path, map_location='cpu'))
-    vit_classifier.eval()
-    print("✅ Loaded ViT model from:", VIT_MODEL.model_file.path)
-else:
-    print("[ERROR] ViT model file not found")
-
-# ViT transform
-vit_transform = transforms.Compose([
-    transforms.Resize(IMAGE_SIZE),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-])
+def overloaded_response():
+    """503 + Retry-After: more than PREDICTION_MAX_PENDING predictions are in flight."""
+    response = JsonResponse({"error": "Too many predictions in progress, retry shortly"}, status=503)
+    response["Retry-After"] = str(RETRY_AFTER)
+    return response
 
-# -----------------------------
-# Helper Functions
-# -----------------------------
-def extract_features(img_path, model, preprocess_func):
-    img = image.load_img(img_path, target_size=IMAGE_SIZE)
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_func(img_array)
-    feat = model.predict(img_array, verbose=0)
-    return feat.flatten()
+def unavailable_response(error):
+    """503 + Retry-After: the model is still loading, or failed to and will be retried."""
+    response = JsonResponse({"error": str(error)}, status=503)
+    response["Retry-After"] = str(RETRY_AFTER)
+    return response
+
+def parse_upload(request):
+    """Parse the multipart body; returns ``(rice_image or None, model_type)``."""
+    request.upload_handlers = [ImageUploadHandler(request)]
+    return request.FILES.get("rice_image"), request.POST.get("model_type", "vgg16")
+
+def lookup_cached(model_type, data):
+    key = cache_key(model_type, content_hash(data))
+    return key, prediction_cache.get(key)
+
+def store_cached(key, probs, per_model):
+    prediction_cache.set(key, {
+        "probs": np.asarray(probs).tolist(),
+        "models": {mt: p.tolist() for mt, p in per_model.items()},
+    })
+
+def parse_top_k(request, model_type):
+    """The ``top_k`` form field; 3 for model_type=all and 0 (no list) otherwise when absent."""
+    value = request.POST.get("top_k", "")
+    if value == "":
+        return 3 if model_type == "all" else 0
+    top_k = int(value)  # ValueError on non-numeric input
+    if top_k < 0:
+        raise ValueError("top_k must not be negative")
+    return top_k
+
+def prediction_payload(model_type, probs, per_model, batch_info, unavailable, cached, top_k):
+    pred_index = int(np.argmax(probs))
+    confidence = float(np.max(probs) * 100)
+
+    # Pinned to the model's training label order; no DB query per prediction
+    with span("catalogue"):
+        varieties = model_type_catalogue(model_type)
+    predicted_class = varieties.name(pred_index)
+    rice_info = varieties.info(pred_index)
+
+    with span("postprocess"):
+        response = {
+            "predicted_variety": predicted_class,
+            "confidence": confidence,
+            "rice_info": rice_info,
+            "batch": batch_info,
+            "cached": cached,
+            "message": f"Predicted Rice Variety: {predicted_class} ({confidence:.2f}% confidence)"
+        }
+        if top_k > 0:
+            response["top_k"] = top_k_varieties(probs, top_k, varieties, per_model)
+        if per_model:
+            response["models"] = {mt: top_k_varieties(p, 1, varieties)[0] for mt, p in per_model.items()}
+        if unavailable:
+            response["unavailable_models"] = unavailable
+    return response
+
+def prepare_input(data):
+    """Decode once; every model preprocesses this uint8 array with the rest of its batch."""
+    return decode_upload(io.BytesIO(data), max_pixels=MAX_IMAGE_PIXELS)
 
-# -----------------------------
-# Prediction View
-# -----------------------------
 @csrf_exempt
 @never_cache
-def predict(request):
+async def predict(request):
+    """Async so that slow uploads and queued inference hold no worker thread.
+
+    Under ASGI the body has been received before this runs (oversized ones
+    are refused earlier, by ``RequestSizeLimit``); parsing runs in a thread,
+    decoding on the decode pool, the forward pass on the model's
+    micro-batcher, and the view only awaits their futures. Requests beyond
+    PREDICTION_MAX_PENDING, or for a model that is not loaded, are refused
+    with 503 and Retry-After.
+    """
     warnings.filterwarnings("ignore", category=UserWarning)
 
     if request.method == "POST":
+        # Checks format, size and dimensions as the upload is parsed; kept in memory.
+        # Parsing reads the spooled body, so it runs off the event loop.
+        image_file, model_type = await sync_to_async(parse_upload, thread_sensitive=False)(request)
+        rejected = getattr(request, "upload_rejected", None)
+        if rejected is not None:
+            return JsonResponse({"error": str(rejected)}, status=rejected.status)
+        if not image_file:
+            return JsonResponse({"error": "No image provided"}, status=400)
+
+        if model_type not in RUNNERS:
+            model_type = "vgg16"
         try:
-            image_file = request.FILES.get("rice_image")
-            model_type = request.POST.get("model_type", "vgg16")  # Default to vgg16
-            if not image_file:
-                return JsonResponse({"error": "No image provided"}, status=400)
-
-            # Preprocess
-            image = Image.open(image_file).convert("RGB")
-
-            # Save the uploaded image to fixed location
-            path = os.path.join(settings.MEDIA_ROOT, 'predictions', 'current.jpg')
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            image.save(path)
-
-            if model_type == "ensemble":
-                # Ensemble prediction
-                feat_vgg = extract_features(path, vgg_feature_extractor, vgg_preprocess)
-                feat_mobile = extract_features(path, mobile_feature_extractor, mobilenet_preprocess)
-                stacked_feat = np.hstack([feat_vgg, feat_mobile]).reshape(1, -1)  # Reshape to (1, num_features)
-                pred_index = xgb_classifier.predict(stacked_feat)[0]
-                confidence = float(xgb_classifier.predict_proba(stacked_feat).max() * 100)
-            elif model_type == "vit":
-                # ViT prediction
-                if vit_classifier is None:
-                    return JsonResponse({"error": "ViT model not loaded"}, status=500)
-                img_tensor = vit_transform(image).unsqueeze(0)
-                with torch.no_grad():
-                    outputs = vit_classifier(img_tensor)
-                    logits = outputs.logits
-                    probs = torch.softmax(logits, dim=1)
-                    pred_index = torch.argmax(probs, dim=1).item()
-                    confidence = float(probs[0][pred_index].item() * 100)
+            top_k = parse_top_k(request, model_type)
+        except ValueError:
+            return JsonResponse({"error": "top_k must be a non-negative integer"}, status=400)
+
+        timings = start_request(model_type)
+        if not admission.try_acquire():
+            timings.finish("overloaded")
+            return overloaded_response()
+        cached = None
+        try:
+            loop = asyncio.get_running_loop()
+            # Re-submitted images are answered from the cache without a forward pass
+            with span("read"):
+                data = image_file.read()
+            with span("cache"):
+                key, cached = await sync_to_async(lookup_cached)(model_type, data)
+            per_model, unavailable = {}, {}
+            if cached is not None:
+                probs, batch_info = np.asarray(cached["probs"]), None
+                per_model = {mt: np.asarray(p) for mt, p in cached.get("models", {}).items()}
             else:
-                # VGG16 prediction
-                image_resized = image.resize(IMAGE_SIZE)
-                image_array = np.expand_dims(np.array(image_resized, dtype=np.float32) / 255.0, axis=0)
-                preds = vgg_classifier.predict(image_array, verbose=0)
-                pred_index = int(np.argmax(preds[0]))
-                confidence = float(np.max(preds[0]) * 100)
-
-            predicted_class = RICE_CLASSES[pred_index]
-            rice_info_obj = RiceInfo.objects.filter(variety_name=predicted_class).first()
-            rice_info = rice_info_obj.info if rice_info_obj else "No info available."
-
-            # Close the image
-            image.close()
-
-            # Delete the uploaded image file if it's a temporary file
-            if hasattr(image_file, 'temporary_file_path'):
-                try:
-                    os.remove(image_file.temporary_file_path())
-                except OSError:
-                    pass  # Ignore if deletion fails
-
-            return JsonResponse({
-                "predicted_variety": predicted_class,
-                "confidence": confidence,
-                "rice_info": rice_info,
-                "message": f"Predicted Rice Variety: {predicted_class} ({confidence:.2f}% confidence)"
-            })
+                with span("decode"):
+                    image_array = await loop.run_in_executor(decode_pool, prepare_input, data)
+
+                if model_type == "all":
+                    # VGG16, ViT and the ensemble run concurrently; their probabilities are fused
+                    futures = submit_all(image_array)
+                    await asyncio.wait([asyncio.wrap_future(f) for f in futures.values()])
+                    probs, per_model, batch_info, unavailable = await sync_to_async(combine_all)(futures)
+                    for mt, info in batch_info.items():
+                        add_batch_spans(timings, info, f"_{mt}")
+                else:
+                    probs, batch_info = await asyncio.wrap_future(batchers[model_type].submit(image_array))
+                    add_batch_spans(timings, batch_info)
+                if not unavailable:
+                    with span("cache_store"):
+                        await sync_to_async(store_cached)(key, probs, per_model)
+            response = await sync_to_async(prediction_payload)(
+                model_type, probs, per_model, batch_info, unavailable, cached is not None, top_k
+            )
+            return timed_response(request, timings, JsonResponse(response), cached is not None)
 
+        except ModelNotAvailable as e:
+            return timed_response(request, timings, unavailable_response(e))
         except Exception as e:
             traceback.print_exc()
-            return JsonResponse({"error": str(e)}, status=500)
+            return timed_response(request, timings, JsonResponse({"error": str(e)}, status=500))
+        finally:
+            admission.release()
 
     return render(request, "prediction/predict.html")
 
-def home(request):
-    return render(request, "prediction/home.html")
+# -----------------------------
+# Batch Prediction View
+# -----------------------------
+async def stream_batch_predictions(model_type, images):
+    """NDJSON: one line per image, then a summary line with the variety histogram."""
+    try:
+        async for result in aiter_batch_predictions(model_type, images):
+            yield json.dumps(result) + "\n"
+    except Exception as e:
+        traceback.print_exc()
+        yield json.dumps({"error": str(e)}) + "\n"
+
+class AdmittedStream:
+    """Streams ``lines`` and gives the admission slot back exactly once.
+
+    That is when the lines end or fail, including when the client goes
+    away (the ASGI handler then cancels the stream without closing the
+    response), or when Django closes the response before iterating it.
+    """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.released = False
+
+    async def __aiter__(self):
+        try:
+            async for line in self.lines:
+                yield line
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            admission.release()
+
+def read_batch_upload(request):
+    """Parse the multipart body; returns ``(model_type, rice_images)``."""
+    return request.POST.get("model_type", "vgg16"), request.FILES.getlist("rice_images")
+
+@csrf_exempt
+@never_cache
+async def predict_batch(request):
+    """Stream an NDJSON result per image as the lot is classified.
+
+    Async like predict/: parsing and zip extraction run in threads and the
+    forward passes on the micro-batchers, so a long lot neither buffers its
+    response nor holds the thread the sync views (/ready, /metrics, ...)
+    run on.
+    """
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    if request.method != "POST":
+        return JsonResponse({"error": "POST one or more rice_images (images or .zip archives)"}, status=405)
 
+    model_type, files = await sync_to_async(read_batch_upload, thread_sensitive=False)(request)
+    if model_type not in RUNNERS:
+        return JsonResponse({"error": f"Unknown model_type: {model_type}"}, status=400)
+    try:
+        images = await sync_to_async(collect_images, thread_sensitive=False)(files)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if not images:
+        return JsonResponse({"error": "No images provided"}, status=400)
 
+    # Counts against the same PREDICTION_MAX_PENDING as predict/ while it streams
+    if not admission.try_acquire():
+        return overloaded_response()
+    # Results are streamed as each chunk of the lot finishes
+    return StreamingHttpResponse(AdmittedStream(stream_batch_predictions(model_type, images)),
+                                 content_type="application/x-ndjson")
+
+# -----------------------------
+# Tray Prediction View
+# -----------------------------
+def prepare_tray(data):
+    """Decode a tray photo and cut out its grains: ``(crops, boxes, (width, height))``."""
+    with span("decode"):
+        image, scale = decode_tray(io.BytesIO(data), max_pixels=MAX_IMAGE_PIXELS)
+    with span("segment"):
+        labels, grains = segment_grains(image)
+    with span("crop"):
+        crops = crop_grains(image, labels, grains)
+    height, width = image.shape[:2]
+    return crops, grain_boxes(grains, scale), (round(width * scale), round(height * scale))
+
+def classify_crops(model_type, crops):
+    return np.asarray(list(predict_arrays(model_type, crops, batch_size=len(crops))))
+
+@csrf_exempt
+@never_cache
+async def predict_tray(request):
+    """Classify every grain on one photo of a tray in a single batched forward pass.
+
+    Returns a box, variety and confidence per grain and the lot composition.
+    """
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    if request.method != "POST":
+        return JsonResponse({"error": "POST a rice_image of a tray of grains"}, status=405)
+
+    image_file, model_type = await sync_to_async(parse_upload, thread_sensitive=False)(request)
+    rejected = getattr(request, "upload_rejected", None)
+    if rejected is not None:
+        return JsonResponse({"error": str(rejected)}, status=rejected.status)
+    if not image_file:
+        return JsonResponse({"error": "No image provided"}, status=400)
+    if model_type not in RUNNERS:
+        return JsonResponse({"error": f"Unknown model_type: {model_type}"}, status=400)
+
+    timings = start_request("tray")
+    if not admission.try_acquire():
+        timings.finish("overloaded")
+        return overloaded_response()
+    try:
+        loop = asyncio.get_running_loop()
+        data = image_file.read()
+        try:
+            # Run in this request's context so the decode/segment/crop spans are recorded
+            crops, boxes, image_size = await loop.run_in_executor(
+                decode_pool, contextvars.copy_context().run, prepare_tray, data
+            )
+        except ValueError as e:
+            return timed_response(request, timings, JsonResponse({"error": str(e)}, status=400))
+
+        probs = np.empty((0, 0))
+        if len(crops):
+            with span("forward"):
+                probs = await loop.run_in_executor(None, classify_crops, model_type, crops)
+        with span("catalogue"):
+            varieties = await sync_to_async(model_type_catalogue)(model_type)
+
+        with span("postprocess"):
+            histogram = Counter()
+            results = []
+            for index, (box, row) in enumerate(zip(boxes, probs)):
+                predicted_class = varieties.name(int(np.argmax(row)))
+                histogram[predicted_class] += 1
+                results.append({
+                    "index": index,
+                    "box": box,
+                    "predicted_variety": predicted_class,
+                    "confidence": float(np.max(row) * 100),
+                })
+            response = {
+                "grains": results,
+                "summary": {
+                    "model_type": model_type,
+                    "image_size": {"width": image_size[0], "height": image_size[1]},
+                    "grains": len(results),
+                    "histogram": dict(histogram.most_common()),
+                    "composition": lot_composition(histogram) if results else {},
+                },
+            }
+        return timed_response(request, timings, JsonResponse(response))
+
+    except ModelNotAvailable as e:
+        return timed_response(request, timings, unavailable_response(e))
+    except Exception as e:
+        traceback.print_exc()
+        return timed_response(request, timings, JsonResponse({"error": str(e)}, status=500))
+    finally:
+        admission.release()
+
+# -----------------------------
+# Prediction Jobs
+# -----------------------------
+MAX_JOB_IMAGES = getattr(settings, "PREDICTION_MAX_JOB_IMAGES", 20000)
+
+def job_status_payload(job, include_results=True):
+    payload = {
+        "job_id": job.pk,
+        "status": job.status,
+        "model_type": job.model_type,
+        "total": job.total,
+        "processed": job.processed,
+        "progress": round(job.processed / job.total * 100, 1) if job.total else 0.0,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+    if job.error:
+        payload["error"] = job.error
+    if include_results:
+        payload["results"] = job.results
+        payload["summary"] = job.summary
+    return payload
+
+@csrf_exempt
+@never_cache
+def create_prediction_job(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "POST one or more rice_images (images or .zip archives)"}, status=405)
+
+    model_type = request.POST.get("model_type", "vgg16")
+    if model_type not in RUNNERS:
+        return JsonResponse({"error": f"Unknown model_type: {model_type}"}, status=400)
+    try:
+        images = collect_images(request.FILES.getlist("rice_images"), limit=MAX_JOB_IMAGES)
+    except (ValueError, zipfile.BadZipFile) as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if not images:
+        return JsonResponse({"error": "No images provided"}, status=400)
+
+    job = enqueue_job(model_type, images)
+    payload = job_status_payload(job, include_results=False)
+    payload["status_url"] = request.build_absolute_uri(reverse("prediction_job", args=[job.pk]))
+    return JsonResponse(payload, status=202)
+
+@never_cache
+def prediction_job(request, job_id):
+    job = PredictionJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"error": "Job not found"}, status=404)
+    return JsonResponse(job_status_payload(job))
+
+@never_cache
+def batch_stats(request):
+    stats = {name: batcher.stats.as_dict() for name, batcher in batchers.items()}
+    stats["cascade"]["escalation"] = cascade_stats.as_dict()
+    return JsonResponse(stats)
+
+@never_cache
+def model_status(request):
+    status = registry.status()
+    status["prediction_cache"] = prediction_cache.stats()
+    status["catalogue"] = {"varieties": len(catalogue()), "version": catalogue().version}
+    status["process_memory"] = process_memory()
+    return JsonResponse(status)
+
+@never_cache
+def metrics(request):
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@never_cache
+def ready(request):
+    """200 once this worker's models are loaded and warmed up, 503 until then.
+
+    Starts the warm-up if the server did not (e.g. under runserver).
+    """
+    warm_up.start()
+    status = warm_up.status()
+    return JsonResponse(status, status=200 if status["ready"] else 503)
+
+def home(request):
+    return render(request, "prediction/home.html")
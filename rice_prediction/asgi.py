@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rice_prediction.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402  (configured by get_asgi_application)
+
+from .middleware import RequestSizeLimit  # noqa: E402
+
+# Outermost, so oversized uploads are refused before Django buffers their body
+application = RequestSizeLimit(django_application, {
+    '/predict/': settings.PREDICTION_MAX_REQUEST_BYTES,
+    '/predict/batch/': settings.PREDICTION_MAX_BULK_REQUEST_BYTES,
+    '/predict/jobs/': settings.PREDICTION_MAX_BULK_REQUEST_BYTES,
+})
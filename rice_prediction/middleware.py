@@ -0,0 +1,112 @@
+import json
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise that can sit in an async middleware chain.
+
+    The stock middleware is sync-only, which makes Django run every request
+    under ASGI (async views included) through its single sync thread. The
+    static-file lookup is a dict access, so it is done inline here.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response=None, settings=None):
+        if settings is None:
+            super().__init__(get_response)
+        else:
+            super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
+
+
+class RequestSizeLimit:
+    """ASGI wrapper refusing oversized prediction uploads before their body is read.
+
+    Django's ASGI handler receives the whole request body (spooling it to a
+    temporary file) before any Django middleware or view runs, so limits
+    checked there come too late to save the bandwidth and the disk. This
+    answers 413 from the ``Content-Length`` header instead, and cuts off
+    bodies without one once they pass the limit. ``limits`` maps path
+    prefixes to byte limits; the longest matching prefix wins and other
+    paths are passed through untouched.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def limit_for(self, path):
+        return next((limit for prefix, limit in self.limits if path.startswith(prefix)), None)
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limit_for(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                too_large = int(content_length) > limit
+            except ValueError:
+                return await self.reject(send, 400, "Invalid Content-Length")
+            if too_large:
+                return await self.reject(send, 413, f"Request is larger than {limit / 2**20:.1f} MB")
+            return await self.app(scope, receive, send)
+
+        # Chunked upload: count the body as it arrives and disconnect the app when it is too long
+        received = 0
+        exceeded = False
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            if exceeded:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracked_send(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, tracked_send)
+        if exceeded and not started:
+            await self.reject(send, 413, f"Request is larger than {limit / 2**20:.1f} MB")
+
+    @staticmethod
+    async def reject(send, status, error):
+        body = json.dumps({"error": error}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -27,6 +27,7 @@ DEBUG = True
 
 # Application definition
 
+import json
 import os
 from pathlib import Path
 
@@ -54,7 +55,7 @@ INSTALLED_APPS = [
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # add this line
+    'rice_prediction.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise, usable under ASGI
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -152,6 +153,8 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 SECURE_SSL_REDIRECT = not DEBUG
+# Load balancer health checks probe /ready over plain HTTP; a redirect would count as healthy
+SECURE_REDIRECT_EXEMPT = [r"^ready$"]
 
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = True
@@ -159,3 +162,105 @@ CORS_ALLOW_CREDENTIALS = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# Prediction
+# Requests arriving within the window share one batched forward pass per model.
+PREDICTION_BATCH_WINDOW_MS = float(os.environ.get("PREDICTION_BATCH_WINDOW_MS", 10))
+PREDICTION_MAX_BATCH_SIZE = int(os.environ.get("PREDICTION_MAX_BATCH_SIZE", 16))
+# Models load on first use; past this many MB of weights the least recently used is evicted.
+# The budget is per worker. Each of the WEB_CONCURRENCY gunicorn workers (default 2) builds
+# its own VGG16 and MobileNetV2, because TensorFlow cannot be preloaded before the fork, so
+# their memory is multiplied by the worker count. Only PREDICTION_PRELOAD_MODELS are shared.
+PREDICTION_MODEL_MEMORY_BUDGET_MB = int(os.environ.get("PREDICTION_MODEL_MEMORY_BUDGET_MB", 0)) or None
+# Serve RiceModel.tflite_file through pooled TFLite interpreters when it is set.
+PREDICTION_USE_TFLITE = os.environ.get("PREDICTION_USE_TFLITE", "True") == "True"
+PREDICTION_TFLITE_POOL_SIZE = int(os.environ.get("PREDICTION_TFLITE_POOL_SIZE", 2))
+PREDICTION_USE_TORCHSCRIPT = os.environ.get("PREDICTION_USE_TORCHSCRIPT", "True") == "True"
+# Threads per worker shared by TensorFlow, PyTorch, XGBoost, TFLite and BLAS
+# (empty: CPUs / WEB_CONCURRENCY, whose default of 2 gunicorn.conf.py shares). They are
+# split between the PREDICTION_CONCURRENT_RUNTIMES pools that can run at once (TensorFlow
+# or TFLite, and PyTorch); set it to 1 when a worker only serves one of them.
+# A per-runtime value of 0 falls back to the split.
+PREDICTION_THREADS = int(os.environ.get("PREDICTION_THREADS", 0)) or None
+PREDICTION_CONCURRENT_RUNTIMES = int(os.environ.get("PREDICTION_CONCURRENT_RUNTIMES", 2))
+PREDICTION_RUNTIME_THREADS = {
+    "tf_intra": int(os.environ.get("PREDICTION_TF_INTRA_OP_THREADS", 0)),
+    "tf_inter": int(os.environ.get("PREDICTION_TF_INTER_OP_THREADS", 0)),
+    "torch": int(os.environ.get("PREDICTION_TORCH_THREADS", 0)),
+    "xgboost": int(os.environ.get("PREDICTION_XGB_NTHREAD", 0)),
+    "tflite": int(os.environ.get("PREDICTION_TFLITE_THREADS", 0)),
+    "blas": int(os.environ.get("PREDICTION_BLAS_THREADS", 0)),
+}
+# Probe for GPUs (and use MirroredStrategy on several) when building Keras models.
+PREDICTION_TF_GPU = os.environ.get("PREDICTION_TF_GPU", "False") == "True"
+# predict/: requests in flight per worker before new ones get 503 + Retry-After (seconds).
+PREDICTION_MAX_PENDING = int(os.environ.get("PREDICTION_MAX_PENDING", 64))
+PREDICTION_RETRY_AFTER = int(os.environ.get("PREDICTION_RETRY_AFTER", 1))
+# predict/: uploads are checked from their header as they arrive and kept in memory.
+PREDICTION_MAX_UPLOAD_BYTES = int(os.environ.get("PREDICTION_MAX_UPLOAD_BYTES", 20 * 2**20))
+# Whole request bodies, refused with 413 from Content-Length before they are read (asgi.py):
+# predict/ and predict/tray/ carry one image, predict/batch/ and predict/jobs/ images or zips.
+PREDICTION_MAX_REQUEST_BYTES = int(os.environ.get("PREDICTION_MAX_REQUEST_BYTES", PREDICTION_MAX_UPLOAD_BYTES + 2**20))
+PREDICTION_MAX_BULK_REQUEST_BYTES = int(os.environ.get("PREDICTION_MAX_BULK_REQUEST_BYTES", 2**30))
+PREDICTION_MAX_IMAGE_PIXELS = int(os.environ.get("PREDICTION_MAX_IMAGE_PIXELS", 50_000_000))
+PREDICTION_IMAGE_FORMATS = os.environ.get("PREDICTION_IMAGE_FORMATS", "JPEG,PNG,WEBP,BMP,TIFF").split(",")
+# predict/tray/: photos are segmented at this longest side; more grains than this are refused
+PREDICTION_TRAY_MAX_SIDE = int(os.environ.get("PREDICTION_TRAY_MAX_SIDE", 2048))
+PREDICTION_TRAY_MAX_GRAINS = int(os.environ.get("PREDICTION_TRAY_MAX_GRAINS", 200))
+# predict/batch/: images decoded and queued on the micro-batchers at a time (per forward pass for
+# prediction jobs), decode threads and images per request.
+PREDICTION_BULK_BATCH_SIZE = int(os.environ.get("PREDICTION_BULK_BATCH_SIZE", 32))
+PREDICTION_DECODE_WORKERS = int(os.environ.get("PREDICTION_DECODE_WORKERS", 4))
+PREDICTION_MAX_BULK_IMAGES = int(os.environ.get("PREDICTION_MAX_BULK_IMAGES", 1000))
+# predict/batch/ and predict/jobs/: total uncompressed bytes of the images in one request
+# (zip members count at their declared size; no single member may exceed PREDICTION_MAX_UPLOAD_BYTES).
+PREDICTION_MAX_ARCHIVE_BYTES = int(os.environ.get("PREDICTION_MAX_ARCHIVE_BYTES", 2**30))
+# predict/jobs/: images per queued job; run `manage.py run_prediction_workers` to process them.
+PREDICTION_MAX_JOB_IMAGES = int(os.environ.get("PREDICTION_MAX_JOB_IMAGES", 20000))
+# Prediction results cached by (image SHA-256, model_type, model version).
+# Set PREDICTION_CACHE_SHARED_ALIAS=predictions to share results between workers.
+PREDICTION_CACHE_MAX_ENTRIES = int(os.environ.get("PREDICTION_CACHE_MAX_ENTRIES", 4096))
+PREDICTION_CACHE_TTL = int(os.environ.get("PREDICTION_CACHE_TTL", 24 * 3600))
+PREDICTION_CACHE_SHARED_ALIAS = os.environ.get("PREDICTION_CACHE_SHARED_ALIAS") or None
+PREDICTION_MODEL_VERSION_TTL = int(os.environ.get("PREDICTION_MODEL_VERSION_TTL", 5))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'predictions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'media' / 'cache' / 'predictions',
+        'TIMEOUT': PREDICTION_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+}
+# Ensemble backbone features (float16, memory-mapped) are kept here; empty disables the store.
+PREDICTION_FEATURE_STORE_DIR = os.environ.get("PREDICTION_FEATURE_STORE_DIR", str(BASE_DIR / 'media' / 'features')) or None
+# Rows per backbone before the store starts over (about 2.5 KB each for MobileNetV2).
+PREDICTION_FEATURE_STORE_MAX_ROWS = int(os.environ.get("PREDICTION_FEATURE_STORE_MAX_ROWS", 200000))
+# model_type=all: per-model vote weights and temperature calibration, as JSON objects.
+PREDICTION_FUSION_WEIGHTS = json.loads(os.environ.get("PREDICTION_FUSION_WEIGHTS", '{"vgg16": 1.0, "vit": 1.0, "ensemble": 1.0}'))
+PREDICTION_FUSION_TEMPERATURES = json.loads(os.environ.get("PREDICTION_FUSION_TEMPERATURES", '{}'))
+# model_type=cascade: model_type that answers when the MobileNetV2 head is below its threshold.
+PREDICTION_CASCADE_FALLBACK = os.environ.get("PREDICTION_CASCADE_FALLBACK", "ensemble")
+# Serve the ViT int8-quantized (Linear layers) and traced; run check_vit_parity before enabling.
+PREDICTION_VIT_OPTIMIZED = os.environ.get("PREDICTION_VIT_OPTIMIZED", "False") == "True"
+# Local architecture config for the ViT classifier (no hub download at startup).
+PREDICTION_VIT_CONFIG = os.environ.get("PREDICTION_VIT_CONFIG", str(BASE_DIR / 'prediction' / 'model_configs' / 'vit-base-patch16-224.json'))
+# Send per-stage timings of predict/ as a Server-Timing header on every response
+# (otherwise only when the request carries an X-Server-Timing header).
+PREDICTION_SERVER_TIMING = os.environ.get("PREDICTION_SERVER_TIMING", "False") == "True"
+# Keras models run as pre-traced graphs, one per batch-size bucket (batches are padded up
+# to the next bucket); empty = plain Keras predict(). PREDICTION_XLA also XLA-compiles them.
+PREDICTION_GRAPH_BUCKETS = [int(b) for b in os.environ.get("PREDICTION_GRAPH_BUCKETS", "1,2,4,8,16,32").split(",") if b]
+PREDICTION_XLA = os.environ.get("PREDICTION_XLA", "False") == "True"
+# Seconds between checks for RiceModel changes saved by other processes (0: signals only);
+# changed models are reloaded in the background and swapped in without a restart.
+PREDICTION_MODEL_POLL_SECONDS = float(os.environ.get("PREDICTION_MODEL_POLL_SECONDS", 30))
+# Loaded and warmed by every worker after it starts; /ready is 503 until they are.
+PREDICTION_WARM_UP_MODELS = [m for m in os.environ.get("PREDICTION_WARM_UP_MODELS", "vgg16,mobilenetv2,vit").split(",") if m]
+# Loaded in the gunicorn master (gunicorn.conf.py) so forked workers share the weights.
+# Keep to fork-safe runtimes: "vit" (PyTorch) and "xgboost".
+PREDICTION_PRELOAD_MODELS = [m for m in os.environ.get("PREDICTION_PRELOAD_MODELS", "vit,xgboost").split(",") if m]
+GUNICORN_PIDFILE = os.environ.get("GUNICORN_PIDFILE", "/tmp/rice-prediction-gunicorn.pid")